@@ -9,15 +9,41 @@ Version: 2.0
 """
 
 import os
+import re
+import sys
+import csv
+import gzip
+import json
+import mmap
+import heapq
+import bisect
+import tempfile
+import math
+import time
+import struct
+import zlib
 import logging
 import hashlib
+import pickle
+import random
+import shutil
+import sqlite3
+import threading
+import uuid
+from array import array
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
 from datetime import datetime, timedelta
 from functools import wraps
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 
+import click
 import requests
+from requests.adapters import HTTPAdapter
 from flask import Flask, request, jsonify, render_template, abort
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -28,6 +54,21 @@ from dotenv import load_dotenv
 import redis
 from redis.exceptions import RedisError
 
+try:
+    import zstandard
+except ImportError:  # Optional: cache entries fall back to zlib compression
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:  # Optional: responses fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import numpy
+except ImportError:  # Optional: distances fall back to a pure Python loop
+    numpy = None
+
 # Load environment variables
 load_dotenv()
 
@@ -72,9 +113,100 @@ class Config:
     # API Timeouts
     API_TIMEOUT = 10
     
+    # Provider Fan-out
+    PROVIDER_WORKERS = 8  # Threads shared by all concurrent provider lookups
+    REQUEST_DEADLINE = 8  # Default time budget per API request in seconds
+    MAX_REQUEST_DEADLINE = 30  # Upper bound for the ?deadline= parameter
+    
     # Coordinate Validation
     MAX_SEARCH_RADIUS = 0.1  # Maximum search radius in degrees (~11km)
     
+    # Provider Cache (stale-while-revalidate)
+    CACHE_HARD_TTL = 3600  # Seconds before a stale tile is dropped and refetched synchronously
+    CACHE_REFRESH_WORKERS = 2  # Threads refreshing stale tiles in the background
+    L1_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Per-worker in-memory tier in front of Redis
+    L1_CACHE_TTL = 60  # Upper bound on L1 lifetime in case an invalidation is missed
+    CACHE_INVALIDATION_CHANNEL = 'provider-cache:invalidate'
+    PROVIDER_CACHE_SERIALIZER = 'columnar'  # 'columnar' or 'pickle'
+    CACHE_COMPRESSION = 'zstd' if zstandard else 'zlib'  # 'zstd', 'zlib' or 'none'
+    CACHE_COMPRESS_MIN_BYTES = 512  # Smaller entries are stored uncompressed
+    
+    # Single-flight Coalescing
+    SINGLE_FLIGHT_LOCK_TTL = 15  # Seconds before a crashed leader's Redis lock expires
+    SINGLE_FLIGHT_RESULT_TTL = 10  # Seconds a leader's published result stays readable
+    SINGLE_FLIGHT_POLL_INTERVAL = 0.05  # Initial wait between result polls (doubles up to 0.2s)
+    
+    # Geo Tiling
+    TILE_ZOOM = 13  # Slippy-map zoom of provider cache tiles (~0.044 degrees wide)
+    TILE_WORKERS = 8  # Threads used to fetch the tiles of one query
+    
+    # WiGLE Pagination
+    WIGLE_RESULTS_PER_PAGE = 100
+    WIGLE_MAX_PAGES = 10  # Pages followed per search (searchAfter cursor)
+    WIGLE_MAX_RESULTS = 1000  # Results kept per search
+    
+    # Provider HTTP Transport
+    HTTP_POOL_MAXSIZE = PROVIDER_WORKERS + TILE_WORKERS  # Connections kept per upstream host
+    HTTP_MAX_RETRIES = 2  # Extra attempts for idempotent calls only
+    HTTP_RETRY_BACKOFF = 0.2  # Base of the jittered exponential backoff in seconds
+    HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+    HTTP_HEDGE_AFTER = None  # Seconds before a hedged duplicate is sent (None disables hedging)
+    HTTP_ATTEMPT_LOG_SIZE = 256  # Recent attempts kept per client for /api/health
+    
+    # Provider Circuit Breakers
+    CIRCUIT_WINDOW = 30  # Seconds of calls evaluated for tripping
+    CIRCUIT_MIN_CALLS = 5  # Calls needed in a window before it can trip
+    CIRCUIT_ERROR_RATE = 0.5  # Share of failed calls that opens the circuit
+    CIRCUIT_SLOW_CALL = 5.0  # Seconds after which a call counts as slow
+    CIRCUIT_SLOW_RATE = 0.5  # Share of slow calls that opens the circuit
+    CIRCUIT_OPEN_SECONDS = 30  # Time to fail fast before a probe is allowed
+    
+    # Batch Lookups
+    BATCH_MAX_POINTS = 100  # Points accepted by one /api/nearby/batch request
+    BATCH_MAX_TILES = 400  # Provider tiles (per layer) one batch may cover
+    
+    # Corridor Search
+    CORRIDOR_MAX_POINTS = 1000  # Vertices accepted per route
+    CORRIDOR_MAX_BUFFER = 2000  # Largest buffer around the route in metres
+    CORRIDOR_MAX_TILES = 400  # Provider tiles one corridor may cover
+    
+    # Vector Tiles
+    VECTOR_TILE_MIN_ZOOM = 12  # Lower zooms would fan out to too many provider tiles
+    VECTOR_TILE_MAX_ZOOM = 20
+    VECTOR_TILE_EXTENT = 4096  # Integer coordinate range of an encoded tile
+    VECTOR_TILE_TTL = 300  # Seconds an encoded tile is kept in Redis and by HTTP caches
+    
+    # Point Clustering
+    CLUSTER_RADIUS = 40  # Cluster radius in pixels of a 256px tile
+    CLUSTER_MAX_ZOOM = 18  # Points are no longer clustered above this zoom
+    CLUSTER_CACHE_MAX_BYTES = 128 * 1024 * 1024  # Per-worker cap on the estimated memory of cached cluster indexes
+    CLUSTER_CACHE_TTL = 60  # Seconds a cluster index is reused, like the spatial index
+    
+    # Area Statistics
+    STATS_VENDOR_SKETCH_SIZE = 64  # Vendor counters kept per summary (top-10 stays accurate)
+    STATS_PERCENTILES = (10, 25, 50, 75, 90)
+    
+    # Offline Cell Tower Store
+    CELL_STORE_PATH = os.environ.get('CELL_STORE_PATH', 'data/cell_towers.bin')  # Built by `flask ingest-cells`
+    CELL_STORE_ZOOM = TILE_ZOOM  # Tile of each tower, used as the sort key
+    CELL_STORE_COVERAGE_ZOOM = 8  # Tiles of this zoom holding any tower count as covered by the store
+    CELL_STORE_CHUNK_ROWS = 200000  # Rows sorted in memory per run while ingesting
+    CELL_STORE_RECHECK = 30  # Seconds between checks for a rebuilt store file
+    
+    # Local Device Store
+    DEVICE_STORE_PATH = os.environ.get('DEVICE_STORE_PATH', 'data/devices.sqlite3')  # Built by `flask import-wigle`
+    DEVICE_STORE_ZOOM = TILE_ZOOM  # Tile of each device, used as the spatial key
+    DEVICE_STORE_CHUNK_ROWS = 50000  # CSV rows classified and written per transaction
+    
+    # Cache Warming (flask warm-cache)
+    WARM_CACHE_WORKERS = 4  # Tiles fetched at once
+    WARM_CACHE_RATES = {'wigle': 1.0, 'opencellid': 2.0, 'shodan': 1.0}  # Upstream HTTP attempts per second
+    WARM_CACHE_STATE = 'data/warm-cache.state'  # Finished tiles, skipped by --resume within CACHE_HARD_TTL
+    
+    # In-process Spatial Index
+    SPATIAL_INDEX_TTL = 60  # Seconds a tile stays fresh in the per-worker index
+    SPATIAL_INDEX_MAX_DEVICES = 250000  # Memory cap, least recently used tiles are evicted
+    
     @classmethod
     def validate(cls):
         """Validate critical configuration"""
@@ -94,6 +226,11 @@ Config.validate()
 
 # Initialize extensions
 cache = Cache(app)
+redis_client = redis.Redis.from_url(
+    Config.REDIS_URL,
+    socket_connect_timeout=1,
+    socket_timeout=2
+)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 # Rate Limiter
@@ -133,11 +270,250 @@ class Device:
     signal: Optional[int] = None
     accuracy: Optional[int] = None
     info: Optional[str] = None
+    distance_m: Optional[float] = None
     
     def to_dict(self):
         """Convert to dictionary, excluding None values"""
         return {k: v for k, v in asdict(self).items() if v is not None}
 
+class DeviceBatch:
+    """
+    Columnar collection of devices produced by the provider clients
+    
+    Coordinates, signal and accuracy live in float64 arrays (NaN for None),
+    the other fields in one list per field with device types and vendors
+    interned. Batches are filtered and serialized column-wise without
+    building a Device per row; iterating still yields Device objects.
+    """
+    
+    FIELDS = ('lat', 'lon', 'device_type', 'timestamp', 'ssid', 'bssid', 'cell_id',
+              'ip', 'vendor', 'signal', 'accuracy', 'info', 'distance_m')  # Device field order
+    NUMERIC_FIELDS = ('lat', 'lon', 'signal', 'accuracy', 'distance_m')
+    COMPUTED_FIELDS = ('distance_m',)  # Set per query, never cached
+    INTEGER_FIELDS = ('signal', 'accuracy')
+    STRING_FIELDS = ('device_type', 'timestamp', 'ssid', 'bssid', 'cell_id', 'ip', 'vendor', 'info')
+    INTERNED_FIELDS = ('device_type', 'vendor')
+    
+    __slots__ = FIELDS
+    
+    def __init__(self):
+        for field in self.NUMERIC_FIELDS:
+            setattr(self, field, array('d'))
+        for field in self.STRING_FIELDS:
+            setattr(self, field, [])
+    
+    @classmethod
+    def from_devices(cls, devices) -> 'DeviceBatch':
+        """Build a batch from Device objects (or return a batch unchanged)"""
+        if isinstance(devices, DeviceBatch):
+            return devices
+        batch = cls()
+        for device in devices:
+            batch.add(**{field: getattr(device, field) for field in cls.FIELDS})
+        return batch
+    
+    @classmethod
+    def concat(cls, parts) -> 'DeviceBatch':
+        """Concatenate batches (or lists of devices) into a new batch"""
+        batch = cls()
+        for part in parts:
+            batch.extend(part)
+        return batch
+    
+    def add(self, lat: float, lon: float, device_type: str, timestamp: str, **fields):
+        """Append one device, taking the same keyword arguments as Device"""
+        self.lat.append(math.nan if lat is None else lat)
+        self.lon.append(math.nan if lon is None else lon)
+        for field in self.INTEGER_FIELDS:
+            value = fields.pop(field, None)
+            getattr(self, field).append(math.nan if value is None else value)
+        self.device_type.append(sys.intern(device_type) if isinstance(device_type, str) else device_type)
+        self.timestamp.append(timestamp)
+        vendor = fields.pop('vendor', None)
+        self.vendor.append(sys.intern(vendor) if isinstance(vendor, str) else vendor)
+        distance_m = fields.pop('distance_m', None)
+        self.distance_m.append(math.nan if distance_m is None else distance_m)
+        for field in ('ssid', 'bssid', 'cell_id', 'ip', 'info'):
+            getattr(self, field).append(fields.pop(field, None))
+        if fields:
+            raise TypeError(f"Unknown device fields: {', '.join(fields)}")
+    
+    def extend(self, other):
+        """Append every device of another batch or iterable of devices"""
+        if not isinstance(other, DeviceBatch):
+            other = DeviceBatch.from_devices(other)
+        for field in self.FIELDS:
+            getattr(self, field).extend(getattr(other, field))
+    
+    def take(self, indices: List[int]) -> 'DeviceBatch':
+        """New batch with the given rows, in order"""
+        batch = DeviceBatch()
+        for field in self.NUMERIC_FIELDS:
+            column = getattr(self, field)
+            setattr(batch, field, array('d', [column[i] for i in indices]))
+        for field in self.STRING_FIELDS:
+            column = getattr(self, field)
+            setattr(batch, field, [column[i] for i in indices])
+        return batch
+    
+    def within(self, bounds: Dict[str, float]) -> 'DeviceBatch':
+        """Devices inside a bounding box (rows without coordinates are dropped)"""
+        lat1, lat2 = bounds['latrange1'], bounds['latrange2']
+        lon1, lon2 = bounds['longrange1'], bounds['longrange2']
+        return self.take([
+            i for i, (lat, lon) in enumerate(zip(self.lat, self.lon))
+            if lat1 <= lat <= lat2 and lon1 <= lon <= lon2
+        ])
+    
+    def column(self, field: str) -> List:
+        """A column as Python values, with None for missing numbers"""
+        values = getattr(self, field)
+        if field not in self.NUMERIC_FIELDS:
+            return values
+        if field in self.INTEGER_FIELDS:
+            return [None if v != v else (int(v) if v.is_integer() else v) for v in values]
+        return [None if v != v else v for v in values]
+    
+    def value(self, field: str, index: int):
+        """One cell as a Python value"""
+        value = getattr(self, field)[index]
+        if field in self.NUMERIC_FIELDS:
+            if value != value:
+                return None
+            if field in self.INTEGER_FIELDS and value.is_integer():
+                return int(value)
+        return value
+    
+    def to_dicts(self, icons: bool = True) -> List[Dict]:
+        """
+        Response dictionaries, excluding None values
+        
+        Args:
+            icons: Add each device type's emoji under 'icon'
+        """
+        columns = [self.column(field) for field in self.FIELDS]
+        rows = [
+            {k: v for k, v in zip(self.FIELDS, row) if v is not None}
+            for row in zip(*columns)
+        ]
+        if icons:
+            for row, device_type in zip(rows, self.device_type):
+                row['icon'] = DeviceClassifier.ICONS.get(device_type, "❓")
+        return rows
+    
+    def __len__(self) -> int:
+        return len(self.lat)
+    
+    def __getitem__(self, index: int) -> Device:
+        return Device(*(self.value(field, index) for field in self.FIELDS))
+    
+    def __iter__(self):
+        columns = [self.column(field) for field in self.FIELDS]
+        for row in zip(*columns):
+            yield Device(*row)
+    
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (DeviceBatch, list)):
+            return list(self) == list(other)
+        return NotImplemented
+    
+    def __repr__(self) -> str:
+        return f"DeviceBatch({len(self)} devices)"
+    
+    def __getstate__(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+    
+    def __setstate__(self, state):
+        for field in self.FIELDS:
+            # Entries pickled before a computed field existed lack its column
+            setattr(self, field, state[field] if field in state else array('d', [math.nan]) * len(state['lat']))
+
+class DeviceDeduplicator:
+    """
+    Merge devices reported more than once, in a single pass
+    
+    Devices are identified by BSSID (case-insensitive), else cell id, else
+    IP; devices with none of them are always kept. A duplicate takes the
+    fields of whichever report has the freshest timestamp and the strongest
+    signal of all reports. Batches can be fed one at a time as they arrive
+    (pages, tiles, providers); the merged result is always in self.batch in
+    order of first appearance.
+    """
+    
+    def __init__(self):
+        self.batch = DeviceBatch()
+        self.duplicates = 0
+        self._rows = {}  # identity -> row in self.batch
+    
+    @classmethod
+    def merge(cls, parts) -> DeviceBatch:
+        """Deduplicate an iterable of batches (or lists of devices)"""
+        deduplicator = cls()
+        for part in parts:
+            deduplicator.feed(part)
+        return deduplicator.batch
+    
+    @staticmethod
+    def _identities(devices: DeviceBatch):
+        for bssid, cell_id, ip in zip(devices.bssid, devices.cell_id, devices.ip):
+            if bssid:
+                yield 'bssid', bssid.upper()
+            elif cell_id:
+                yield 'cell_id', cell_id
+            elif ip:
+                yield 'ip', ip
+            else:
+                yield None
+    
+    @staticmethod
+    def _newer(timestamp, than) -> bool:
+        """Whether a timestamp is fresher than another (missing ones are oldest)"""
+        if timestamp is None:
+            return False
+        if than is None:
+            return True
+        try:
+            return timestamp > than
+        except TypeError:
+            return str(timestamp) > str(than)
+    
+    def feed(self, devices) -> DeviceBatch:
+        """Merge a batch into the result and return the result"""
+        devices = DeviceBatch.from_devices(devices)
+        new_rows = []
+        duplicates = []  # (row in self.batch, row in devices)
+        base = len(self.batch)
+        
+        for i, identity in enumerate(self._identities(devices)):
+            if identity is not None:
+                row = self._rows.get(identity)
+                if row is not None:
+                    duplicates.append((row, i))
+                    continue
+                self._rows[identity] = base + len(new_rows)
+            new_rows.append(i)
+        
+        if len(new_rows) == len(devices):
+            self.batch.extend(devices)
+        else:
+            self.batch.extend(devices.take(new_rows))
+        
+        for row, i in duplicates:
+            self._merge_row(row, devices, i)
+        self.duplicates += len(duplicates)
+        return self.batch
+    
+    def _merge_row(self, row: int, devices: DeviceBatch, i: int):
+        batch = self.batch
+        signal, other = batch.signal[row], devices.signal[i]
+        # NaN stands for a missing signal
+        strongest = other if signal != signal or (other == other and other > signal) else signal
+        
+        if self._newer(devices.timestamp[i], batch.timestamp[row]):
+            for field in DeviceBatch.FIELDS:
+                getattr(batch, field)[row] = getattr(devices, field)[i]
+        batch.signal[row] = strongest
+
 # Classification Patterns
 DEVICE_PATTERNS = {
     DeviceType.CAR: [
@@ -167,9 +543,55 @@ DEVICE_PATTERNS = {
     ]
 }
 
+def _trie_pattern(words: List[str]) -> str:
+    """
+    Build a regex matching any of the given literals, factored as a prefix trie
+    
+    Alternations of plain literals are tried one by one at every position;
+    sharing prefixes lets the regex engine discard most of them after one
+    character, which keeps the scan fast on long Shodan banners.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+    
+    return build(trie)
+
 class DeviceClassifier:
     """Advanced device classification system"""
     
+    # Compiled once at startup: one matcher per device type in precedence
+    # order, plus one over all patterns that rejects most names in a single scan
+    MATCHERS = [
+        (device_type.value, re.compile(_trie_pattern(patterns)))
+        for device_type, patterns in DEVICE_PATTERNS.items()
+    ]
+    ANY_MATCHER = re.compile(_trie_pattern(
+        [pattern for patterns in DEVICE_PATTERNS.values() for pattern in patterns]
+    ))
+    
+    ICONS = {
+        DeviceType.ROUTER.value: "📡",
+        DeviceType.CAR.value: "🚗",
+        DeviceType.TV.value: "📺",
+        DeviceType.HEADPHONE.value: "🎧",
+        DeviceType.DASHCAM.value: "📹",
+        DeviceType.CAMERA.value: "📷",
+        DeviceType.IOT.value: "💡",
+        DeviceType.CELL_TOWER.value: "🗼",
+        DeviceType.BLUETOOTH.value: "📶",
+    }
+    
     @staticmethod
     def classify(name: str, original_type: str = "unknown") -> str:
         """
@@ -178,37 +600,51 @@ class DeviceClassifier:
         Args:
             name: Device name or SSID
             original_type: Fallback type if no match found
-            
+        
         Returns:
             Classified device type as string
         """
         if not name:
             return original_type
-            
+        
         name_upper = name.upper()
+        if not DeviceClassifier.ANY_MATCHER.search(name_upper):
+            return original_type
+        
+        # Check each device type pattern, first match wins
+        for device_type, matcher in DeviceClassifier.MATCHERS:
+            if matcher.search(name_upper):
+                return device_type
         
-        # Check each device type pattern
-        for device_type, patterns in DEVICE_PATTERNS.items():
-            if any(pattern in name_upper for pattern in patterns):
-                return device_type.value
-                
         return original_type
     
+    @staticmethod
+    def classify_many(names: List[Optional[str]], original_type: str = "unknown") -> List[str]:
+        """
+        Classify a page of device names
+        
+        Repeated names (common SSIDs such as ISP hotspots) are classified once.
+        
+        Args:
+            names: Device names or SSIDs
+            original_type: Fallback type if no match found
+        
+        Returns:
+            Classified device types in the same order as names
+        """
+        seen = {}
+        types = []
+        for name in names:
+            device_type = seen.get(name)
+            if device_type is None:
+                device_type = seen[name] = DeviceClassifier.classify(name, original_type)
+            types.append(device_type)
+        return types
+    
     @staticmethod
     def get_icon(device_type: str) -> str:
         """Get emoji icon for device type"""
-        icons = {
-            DeviceType.ROUTER.value: "📡",
-            DeviceType.CAR.value: "🚗",
-            DeviceType.TV.value: "📺",
-            DeviceType.HEADPHONE.value: "🎧",
-            DeviceType.DASHCAM.value: "📹",
-            DeviceType.CAMERA.value: "📷",
-            DeviceType.IOT.value: "💡",
-            DeviceType.CELL_TOWER.value: "🗼",
-            DeviceType.BLUETOOTH.value: "📶",
-        }
-        return icons.get(device_type, "❓")
+        return DeviceClassifier.ICONS.get(device_type, "❓")
 
 class CoordinateValidator:
     """Coordinate validation utilities"""
@@ -243,262 +679,3319 @@ class CoordinateValidator:
         Args:
             lat: Center latitude
             lon: Center longitude
-            radius: Search radius in degrees (default ~1.1km)
+            radius: Search radius in degrees of latitude (default ~1.1km)
             
         Returns:
-            Dictionary with lat/lon ranges
+            Dictionary with lat/lon ranges. The longitude range is widened
+            by 1/cos(lat) so the box encloses the circle of that radius.
         """
         # Limit maximum radius
         radius = min(radius, Config.MAX_SEARCH_RADIUS)
+        lon_radius = min(radius / max(math.cos(math.radians(lat)), 0.01), 180.0)
         
         return {
             'latrange1': lat - radius,
             'latrange2': lat + radius,
-            'longrange1': lon - radius,
-            'longrange2': lon + radius
+            'longrange1': lon - lon_radius,
+            'longrange2': lon + lon_radius
         }
 
-class APIClient:
-    """Base class for API clients with error handling and caching"""
+class TileMath:
+    """Slippy-map (z/x/y) tile utilities"""
     
-    def __init__(self, base_url: str, timeout: int = Config.API_TIMEOUT):
-        self.base_url = base_url
-        self.timeout = timeout
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'NetworkMapper/2.0'
-        })
+    MAX_LATITUDE = 85.05112878  # Web Mercator latitude limit
     
-    def _make_request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict]:
+    @staticmethod
+    def lat_lon_to_tile(lat: float, lon: float, zoom: int) -> Tuple[int, int]:
         """
-        Make HTTP request with error handling
+        Get the tile containing a coordinate
         
-        Args:
-            method: HTTP method (GET, POST, etc.)
-            endpoint: API endpoint
-            **kwargs: Additional arguments for requests
-            
         Returns:
-            Response JSON or None on error
+            Tuple of (x, y) tile indices at the given zoom
         """
-        url = f"{self.base_url}{endpoint}"
-        kwargs.setdefault('timeout', self.timeout)
-        kwargs.setdefault('verify', True)
+        n = 2 ** zoom
+        lat = max(-TileMath.MAX_LATITUDE, min(lat, TileMath.MAX_LATITUDE))
+        lat_rad = math.radians(lat)
+        x = int((lon + 180.0) / 360.0 * n)
+        y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+    
+    @staticmethod
+    def tile_bounds(zoom: int, x: int, y: int) -> Dict[str, float]:
+        """
+        Get the bounding box of a tile
         
-        try:
-            response = self.session.request(method, url, **kwargs)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
-            logger.error(f"Timeout accessing {url}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error accessing {url}: {str(e)}")
-        except ValueError as e:
-            logger.error(f"Invalid JSON response from {url}: {str(e)}")
+        Returns:
+            Dictionary with lat/lon ranges, in the same format as
+            CoordinateValidator.calculate_bounds
+        """
+        n = 2 ** zoom
         
-        return None
+        def tile_lat(ty):
+            return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+        
+        return {
+            'latrange1': tile_lat(y + 1),
+            'latrange2': tile_lat(y),
+            'longrange1': x / n * 360.0 - 180.0,
+            'longrange2': (x + 1) / n * 360.0 - 180.0
+        }
+    
+    @staticmethod
+    def tiles_for_bounds(bounds: Dict[str, float], zoom: int) -> List[Tuple[int, int]]:
+        """Get all tiles at a zoom level that intersect a bounding box"""
+        x1, y1 = TileMath.lat_lon_to_tile(bounds['latrange2'], bounds['longrange1'], zoom)
+        x2, y2 = TileMath.lat_lon_to_tile(bounds['latrange1'], bounds['longrange2'], zoom)
+        return [(x, y) for x in range(x1, x2 + 1) for y in range(y1, y2 + 1)]
+    
+    @staticmethod
+    def clip(devices: DeviceBatch, bounds: Dict[str, float]) -> DeviceBatch:
+        """Keep only the devices located inside a bounding box"""
+        return DeviceBatch.from_devices(devices).within(bounds)
 
-class WigleAPI(APIClient):
-    """WiGLE API client"""
+class GeoDistance:
+    """
+    Great-circle distances from a query point to the devices of a batch
     
-    def __init__(self):
-        super().__init__('https://api.wigle.net/api/v2')
-        if Config.WIGLE_API_NAME and Config.WIGLE_API_TOKEN:
-            self.session.auth = (Config.WIGLE_API_NAME, Config.WIGLE_API_TOKEN)
+    Distances are computed with the haversine formula over the coordinate
+    columns at once, vectorized with NumPy when it is installed.
+    """
     
-    @cache.memoize(timeout=300)
-    def search_networks(self, lat: float, lon: float, radius: float = 0.01) -> List[Device]:
-        """Search for WiFi networks"""
-        bounds = CoordinateValidator.calculate_bounds(lat, lon, radius)
+    EARTH_RADIUS = 6371008.8  # Mean Earth radius in metres
+    METRES_PER_DEGREE = math.radians(1) * EARTH_RADIUS  # Along a meridian
+    
+    @classmethod
+    def haversine(cls, lat: float, lon: float, lats: array, lons: array):
+        """Distances in metres from a point to each coordinate pair (NaN where missing)"""
+        phi = math.radians(lat)
+        if numpy is not None and len(lats):
+            lats = numpy.radians(numpy.frombuffer(lats, dtype=numpy.float64))
+            lons = numpy.radians(numpy.frombuffer(lons, dtype=numpy.float64))
+            a = (numpy.sin((lats - phi) / 2) ** 2 +
+                 math.cos(phi) * numpy.cos(lats) * numpy.sin((lons - math.radians(lon)) / 2) ** 2)
+            return 2 * cls.EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
         
-        data = self._make_request('GET', '/network/search', params=bounds)
+        distances = []
+        for other_lat, other_lon in zip(lats, lons):
+            other_phi = math.radians(other_lat)
+            a = (math.sin((other_phi - phi) / 2) ** 2 +
+                 math.cos(phi) * math.cos(other_phi) * math.sin(math.radians(other_lon - lon) / 2) ** 2)
+            distances.append(2 * cls.EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0))) if a == a else math.nan)
+        return distances
+    
+    @classmethod
+    def measure(cls, devices, lat: float, lon: float, radius_m: Optional[float] = None) -> DeviceBatch:
+        """
+        Copy of a batch with distance_m set, rounded to decimetres
         
-        if not data:
-            return []
-            
-        devices = []
-        for network in data.get('results', []):
-            device_type = DeviceClassifier.classify(
-                network.get('ssid'),
-                DeviceType.ROUTER.value
-            )
-            
-            devices.append(Device(
-                lat=network.get('trilat'),
-                lon=network.get('trilong'),
-                ssid=network.get('ssid'),
-                bssid=network.get('netid'),
-                vendor=network.get('vendor'),
-                signal=network.get('level'),
-                timestamp=network.get('lastupdt'),
-                device_type=device_type
-            ))
-            
-        return devices
+        Args:
+            radius_m: When given, devices further away (or without
+                coordinates) are dropped
+        """
+        devices = DeviceBatch.from_devices(devices)
+        distances = cls.haversine(lat, lon, devices.lat, devices.lon)
+        if numpy is not None and len(devices):
+            rows = numpy.arange(len(devices)) if radius_m is None else numpy.flatnonzero(distances <= radius_m)
+            measured = devices.take(rows.tolist())
+            measured.distance_m = array('d', numpy.round(distances[rows], 1).tobytes())
+            return measured
+        
+        rows = [i for i, distance in enumerate(distances) if radius_m is None or distance <= radius_m]
+        measured = devices.take(rows)
+        measured.distance_m = array('d', (round(distances[i], 1) for i in rows))
+        return measured
     
-    @cache.memoize(timeout=300)
-    def search_bluetooth(self, lat: float, lon: float, radius: float = 0.01) -> List[Device]:
-        """Search for Bluetooth devices"""
-        bounds = CoordinateValidator.calculate_bounds(lat, lon, radius)
+    @staticmethod
+    def nearest(devices: DeviceBatch, limit: Optional[int] = None, sort: bool = False) -> DeviceBatch:
+        """
+        Select the devices closest to the query point by their distance_m
         
-        data = self._make_request('GET', '/bluetooth/search', params=bounds)
+        The limit nearest devices are found by partial selection, so only
+        they are sorted; devices without a distance come last.
         
-        if not data:
-            return []
-            
-        devices = []
-        for device in data.get('results', []):
-            name = device.get('name') or device.get('netid')
-            device_type = DeviceClassifier.classify(name, DeviceType.BLUETOOTH.value)
-            
-            devices.append(Device(
-                lat=device.get('trilat'),
-                lon=device.get('trilong'),
-                ssid=name,
-                bssid=device.get('netid'),
-                vendor=device.get('type') or DeviceType.BLUETOOTH.value.replace('_', ' ').title(),
-                signal=device.get('level'),
-                timestamp=device.get('lastupdt'),
-                device_type=device_type
-            ))
-            
-        return devices
+        Args:
+            limit: Number of devices to keep (all when None)
+            sort: Order the result nearest first (otherwise the original
+                order is kept)
+        """
+        count = len(devices)
+        if (limit is None or limit >= count) and not sort:
+            return devices
+        
+        if numpy is not None and count:
+            distances = numpy.frombuffer(devices.distance_m, dtype=numpy.float64)
+            distances = numpy.where(numpy.isnan(distances), numpy.inf, distances)
+            rows = numpy.arange(count)
+            if limit is not None and limit < count:
+                rows = numpy.argpartition(distances, limit - 1)[:limit]
+            rows = rows[numpy.argsort(distances[rows], kind='stable')] if sort else numpy.sort(rows)
+            return devices.take(rows.tolist())
+        
+        def distance(i):
+            value = devices.distance_m[i]
+            return math.inf if value != value else value
+        
+        if limit is not None and limit < count:
+            rows = heapq.nsmallest(limit, range(count), key=distance)
+        else:
+            rows = sorted(range(count), key=distance)
+        return devices.take(rows if sort else sorted(rows))
+
+class Corridor:
+    """
+    Buffered route polyline
     
-    def search_by_ssid(self, ssid: str) -> List[Device]:
-        """Search networks by SSID"""
-        data = self._make_request('GET', '/network/search', params={'ssid': ssid})
+    Distances are measured in metres in a local equirectangular projection
+    centred on each segment, which is accurate to well under 1% for segments
+    of a few kilometres. Covering tiles are found per segment and only kept
+    when the tile rectangle really comes within the buffer of the segment,
+    so a diagonal route does not pull in the whole bounding box.
+    """
+    
+    EARTH_RADIUS = GeoDistance.EARTH_RADIUS
+    
+    def __init__(self, points: List[Tuple[float, float]], buffer: float):
+        """
+        Args:
+            points: Route vertices as (lat, lon)
+            buffer: Corridor half-width in metres
+        """
+        self.points = points if len(points) > 1 else points * 2
+        self.buffer = buffer
+        self.segments = list(zip(self.points, self.points[1:]))
+    
+    def _projector(self, segment: int) -> Callable[[float, float], Tuple[float, float]]:
+        """Project (lat, lon) to metres around one segment"""
+        (lat1, lon1), (lat2, lon2) = self.segments[segment]
+        scale = math.radians(1) * self.EARTH_RADIUS
+        cos_lat = math.cos(math.radians((lat1 + lat2) / 2))
+        return lambda lat, lon: (lon * scale * cos_lat, lat * scale)
+    
+    @staticmethod
+    def _point_segment(p: Tuple[float, float], a: Tuple[float, float], b: Tuple[float, float]) -> float:
+        """Planar distance from a point to a segment"""
+        dx, dy = b[0] - a[0], b[1] - a[1]
+        length = dx * dx + dy * dy
+        t = 0.0 if length == 0 else max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length))
+        return math.hypot(p[0] - a[0] - t * dx, p[1] - a[1] - t * dy)
+    
+    def _rect_distance(self, segment: int, bounds: Dict[str, float]) -> float:
+        """Distance in metres between a segment and a bounding box (0 if they touch)"""
+        project = self._projector(segment)
+        a, b = (project(*point) for point in self.segments[segment])
+        x1, y1 = project(bounds['latrange1'], bounds['longrange1'])
+        x2, y2 = project(bounds['latrange2'], bounds['longrange2'])
+        corners = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
         
-        if not data:
-            return []
-            
-        devices = []
-        for network in data.get('results', []):
-            device_type = DeviceClassifier.classify(
-                network.get('ssid'),
-                DeviceType.ROUTER.value
-            )
-            
-            devices.append(Device(
-                lat=network.get('trilat'),
-                lon=network.get('trilong'),
-                ssid=network.get('ssid'),
-                bssid=network.get('netid'),
-                vendor=network.get('vendor'),
-                signal=network.get('level'),
-                timestamp=network.get('lastupdt'),
-                device_type=device_type
-            ))
-            
-        return devices
+        def inside(p):
+            return x1 <= p[0] <= x2 and y1 <= p[1] <= y2
+        
+        def crosses(p, q, r, t):
+            def side(u, v, w):
+                return (v[0] - u[0]) * (w[1] - u[1]) - (v[1] - u[1]) * (w[0] - u[0])
+            return side(p, q, r) * side(p, q, t) <= 0 and side(r, t, p) * side(r, t, q) <= 0
+        
+        if inside(a) or inside(b) or any(crosses(a, b, corners[i], corners[i - 1]) for i in range(4)):
+            return 0.0
+        return min(
+            min(self._point_segment(corner, a, b) for corner in corners),
+            min(math.hypot(max(x1 - p[0], 0, p[0] - x2), max(y1 - p[1], 0, p[1] - y2)) for p in (a, b))
+        )
     
-    def search_by_bssid(self, bssid: str) -> List[Device]:
-        """Search networks by BSSID/MAC address"""
-        data = self._make_request('GET', '/network/search', params={'netid': bssid})
+    def tiles(self, zoom: int, max_tiles: Optional[int] = None) -> Dict[Tuple[int, int], List[int]]:
+        """
+        Tiles within the buffer of the route
         
-        if not data:
-            return []
-            
-        devices = []
-        for network in data.get('results', []):
-            device_type = DeviceClassifier.classify(
-                network.get('ssid'),
-                DeviceType.ROUTER.value
-            )
-            
-            devices.append(Device(
-                lat=network.get('trilat'),
-                lon=network.get('trilong'),
-                ssid=network.get('ssid'),
-                bssid=network.get('netid'),
-                vendor=network.get('vendor'),
-                signal=network.get('level'),
-                timestamp=network.get('lastupdt'),
-                device_type=device_type
-            ))
-            
-        return devices
+        Args:
+            max_tiles: Stop as soon as more tiles than this are found, so
+                rejecting an over-long route costs no more than the cap
+        
+        Returns:
+            Mapping of tile (x, y) to the segments passing within the buffer
+            of it (incomplete once it holds more than max_tiles tiles)
+        """
+        # Candidates come from short pieces of each segment so their boxes stay small
+        step = 180.0 / 2 ** zoom
+        lat_pad = math.degrees(self.buffer / self.EARTH_RADIUS)
+        tiles = {}
+        for segment, ((lat1, lon1), (lat2, lon2)) in enumerate(self.segments):
+            pieces = max(1, math.ceil(max(abs(lat2 - lat1), abs(lon2 - lon1)) / step))
+            lon_pad = lat_pad / max(math.cos(math.radians(max(abs(lat1), abs(lat2)))), 0.01)
+            seen = set()
+            for i in range(pieces):
+                a = (lat1 + (lat2 - lat1) * i / pieces, lon1 + (lon2 - lon1) * i / pieces)
+                b = (lat1 + (lat2 - lat1) * (i + 1) / pieces, lon1 + (lon2 - lon1) * (i + 1) / pieces)
+                for x, y in TileMath.tiles_for_bounds({
+                    'latrange1': min(a[0], b[0]) - lat_pad, 'latrange2': max(a[0], b[0]) + lat_pad,
+                    'longrange1': min(a[1], b[1]) - lon_pad, 'longrange2': max(a[1], b[1]) + lon_pad
+                }, zoom):
+                    if (x, y) in seen:
+                        continue
+                    seen.add((x, y))
+                    if self._rect_distance(segment, TileMath.tile_bounds(zoom, x, y)) <= self.buffer:
+                        tiles.setdefault((x, y), []).append(segment)
+                # Every piece reaches new tiles, so this bounds the work by the cap
+                if max_tiles is not None and len(tiles) > max_tiles:
+                    return tiles
+        return tiles
+    
+    def distances(self, devices: DeviceBatch, segments: Optional[List[int]] = None) -> List[float]:
+        """Distance in metres from each device to the nearest of the given segments"""
+        segments = range(len(self.segments)) if segments is None else segments
+        projected = []
+        for segment in segments:
+            project = self._projector(segment)
+            projected.append((project, *(project(*point) for point in self.segments[segment])))
+        
+        return [
+            min(self._point_segment(project(lat, lon), a, b) for project, a, b in projected)
+            if lat == lat and lon == lon else math.inf
+            for lat, lon in zip(devices.lat, devices.lon)
+        ]
+    
+    def filter(self, devices: DeviceBatch, segments: Optional[List[int]] = None) -> DeviceBatch:
+        """Devices within the buffer of the route (or of the given segments), with their distance_m to it"""
+        distances = self.distances(devices, segments)
+        rows = [i for i, distance in enumerate(distances) if distance <= self.buffer]
+        kept = devices.take(rows)
+        kept.distance_m = array('d', (round(distances[i], 1) for i in rows))
+        return kept
 
-class OpenCellIDAPI(APIClient):
-    """OpenCellID API client"""
+class DeadlineExceeded(Exception):
+    """Raised when a provider call has no time budget left"""
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+class ProviderError(Exception):
+    """Raised when a provider request fails (transport error, HTTP error or bad response)"""
+
+# Deadline of the request currently being served (set per provider call)
+current_deadline: ContextVar[Optional['Deadline']] = ContextVar('current_deadline', default=None)
+
+# Whether the current caller refreshes stale cache entries itself instead of
+# in the background (set by the cache warmer so refreshes stay in its budget)
+refresh_inline: ContextVar[bool] = ContextVar('refresh_inline', default=False)
+
+# Cache statistics of the provider call currently being served
+current_call_stats: ContextVar[Optional['CallStats']] = ContextVar('current_call_stats', default=None)
+
+class CallStats:
+    """Cache statistics gathered while serving one provider call"""
     
     def __init__(self):
-        super().__init__('https://us1.unwiredlabs.com/v2')
+        self.max_age = 0.0
+        self.attempts = []
+        self.entries = []  # (key, fetched_at) of the provider cache entries served
+        self._lock = threading.Lock()
+    
+    def observe_age(self, age: float):
+        with self._lock:
+            self.max_age = max(self.max_age, age)
+    
+    def observe_attempt(self, attempt: 'TransportAttempt'):
+        with self._lock:
+            self.attempts.append(attempt)
+    
+    def observe_entry(self, key: str, fetched_at: float):
+        with self._lock:
+            self.entries.append((key, fetched_at))
+    
+    @staticmethod
+    def record_entry(key: str, fetched_at: float):
+        """Report a provider cache entry served to the provider call being served, if any"""
+        stats = current_call_stats.get()
+        if stats is not None:
+            stats.observe_entry(key, fetched_at)
+    
+    @staticmethod
+    def record_age(age: float):
+        """Report the age of cached data to the provider call being served, if any"""
+        stats = current_call_stats.get()
+        if stats is not None:
+            stats.observe_age(age)
+    
+    @staticmethod
+    def record(nested: 'CallStats'):
+        """Report the statistics of a nested call to the provider call being served, if any"""
+        stats = current_call_stats.get()
+        if stats is not None:
+            stats.observe_age(nested.max_age)
+            for attempt in nested.attempts:
+                stats.observe_attempt(attempt)
+            for entry in nested.entries:
+                stats.observe_entry(*entry)
+
+class Deadline:
+    """Whole-request time budget shared by every provider call"""
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+    
+    @classmethod
+    def from_request(cls) -> 'Deadline':
+        """
+        Build a deadline from the ?deadline= query parameter
+        
+        The value is given in seconds and capped by Config.MAX_REQUEST_DEADLINE.
+        """
+        seconds = request.args.get('deadline', Config.REQUEST_DEADLINE, type=float)
+        return cls(max(0.1, min(seconds, Config.MAX_REQUEST_DEADLINE)))
+    
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)"""
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+    
+    @contextmanager
+    def activate(self):
+        """Make this the deadline of the current context (safe to use from several threads)"""
+        token = current_deadline.set(self)
+        try:
+            yield self
+        finally:
+            current_deadline.reset(token)
+
+class _InFlightCall:
+    """A provider call that other threads are waiting on"""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+    
+    def wait(self, timeout: float):
+        if not self.event.wait(timeout):
+            raise DeadlineExceeded("Timed out waiting for a coalesced provider call")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent provider calls into a single upstream fetch
+    
+    Threads of one worker share an in-process call. Across workers and nodes
+    a Redis lock elects one leader, which publishes its result under a short
+    lived key that the other processes poll instead of calling upstream.
+    """
+    
+    def __init__(self, redis_conn: Optional[redis.Redis] = None):
+        self.redis = redis_conn
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+    
+    @staticmethod
+    def _wait_timeout() -> float:
+        """How long a follower may wait for the leader's result"""
+        deadline = current_deadline.get()
+        if deadline is not None:
+            return deadline.remaining()
+        return Config.SINGLE_FLIGHT_LOCK_TTL
+    
+    def do(self, key: str, fn: Callable[[], DeviceBatch]) -> DeviceBatch:
+        """
+        Run fn once for all concurrent callers using the same key
+        
+        Args:
+            key: Provider call and its normalized arguments
+            fn: Zero-argument callable performing the upstream fetch
+        
+        Returns:
+            The leader's result, shared by every caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _InFlightCall()
+        
+        if not is_leader:
+            return call.wait(self._wait_timeout())
+        
+        try:
+            call.result = self._do_distributed(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+    
+    def _do_distributed(self, key: str, fn: Callable[[], DeviceBatch]) -> DeviceBatch:
+        """Elect a leader across processes through a Redis lock"""
+        if self.redis is None:
+            return fn()
+        
+        lock_name = f"singleflight:lock:{key}"
+        result_name = f"singleflight:result:{key}"
+        
+        try:
+            published = self.redis.get(result_name)
+            if published is not None:
+                return pickle.loads(published)
+            
+            lock = self.redis.lock(lock_name, timeout=Config.SINGLE_FLIGHT_LOCK_TTL)
+            acquired = lock.acquire(blocking=False)
+        except RedisError as e:
+            logger.warning(f"Single-flight unavailable, calling upstream directly: {str(e)}")
+            return fn()
+        
+        if not acquired:
+            return self._await_result(lock_name, result_name, fn)
+        
+        try:
+            result = fn()
+            try:
+                self.redis.set(
+                    result_name,
+                    pickle.dumps(result),
+                    ex=Config.SINGLE_FLIGHT_RESULT_TTL
+                )
+            except RedisError as e:
+                logger.warning(f"Could not publish single-flight result: {str(e)}")
+            return result
+        finally:
+            try:
+                lock.release()
+            except (RedisError, redis.exceptions.LockError):
+                pass
+    
+    def _await_result(self, lock_name: str, result_name: str,
+                      fn: Callable[[], DeviceBatch]) -> DeviceBatch:
+        """Wait for another process to publish its result"""
+        give_up_at = time.monotonic() + self._wait_timeout()
+        interval = Config.SINGLE_FLIGHT_POLL_INTERVAL
+        
+        try:
+            while time.monotonic() < give_up_at:
+                published = self.redis.get(result_name)
+                if published is not None:
+                    return pickle.loads(published)
+                if not self.redis.exists(lock_name):
+                    # Leader finished without publishing (it failed or crashed)
+                    break
+                time.sleep(interval)
+                interval = min(interval * 2, 0.2)
+        except RedisError as e:
+            logger.warning(f"Single-flight wait interrupted: {str(e)}")
+        
+        deadline = current_deadline.get()
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceeded("Timed out waiting for a coalesced provider call")
+        return fn()
+
+single_flight = SingleFlight(redis_client)
+
+class PickleSerializer:
+    """Cache serializer storing entries as plain pickles"""
+    
+    def dumps(self, entry) -> bytes:
+        return pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def loads(self, blob: bytes):
+        return pickle.loads(blob)
+
+class ColumnarSerializer:
+    """
+    Compact columnar encoding of (fetched_at, DeviceBatch) cache entries
+    
+    Layout: magic b'NMDC', format version and compression codec bytes, then
+    the payload: fetched_at (float64) and device count (uint32), one float64
+    column per numeric field with NaN for None, and one dictionary-encoded
+    column per string field. All numbers are little-endian.
+    """
+    
+    MAGIC = b'NMDC'
+    VERSION = 1
+    CODECS = {'none': 0, 'zlib': 1, 'zstd': 2}
+    NUMERIC_FIELDS = tuple(f for f in DeviceBatch.NUMERIC_FIELDS if f not in DeviceBatch.COMPUTED_FIELDS)
+    STRING_FIELDS = DeviceBatch.STRING_FIELDS
+    
+    def __init__(self, compression: str = Config.CACHE_COMPRESSION,
+                 min_compress_bytes: int = Config.CACHE_COMPRESS_MIN_BYTES):
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        self.compression = compression
+        self.min_compress_bytes = min_compress_bytes
+    
+    @staticmethod
+    def _little_endian(column: array) -> array:
+        if sys.byteorder != 'little':
+            column.byteswap()
+        return column
+    
+    @staticmethod
+    def _encode_strings(values: List[Optional[str]]) -> bytes:
+        """Dictionary-encode a string column (code -1 stands for None)"""
+        dictionary = {}
+        codes = array('i')
+        for value in values:
+            if value is None:
+                codes.append(-1)
+            else:
+                codes.append(dictionary.setdefault(str(value), len(dictionary)))
+        
+        words = [word.encode('utf-8', 'surrogatepass') for word in dictionary]
+        lengths = array('I', (len(word) for word in words))
+        return b''.join([
+            struct.pack('<I', len(words)),
+            ColumnarSerializer._little_endian(lengths).tobytes(),
+            b''.join(words),
+            ColumnarSerializer._little_endian(codes).tobytes()
+        ])
+    
+    def dumps(self, entry) -> bytes:
+        fetched_at, devices = entry
+        batch = DeviceBatch.from_devices(devices)
+        parts = [struct.pack('<dI', fetched_at, len(batch))]
+        
+        for field in self.NUMERIC_FIELDS:
+            column = array('d', getattr(batch, field))
+            parts.append(self._little_endian(column).tobytes())
+        
+        for field in self.STRING_FIELDS:
+            parts.append(self._encode_strings(getattr(batch, field)))
+        
+        payload = b''.join(parts)
+        codec = 'none'
+        if len(payload) >= self.min_compress_bytes and self.compression != 'none':
+            codec = self.compression
+            if codec == 'zstd':
+                payload = zstandard.ZstdCompressor(level=3).compress(payload)
+            else:
+                payload = zlib.compress(payload, 1)
+        
+        return self.MAGIC + struct.pack('<BB', self.VERSION, self.CODECS[codec]) + payload
+    
+    def loads(self, blob: bytes):
+        if blob[:4] != self.MAGIC:
+            raise ValueError("Not a columnar cache entry")
+        version, codec = struct.unpack_from('<BB', blob, 4)
+        if version != self.VERSION:
+            raise ValueError(f"Unsupported cache entry version: {version}")
+        
+        payload = blob[6:]
+        if codec == self.CODECS['zlib']:
+            payload = zlib.decompress(payload)
+        elif codec == self.CODECS['zstd']:
+            if zstandard is None:
+                raise ValueError("zstd cache entry but 'zstandard' is not installed")
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        
+        view = memoryview(payload)
+        fetched_at, count = struct.unpack_from('<dI', view, 0)
+        offset = 12
+        
+        def read_array(typecode, length):
+            nonlocal offset
+            column = array(typecode)
+            column.frombytes(view[offset:offset + length * column.itemsize])
+            offset += length * column.itemsize
+            return self._little_endian(column)
+        
+        batch = DeviceBatch()
+        for field in self.NUMERIC_FIELDS:
+            setattr(batch, field, read_array('d', count))
+        for field in DeviceBatch.COMPUTED_FIELDS:
+            setattr(batch, field, array('d', [math.nan]) * count)
+        
+        for field in self.STRING_FIELDS:
+            (size,) = struct.unpack_from('<I', view, offset)
+            offset += 4
+            lengths = read_array('I', size)
+            words = []
+            for length in lengths:
+                words.append(bytes(view[offset:offset + length]).decode('utf-8', 'surrogatepass'))
+                offset += length
+            if field in DeviceBatch.INTERNED_FIELDS:
+                words = [sys.intern(word) for word in words]
+            setattr(batch, field, [None if code < 0 else words[code] for code in read_array('i', count)])
+        
+        return fetched_at, batch
+
+CACHE_SERIALIZERS = {
+    'columnar': ColumnarSerializer,
+    'pickle': PickleSerializer
+}
+
+class L1Cache:
+    """In-process LRU cache bounded by the serialized size of its entries"""
+    
+    def __init__(self, max_bytes: int = Config.L1_CACHE_MAX_BYTES, ttl: float = Config.L1_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (stored_at, value, size)
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: str):
+        """Get a value, or None if absent or older than the L1 TTL"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                self._remove(key)
+                entry = None
+            
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, key: str, value, size: int):
+        """Store a value, evicting least recently used entries beyond the byte cap"""
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic(), value, size)
+            self.size += size
+            
+            while self.size > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+    
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+    
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+class ProviderCache:
+    """
+    Stale-while-revalidate cache for provider tile lookups
+    
+    Entries are fresh until their soft TTL. Between the soft and the hard TTL
+    they are still served immediately while one deduplicated background task
+    refreshes them. After the hard TTL the backend drops them and the next
+    caller fetches synchronously. Callers running with refresh_inline set
+    refetch stale entries synchronously too.
+    
+    Lookups go through two tiers: a per-worker L1Cache, then the shared
+    flask_caching backend (L2). Every L2 write is announced on a Redis pub/sub
+    channel so that the other workers drop their L1 copy of the key. L2
+    entries are stored as bytes produced by a pluggable serializer
+    (Config.PROVIDER_CACHE_SERIALIZER). The TileSummary of an entry is
+    stored next to it in L2, so every worker reuses it.
+    """
+    
+    def __init__(self, backend: Cache, redis_conn: Optional[redis.Redis] = None,
+                 max_workers: int = Config.CACHE_REFRESH_WORKERS, serializer=None):
+        self.backend = backend
+        self.redis = redis_conn
+        self.serializer = serializer or CACHE_SERIALIZERS[Config.PROVIDER_CACHE_SERIALIZER]()
+        self.l1 = L1Cache()
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='refresh'
+        )
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._origin = None
+        self._listener_pid = None
+    
+    def memoize(self, soft_ttl: int, hard_ttl: int = Config.CACHE_HARD_TTL):
+        """Decorator caching a provider method on its class, name and arguments"""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(client, *args):
+                key = f"provider:{client.__class__.__name__}.{f.__name__}:{args!r}"
+                return self.get_or_fetch(key, lambda: f(client, *args), soft_ttl, hard_ttl)
+            return decorated_function
+        return decorator
+    
+    def get_or_fetch(self, key: str, fetch: Callable[[], DeviceBatch],
+                     soft_ttl: int, hard_ttl: int) -> DeviceBatch:
+        """
+        Serve a cached value, refreshing it in the background once stale
+        
+        Args:
+            key: Cache key
+            fetch: Zero-argument callable producing a fresh value
+            soft_ttl: Age in seconds after which a background refresh starts
+            hard_ttl: Age in seconds after which the entry is gone
+        """
+        self._ensure_listener()
+        
+        entry = self.l1.get(key)
+        if entry is not None and time.time() - entry[0] >= hard_ttl:
+            # L1 keeps entries for its own TTL, which may outlast the hard TTL
+            self.l1.delete(key)
+            entry = None
+        if entry is None:
+            entry = self._l2_get(key)
+        
+        if entry is not None:
+            fetched_at, value = entry
+            age = max(0.0, time.time() - fetched_at)
+            if age < soft_ttl:
+                CallStats.record_age(age)
+                CallStats.record_entry(key, fetched_at)
+                return value
+            if not refresh_inline.get():
+                CallStats.record_age(age)
+                CallStats.record_entry(key, fetched_at)
+                self._schedule_refresh(key, fetch, hard_ttl)
+                return value
+        
+        value = fetch()
+        CallStats.record_entry(key, self._store(key, value, hard_ttl))
+        return value
+    
+    def summary(self, key: str, fetched_at: float, devices: DeviceBatch) -> 'TileSummary':
+        """
+        Summary of the devices of a cached entry, shared by every worker
+        
+        Summaries live under the entry's key plus ':summary' and are tagged
+        with the fetch time of the entry they describe, so a refreshed entry
+        is summarized again.
+        
+        Args:
+            key: Cache key of the entry
+            fetched_at: Fetch time of the entry the devices came from
+            devices: Devices of the entry, summarized when no summary is stored
+        """
+        summary_key = f"{key}:summary"
+        try:
+            blob = self.backend.get(summary_key)
+            if blob is not None:
+                tag, summary = TileSummary.decode(blob)
+                if tag == fetched_at:
+                    return summary
+        except Exception as e:
+            logger.warning(f"Cache read failed for {summary_key}: {str(e)}")
+        
+        summary = TileSummary.from_devices(devices)
+        try:
+            self.backend.set(summary_key, summary.encode(fetched_at), timeout=Config.CACHE_HARD_TTL)
+        except Exception as e:
+            logger.warning(f"Cache write failed for {summary_key}: {str(e)}")
+        return summary
+    
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters per tier for this worker"""
+        return {
+            "l1": {
+                "hits": self.l1.hits,
+                "misses": self.l1.misses,
+                "entries": len(self.l1),
+                "bytes": self.l1.size
+            },
+            "l2": {
+                "hits": self.l2_hits,
+                "misses": self.l2_misses
+            }
+        }
+    
+    def _l2_get(self, key: str):
+        """Read the shared tier and promote hits into L1"""
+        try:
+            blob = self.backend.get(key)
+            entry = None if blob is None else self.serializer.loads(blob)
+        except Exception as e:
+            # Includes entries written in an older or different format
+            logger.warning(f"Cache read failed for {key}: {str(e)}")
+            entry = None
+        
+        if entry is None:
+            self.l2_misses += 1
+            return None
+        
+        self.l2_hits += 1
+        self.l1.set(key, entry, len(blob))
+        return entry
+    
+    def _store(self, key: str, value: DeviceBatch, hard_ttl: int) -> float:
+        """Write an entry to both tiers, returning its fetch time"""
+        entry = (time.time(), value)
+        blob = self.serializer.dumps(entry)
+        self.l1.set(key, entry, len(blob))
+        try:
+            self.backend.set(key, blob, timeout=hard_ttl)
+        except Exception as e:
+            logger.warning(f"Cache write failed for {key}: {str(e)}")
+            return entry[0]
+        
+        if self.redis is not None and self._origin is not None:
+            try:
+                self.redis.publish(Config.CACHE_INVALIDATION_CHANNEL, f"{self._origin} {key}")
+            except RedisError as e:
+                logger.warning(f"Cache invalidation publish failed: {str(e)}")
+        return entry[0]
+    
+    def _ensure_listener(self):
+        """Start the invalidation listener once per worker process"""
+        if self.redis is None or self._listener_pid == os.getpid():
+            return
+        
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._origin = uuid.uuid4().hex
+            # Entries inherited through fork were never covered by a listener
+            self.l1.clear()
+            threading.Thread(
+                target=self._listen,
+                name='cache-invalidation',
+                daemon=True
+            ).start()
+    
+    def _listen(self):
+        """Drop L1 entries that other workers have rewritten in L2"""
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(Config.CACHE_INVALIDATION_CHANNEL)
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._on_invalidation(message['data'])
+            except RedisError as e:
+                logger.warning(f"Cache invalidation listener disconnected: {str(e)}")
+                # Invalidations may have been missed while disconnected
+                self.l1.clear()
+                time.sleep(1)
+    
+    def _on_invalidation(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        origin, _, key = data.partition(' ')
+        if origin != self._origin:
+            self.l1.delete(key)
+    
+    def _schedule_refresh(self, key: str, fetch: Callable[[], DeviceBatch], hard_ttl: int):
+        """Start a background refresh unless one is already running anywhere"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        
+        try:
+            if self.redis is not None and not self.redis.set(
+                f"swr:refresh:{key}", 1, nx=True, ex=Config.SINGLE_FLIGHT_LOCK_TTL
+            ):
+                # Another worker is already refreshing this entry
+                with self._lock:
+                    self._refreshing.discard(key)
+                return
+        except RedisError as e:
+            logger.warning(f"Refresh deduplication unavailable: {str(e)}")
+        
+        self.executor.submit(self._refresh, key, fetch, hard_ttl)
+    
+    def _refresh(self, key: str, fetch: Callable[[], DeviceBatch], hard_ttl: int):
+        try:
+            self._store(key, fetch(), hard_ttl)
+        except Exception as e:
+            logger.warning(f"Background refresh of {key} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+            if self.redis is not None:
+                try:
+                    self.redis.delete(f"swr:refresh:{key}")
+                except RedisError:
+                    pass
+
+provider_cache = ProviderCache(cache, redis_client)
+
+def coalesced(f):
+    """Decorator to run a provider method through single-flight coalescing"""
+    @wraps(f)
+    def decorated_function(self, *args, **kwargs):
+        key = f"{self.__class__.__name__}.{f.__name__}:{args!r}:{sorted(kwargs.items())!r}"
+        return single_flight.do(key, lambda: f(self, *args, **kwargs))
+    return decorated_function
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one provider, shared by every worker through Redis
+    
+    Calls are counted in fixed windows. When enough calls in the current
+    window failed or were slow the circuit opens and calls fail fast for
+    Config.CIRCUIT_OPEN_SECONDS. It then turns half-open: a single worker is
+    allowed through as a probe, which closes the circuit on success and
+    reopens it on failure. If Redis is unreachable calls are let through.
+    """
+    
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+    
+    def __init__(self, name: str, redis_conn: Optional[redis.Redis] = None):
+        self.name = name
+        self.redis = redis_conn
+        self.prefix = f"circuit:{name}"
+        self._probing = threading.local()
+    
+    def _read(self) -> Tuple[str, Optional[str]]:
+        """Fetch (state, reason it tripped) in one round trip"""
+        if self.redis is None:
+            return self.CLOSED, None
+        try:
+            is_open, tripped = self.redis.mget(f"{self.prefix}:open", f"{self.prefix}:tripped")
+        except RedisError as e:
+            logger.warning(f"Circuit state unavailable for {self.name}: {str(e)}")
+            return self.CLOSED, None
+        reason = tripped.decode() if isinstance(tripped, bytes) else tripped
+        if is_open is not None:
+            return self.OPEN, reason
+        return (self.HALF_OPEN, reason) if tripped is not None else (self.CLOSED, None)
+    
+    def state(self) -> str:
+        """Current state as seen by every worker"""
+        return self._read()[0]
+    
+    def allow(self) -> bool:
+        """Check whether a call may go upstream (half-open lets one probe through)"""
+        self._probing.active = False
+        state = self.state()
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+        try:
+            acquired = self.redis.set(f"{self.prefix}:probe", os.getpid(), nx=True,
+                                      ex=int(Config.API_TIMEOUT) + 5)
+        except RedisError:
+            return True
+        self._probing.active = bool(acquired)
+        return self._probing.active
+    
+    def record(self, failed: bool, elapsed: float):
+        """
+        Report the outcome of an upstream call made after allow()
+        
+        Args:
+            failed: Whether the provider failed (connection error, timeout, 5xx, 429)
+            elapsed: Duration of the call in seconds
+        """
+        if self.redis is None:
+            return
+        slow = elapsed >= Config.CIRCUIT_SLOW_CALL
+        try:
+            if getattr(self._probing, 'active', False):
+                self._probing.active = False
+                if failed or slow:
+                    self._trip("probe failed")
+                else:
+                    self.redis.delete(f"{self.prefix}:tripped", f"{self.prefix}:probe")
+                    logger.info(f"Circuit for {self.name} closed")
+                return
+            
+            window = f"{self.prefix}:window:{int(time.time() // Config.CIRCUIT_WINDOW)}"
+            pipe = self.redis.pipeline()
+            pipe.hincrby(window, 'calls', 1)
+            pipe.hincrby(window, 'failures', int(failed))
+            pipe.hincrby(window, 'slow', int(slow))
+            pipe.expire(window, Config.CIRCUIT_WINDOW * 2)
+            calls, failures, slow_calls, _ = pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Circuit update failed for {self.name}: {str(e)}")
+            return
+        
+        if calls < Config.CIRCUIT_MIN_CALLS:
+            return
+        if failures / calls >= Config.CIRCUIT_ERROR_RATE:
+            self._trip(f"{failures}/{calls} calls failed")
+        elif slow_calls / calls >= Config.CIRCUIT_SLOW_RATE:
+            self._trip(f"{slow_calls}/{calls} calls were slow")
+    
+    def release(self):
+        """
+        Give up a call made after allow() without an outcome
+        
+        Used when the caller's own deadline cut the call short, which says
+        nothing about the provider. A half-open probe hands the probe back,
+        so the circuit stays half-open for the next caller.
+        """
+        if self.redis is None or not getattr(self._probing, 'active', False):
+            return
+        self._probing.active = False
+        try:
+            self.redis.delete(f"{self.prefix}:probe")
+        except RedisError as e:
+            logger.warning(f"Could not release probe for {self.name}: {str(e)}")
+    
+    def _trip(self, reason: str):
+        try:
+            pipe = self.redis.pipeline()
+            pipe.set(f"{self.prefix}:open", reason, ex=Config.CIRCUIT_OPEN_SECONDS)
+            pipe.set(f"{self.prefix}:tripped", reason)
+            pipe.delete(f"{self.prefix}:probe")
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Could not open circuit for {self.name}: {str(e)}")
+            return
+        logger.warning(f"Circuit for {self.name} opened: {reason}")
+    
+    def reset(self):
+        """Close the circuit and forget the current window"""
+        if self.redis is None:
+            return
+        try:
+            window = f"{self.prefix}:window:{int(time.time() // Config.CIRCUIT_WINDOW)}"
+            self.redis.delete(f"{self.prefix}:open", f"{self.prefix}:tripped",
+                              f"{self.prefix}:probe", window)
+        except RedisError as e:
+            logger.warning(f"Could not reset circuit for {self.name}: {str(e)}")
+    
+    def stats(self) -> Dict:
+        """State and reason for health reporting"""
+        state, reason = self._read()
+        return {"state": state, "reason": reason}
+
+@dataclass
+class TransportAttempt:
+    """Timing of one HTTP attempt made by the provider transport"""
+    method: str
+    url: str
+    attempt: int
+    hedged: bool
+    elapsed_ms: float
+    status: Optional[int] = None
+    error: Optional[str] = None
+
+class Transport:
+    """
+    HTTP transport shared by the calls of one API client
+    
+    Connections are pooled per host and sized for the worker threads that can
+    call the provider at once. Idempotent calls are retried on connection
+    errors, timeouts and retryable statuses with full-jitter exponential
+    backoff, and can be hedged: when the first attempt is still running after
+    hedge_after seconds a duplicate is sent and the first response wins.
+    Every attempt is timed and reported to the current provider call.
+    """
+    
+    IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+    
+    def __init__(self, pool_maxsize: int = Config.HTTP_POOL_MAXSIZE,
+                 max_retries: int = Config.HTTP_MAX_RETRIES,
+                 backoff: float = Config.HTTP_RETRY_BACKOFF,
+                 hedge_after: Optional[float] = Config.HTTP_HEDGE_AFTER):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after
+        self.attempts = deque(maxlen=Config.HTTP_ATTEMPT_LOG_SIZE)
+        self._hedge_executor = None
+        self._lock = threading.Lock()
+    
+    def request(self, method: str, url: str, idempotent: Optional[bool] = None,
+                **kwargs) -> requests.Response:
+        """
+        Perform a request with retries and optional hedging
+        
+        Args:
+            method: HTTP method
+            url: Absolute URL
+            idempotent: Override the method-based idempotency check
+            **kwargs: Additional arguments for requests (timeout is required)
+        
+        Returns:
+            Successful response
+        
+        Raises:
+            DeadlineExceeded: If the current request's deadline runs out
+            requests.RequestException: If the last attempt failed
+        """
+        if idempotent is None:
+            idempotent = method.upper() in self.IDEMPOTENT_METHODS
+        retries = self.max_retries if idempotent else 0
+        
+        attempt = 0
+        while True:
+            try:
+                if idempotent and self.hedge_after is not None:
+                    response = self._hedged(method, url, attempt, kwargs)
+                else:
+                    response = self._attempt(method, url, attempt, False, kwargs)
+                if response.status_code not in Config.HTTP_RETRY_STATUSES or attempt >= retries:
+                    response.raise_for_status()
+                    return response
+                error = requests.exceptions.HTTPError(
+                    f"{response.status_code} returned by {url}", response=response
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= retries:
+                    raise
+                error = e
+            
+            attempt += 1
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+            deadline = current_deadline.get()
+            if deadline is not None and deadline.remaining() <= delay:
+                raise error
+            logger.info(f"Retrying {method} {url} in {delay:.2f}s after: {str(error)}")
+            time.sleep(delay)
+    
+    def _attempt(self, method: str, url: str, attempt: int, hedged: bool,
+                 kwargs: Dict) -> requests.Response:
+        """Make one timed HTTP attempt, clamped to the request's deadline"""
+        kwargs = dict(kwargs)
+        deadline = current_deadline.get()
+        clamped = False
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"No time budget left for {url}")
+            if remaining < kwargs['timeout']:
+                kwargs['timeout'] = remaining
+                clamped = True
+        
+        record = TransportAttempt(method=method, url=url, attempt=attempt,
+                                  hedged=hedged, elapsed_ms=0.0)
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            record.status = response.status_code
+            return response
+        except requests.exceptions.Timeout as e:
+            record.error = type(e).__name__
+            if clamped:
+                raise DeadlineExceeded(f"Deadline reached while accessing {url}")
+            raise
+        except requests.exceptions.RequestException as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+            self.attempts.append(record)
+            stats = current_call_stats.get()
+            if stats is not None:
+                stats.observe_attempt(record)
+    
+    def _hedged(self, method: str, url: str, attempt: int, kwargs: Dict) -> requests.Response:
+        """Race the attempt against a duplicate sent after hedge_after seconds"""
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=Config.HTTP_POOL_MAXSIZE, thread_name_prefix='hedge'
+                )
+        
+        primary = self._hedge_executor.submit(
+            copy_context().run, self._attempt, method, url, attempt, False, kwargs
+        )
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        
+        hedge = self._hedge_executor.submit(
+            copy_context().run, self._attempt, method, url, attempt, True, kwargs
+        )
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result().ok:
+                    return future.result()
+                last = future
+        
+        # Neither attempt produced a usable response
+        return last.result()
+    
+    def stats(self) -> Dict:
+        """Summary of recent attempts for health reporting"""
+        attempts = list(self.attempts)
+        return {
+            "attempts": len(attempts),
+            "retries": sum(1 for a in attempts if a.attempt > 0),
+            "hedged": sum(1 for a in attempts if a.hedged),
+            "errors": sum(1 for a in attempts if a.error or (a.status or 0) >= 400),
+            "avg_ms": round(sum(a.elapsed_ms for a in attempts) / len(attempts), 1) if attempts else None
+        }
+
+class APIClient:
+    """Base class for API clients with error handling and caching"""
+    
+    def __init__(self, base_url: str, timeout: int = Config.API_TIMEOUT):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.transport = Transport()
+        self.breaker = CircuitBreaker(self.__class__.__name__, redis_client)
+        self.session = self.transport.session
+        self.session.headers.update({
+            'User-Agent': 'NetworkMapper/2.0'
+        })
+    
+    def __repr__(self) -> str:
+        # Used in memoization keys, so it must be identical in every worker process
+        return f"{self.__class__.__name__}({self.base_url!r})"
+    
+    def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict:
+        """
+        Make HTTP request with error handling
+        
+        Args:
+            method: HTTP method (GET, POST, etc.)
+            endpoint: API endpoint
+            **kwargs: Additional arguments for requests
+            
+        Returns:
+            Response JSON
+        
+        Raises:
+            DeadlineExceeded: If the current request's deadline runs out
+            CircuitOpenError: If the provider's circuit breaker is open
+            ProviderError: If the request failed or the response is not JSON,
+                so that the failure is neither cached nor reported as empty
+        """
+        url = f"{self.base_url}{endpoint}"
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('verify', True)
+        
+        # Fail fast while the provider is known to be degraded; cached data
+        # (even stale) is still served by the provider cache
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit for {self.breaker.name} is open")
+        
+        started = time.monotonic()
+        failed = True
+        cut_short = False
+        try:
+            # The transport never waits longer than the request's remaining time budget
+            response = self.transport.request(method, url, **kwargs)
+            failed = False
+            return response.json()
+        except DeadlineExceeded:
+            cut_short = True
+            raise
+        except requests.exceptions.Timeout as e:
+            logger.error(f"Timeout accessing {url}")
+            raise ProviderError(f"Timeout accessing {self.breaker.name}") from e
+        except requests.exceptions.HTTPError as e:
+            # Client errors such as bad credentials say nothing about provider health
+            status = e.response.status_code if e.response is not None else 500
+            failed = status >= 500 or status == 429
+            logger.error(f"Error accessing {url}: {str(e)}")
+            raise ProviderError(f"{self.breaker.name} returned HTTP {status}") from e
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error accessing {url}: {str(e)}")
+            raise ProviderError(f"Error accessing {self.breaker.name}") from e
+        except ValueError as e:
+            logger.error(f"Invalid JSON response from {url}: {str(e)}")
+            raise ProviderError(f"Invalid JSON response from {self.breaker.name}") from e
+        finally:
+            if cut_short:
+                self.breaker.release()
+            else:
+                self.breaker.record(failed, time.monotonic() - started)
+
+class TileSummary:
+    """
+    Mergeable aggregate of a set of devices
+    
+    Holds the device count per type, a Misra-Gries sketch of vendor counts
+    (bounded to Config.STATS_VENDOR_SKETCH_SIZE counters, each under-counting
+    by at most total / (size + 1)) and a histogram of signals rounded to
+    whole dBm, from which the average and percentiles are derived. Summaries
+    of disjoint sets of devices merge into the summary of their union.
+    """
+    
+    __slots__ = ('types', 'vendors', 'signals', 'signal_sum', 'signal_count', 'sketch_size')
+    
+    def __init__(self, sketch_size: int = Config.STATS_VENDOR_SKETCH_SIZE):
+        self.types = Counter()
+        self.vendors = Counter()
+        self.signals = Counter()
+        self.signal_sum = 0.0
+        self.signal_count = 0
+        self.sketch_size = sketch_size
+    
+    @classmethod
+    def from_devices(cls, devices: DeviceBatch) -> 'TileSummary':
+        """Summarize a batch column by column"""
+        summary = cls()
+        summary.types.update(devices.device_type)
+        summary.vendors.update(vendor for vendor in devices.vendor if vendor)
+        summary._trim()
+        for signal in devices.signal:
+            # Missing (NaN) and zero readings are not real measurements
+            if signal == signal and signal:
+                summary.signals[round(signal)] += 1
+                summary.signal_sum += signal
+                summary.signal_count += 1
+        return summary
+    
+    def __len__(self) -> int:
+        return sum(self.types.values())
+    
+    def encode(self, tag: float) -> bytes:
+        """Encode as JSON bytes, with a tag identifying the data summarized"""
+        return json.dumps({
+            "tag": tag,
+            "types": self.types,
+            "vendors": self.vendors,
+            "signals": {str(signal): count for signal, count in self.signals.items()},
+            "signal_sum": self.signal_sum,
+            "signal_count": self.signal_count,
+            "sketch_size": self.sketch_size
+        }).encode()
+    
+    @classmethod
+    def decode(cls, blob: bytes) -> Tuple[float, 'TileSummary']:
+        """Decode bytes produced by encode(), returning (tag, summary)"""
+        data = json.loads(blob)
+        summary = cls(data['sketch_size'])
+        summary.types = Counter(data['types'])
+        summary.vendors = Counter(data['vendors'])
+        summary.signals = Counter({int(signal): count for signal, count in data['signals'].items()})
+        summary.signal_sum = data['signal_sum']
+        summary.signal_count = data['signal_count']
+        return data['tag'], summary
+    
+    def merge(self, other: 'TileSummary') -> 'TileSummary':
+        """Add another summary into this one (returns self)"""
+        self.types.update(other.types)
+        self.vendors.update(other.vendors)
+        self._trim()
+        self.signals.update(other.signals)
+        self.signal_sum += other.signal_sum
+        self.signal_count += other.signal_count
+        return self
+    
+    def _trim(self):
+        """Keep the vendor sketch within its size (Misra-Gries reduction)"""
+        if len(self.vendors) <= self.sketch_size:
+            return
+        counts = sorted(self.vendors.values(), reverse=True)
+        cut = counts[self.sketch_size]
+        self.vendors = Counter({
+            vendor: count - cut for vendor, count in self.vendors.items() if count > cut
+        })
+    
+    def top_vendors(self, k: int = 10) -> Dict[str, int]:
+        return dict(self.vendors.most_common(k))
+    
+    def average_signal(self) -> Optional[float]:
+        return self.signal_sum / self.signal_count if self.signal_count else None
+    
+    def percentile(self, p: float) -> Optional[int]:
+        """Nearest-rank percentile of the signals, in whole dBm"""
+        if not self.signal_count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.signal_count))
+        seen = 0
+        for signal in sorted(self.signals):
+            seen += self.signals[signal]
+            if seen >= rank:
+                return signal
+        return max(self.signals)
+
+class SpatialIndex:
+    """
+    Per-worker grid index of every device seen, one cell per cache tile
+    
+    Each cell remembers when it was filled. Lookups only succeed while the
+    cell is younger than the index TTL, and the least recently used cells
+    are evicted once the total number of devices exceeds the memory cap.
+    Cells also keep the TileSummary of their devices once it is needed, and
+    the provider cache entry the devices came from.
+    """
+    
+    def __init__(self, ttl: float = Config.SPATIAL_INDEX_TTL,
+                 max_devices: int = Config.SPATIAL_INDEX_MAX_DEVICES):
+        self.ttl = ttl
+        self.max_devices = max_devices
+        self._cells = OrderedDict()  # (layer, zoom, x, y) -> [filled_at, fetched_at, devices, summary, source]
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def put(self, layer: str, zoom: int, x: int, y: int, devices: DeviceBatch,
+            fetched_at: Optional[float] = None, source: Optional[Tuple[str, float]] = None):
+        """
+        Store the devices of one tile, evicting old cells beyond the cap
+        
+        Args:
+            fetched_at: Epoch time the data was fetched upstream (default: now)
+            source: (key, fetched_at) of the provider cache entry holding the
+                devices, if they came from exactly one
+        """
+        key = (layer, zoom, x, y)
+        with self._lock:
+            previous = self._cells.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[2])
+            
+            self._cells[key] = [time.monotonic(), fetched_at or time.time(), devices, None, source]
+            self._size += len(devices)
+            
+            while self._size > self.max_devices and len(self._cells) > 1:
+                _, (_, _, evicted, _, _) = self._cells.popitem(last=False)
+                self._size -= len(evicted)
+    
+    def _fresh_cell(self, key: Tuple) -> Optional[List]:
+        """Get a cell unless unknown or stale (call with the lock held)"""
+        entry = self._cells.get(key)
+        if entry is None:
+            return None
+        
+        if time.monotonic() - entry[0] > self.ttl:
+            del self._cells[key]
+            self._size -= len(entry[2])
+            return None
+        
+        self._cells.move_to_end(key)
+        return entry
+    
+    def get(self, layer: str, zoom: int, x: int, y: int) -> Optional[DeviceBatch]:
+        """Get the devices of one tile, or None if unknown or stale"""
+        with self._lock:
+            entry = self._fresh_cell((layer, zoom, x, y))
+            if entry is None:
+                return None
+            _, fetched_at, devices, _, _ = entry
+        
+        CallStats.record_age(time.time() - fetched_at)
+        return devices
+    
+    def summary(self, layer: str, zoom: int, x: int, y: int,
+                build: Optional[Callable[[DeviceBatch, Optional[Tuple[str, float]]], TileSummary]] = None
+                ) -> Optional[TileSummary]:
+        """
+        Get the summary of one tile, or None if unknown or stale
+        
+        Args:
+            build: Makes the summary on first use from the devices and their
+                source (default: summarize the devices)
+        """
+        with self._lock:
+            entry = self._fresh_cell((layer, zoom, x, y))
+            if entry is None:
+                return None
+            if entry[3] is not None:
+                return entry[3]
+            devices, source = entry[2], entry[4]
+        
+        # Built outside the lock, since it may read the shared cache
+        summary = build(devices, source) if build is not None else TileSummary.from_devices(devices)
+        with self._lock:
+            entry[3] = summary
+        return summary
+    
+    def query(self, layer: str, bounds: Dict[str, float], zoom: int) -> Optional[DeviceBatch]:
+        """
+        Answer a bounding-box query from memory
+        
+        Returns:
+            Devices inside the box, or None unless every covering cell is fresh
+        """
+        cells = []
+        for x, y in TileMath.tiles_for_bounds(bounds, zoom):
+            cell = self.get(layer, zoom, x, y)
+            if cell is None:
+                return None
+            cells.append(cell)
+        
+        return TileMath.clip(DeviceDeduplicator.merge(cells), bounds)
+
+class TileFetcher:
+    """Resolve area queries through fixed, individually cached tiles"""
+    
+    def __init__(self, index: SpatialIndex, zoom: int = Config.TILE_ZOOM,
+                 max_workers: int = Config.TILE_WORKERS, summaries: Optional[ProviderCache] = None):
+        self.index = index
+        self.zoom = zoom
+        self.summaries = summaries
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='tile'
+        )
+    
+    def fetch(self, layer: str, x: int, y: int,
+              fetch_tile: Callable[[int, int, int], DeviceBatch]) -> DeviceBatch:
+        """Get one tile from the spatial index, falling back to the cached lookup"""
+        devices = self.index.get(layer, self.zoom, x, y)
+        if devices is None:
+            # Capture the age of the cached data so the index keeps reporting
+            # it; the age and upstream attempts still reach the caller
+            stats = CallStats()
+            token = current_call_stats.set(stats)
+            try:
+                devices = fetch_tile(self.zoom, x, y)
+            finally:
+                current_call_stats.reset(token)
+            
+            CallStats.record(stats)
+            self.index.put(layer, self.zoom, x, y, devices, fetched_at=time.time() - stats.max_age,
+                           source=stats.entries[0] if len(stats.entries) == 1 else None)
+        return devices
+    
+    def collect(self, layer: str, bounds: Dict[str, float],
+                fetch_tile: Callable[[int, int, int], DeviceBatch]) -> DeviceBatch:
+        """
+        Fetch every tile covering a bounding box and clip the result to it
+        
+        Args:
+            layer: Device layer name used as spatial index namespace
+            bounds: Bounding box as returned by CoordinateValidator.calculate_bounds
+            fetch_tile: Cached per-tile lookup taking (zoom, x, y)
+        
+        Returns:
+            Devices from all covering tiles that fall inside the box
+        """
+        # Fast path: the whole area is fresh in this worker's index
+        devices = self.index.query(layer, bounds, self.zoom)
+        if devices is not None:
+            return devices
+        
+        tiles = TileMath.tiles_for_bounds(bounds, self.zoom)
+        return TileMath.clip(self.fetch_many(layer, tiles, fetch_tile), bounds)
+    
+    def fetch_many(self, layer: str, tiles: List[Tuple[int, int]],
+                   fetch_tile: Callable[[int, int, int], DeviceBatch]) -> DeviceBatch:
+        """Fetch whole tiles concurrently and merge them (without clipping)"""
+        return DeviceDeduplicator.merge(self._fetch_tiles(layer, tiles, fetch_tile))
+    
+    def fetch_each(self, layer: str, tiles: List[Tuple[int, int]],
+                   fetch_tile: Callable[[int, int, int], DeviceBatch]) -> Dict[Tuple[int, int], DeviceBatch]:
+        """Fetch tiles concurrently, keeping the devices of each tile apart"""
+        return dict(zip(tiles, self._fetch_tiles(layer, tiles, fetch_tile)))
+    
+    def _fetch_tiles(self, layer: str, tiles: List[Tuple[int, int]],
+                     fetch_tile: Callable[[int, int, int], DeviceBatch]) -> List[DeviceBatch]:
+        """Fetch tiles concurrently, returning the devices of each tile in order"""
+        if len(tiles) == 1:
+            return [DeviceBatch.from_devices(self.fetch(layer, *tiles[0], fetch_tile))]
+        
+        # Each task runs in a copy of the caller's context so the
+        # request deadline applies to every tile fetch
+        futures = [
+            self.executor.submit(copy_context().run, self.fetch, layer, x, y, fetch_tile)
+            for x, y in tiles
+        ]
+        return [DeviceBatch.from_devices(future.result()) for future in futures]
+    
+    def summarize(self, layer: str, bounds: Dict[str, float],
+                  fetch_tile: Callable[[int, int, int], DeviceBatch],
+                  clip: bool = True) -> TileSummary:
+        """
+        Merge the summaries of the tiles covering a bounding box
+        
+        Tiles lying entirely inside the box contribute their stored summary,
+        shared through the provider cache when the tile came from it; tiles
+        crossing its edge are summarized from their clipped devices.
+        
+        Args:
+            clip: Whether to restrict edge tiles to the box (otherwise
+                whole tiles are summarized)
+        """
+        tiles = TileMath.tiles_for_bounds(bounds, self.zoom)
+        summary = TileSummary()
+        for (x, y), devices in zip(tiles, self._fetch_tiles(layer, tiles, fetch_tile)):
+            tile = TileMath.tile_bounds(self.zoom, x, y)
+            inside = (bounds['latrange1'] <= tile['latrange1'] and tile['latrange2'] <= bounds['latrange2']
+                      and bounds['longrange1'] <= tile['longrange1'] and tile['longrange2'] <= bounds['longrange2'])
+            if inside or not clip:
+                stored = self.index.summary(layer, self.zoom, x, y, self._build_summary)
+                summary.merge(stored or TileSummary.from_devices(devices))
+            else:
+                summary.merge(TileSummary.from_devices(TileMath.clip(devices, bounds)))
+        return summary
+    
+    def _build_summary(self, devices: DeviceBatch, source: Optional[Tuple[str, float]]) -> TileSummary:
+        """Summarize a tile, through the shared cache when it came from a provider cache entry"""
+        if source is None or self.summaries is None:
+            return TileSummary.from_devices(devices)
+        return self.summaries.summary(*source, devices)
+
+spatial_index = SpatialIndex()
+tile_fetcher = TileFetcher(spatial_index, summaries=provider_cache)
+
+class _ClusterNode:
+    """A device or a cluster at one zoom level of a ClusterIndex"""
+    
+    __slots__ = ('x', 'y', 'count', 'types', 'zoom', 'children', 'point', 'id')
+    
+    def __init__(self, x: float, y: float, count: int, types: Counter, zoom: int,
+                 children: Optional[List['_ClusterNode']] = None, point: Optional[int] = None):
+        self.x = x
+        self.y = y
+        self.count = count
+        self.types = types
+        self.zoom = zoom
+        self.children = children
+        self.point = point
+        self.id = None
+
+class ClusterIndex:
+    """
+    Hierarchical point clusters of a set of devices (supercluster-style)
+    
+    Devices are projected to Web Mercator and clustered greedily from
+    Config.CLUSTER_MAX_ZOOM down to zoom 0: at each zoom, every item still
+    unclaimed absorbs its unclaimed neighbours within Config.CLUSTER_RADIUS
+    pixels of the item above it. Clusters keep their device count, a count
+    per device type and their children, so any of them can be expanded to
+    the items it splits into one zoom level deeper. Cluster ids only depend
+    on the devices, so an index rebuilt from the same data reuses them.
+    """
+    
+    def __init__(self, layers: Dict[str, DeviceBatch], radius: float = Config.CLUSTER_RADIUS,
+                 max_zoom: int = Config.CLUSTER_MAX_ZOOM):
+        self.max_zoom = max_zoom
+        self.devices = DeviceBatch.concat(layers.values())
+        self.layers = [name for name, devices in layers.items() for _ in range(len(devices))]
+        self._clusters: List[_ClusterNode] = []
+        
+        nodes = []
+        for i, (lat, lon, device_type) in enumerate(zip(self.devices.lat, self.devices.lon,
+                                                        self.devices.device_type)):
+            if lat == lat and lon == lon:
+                nodes.append(_ClusterNode(*self._project(lat, lon), 1, Counter({device_type: 1}),
+                                          max_zoom + 1, point=i))
+        
+        self._levels = {max_zoom + 1: nodes}
+        for zoom in range(max_zoom, -1, -1):
+            nodes = self._cluster(nodes, zoom, radius / (256 * 2 ** zoom))
+            self._levels[zoom] = nodes
+        self.nbytes = self._measure()
+    
+    def __len__(self) -> int:
+        return len(self.devices)
+    
+    def _measure(self) -> int:
+        """
+        Approximate memory held by the index, in bytes
+        
+        Counts the nodes with their type counters and child lists, the
+        levels and the device columns. The device strings themselves are
+        shared with the provider tiles the index was built from.
+        """
+        size = sum(
+            sys.getsizeof(node) + sys.getsizeof(node.types) + sys.getsizeof(node.children or ())
+            for node in self._levels[self.max_zoom + 1] + self._clusters
+        )
+        size += sum(sys.getsizeof(level) for level in self._levels.values()) + sys.getsizeof(self.layers)
+        for field in DeviceBatch.FIELDS:
+            size += sys.getsizeof(getattr(self.devices, field))
+        return size
+    
+    @staticmethod
+    def _project(lat: float, lon: float) -> Tuple[float, float]:
+        """Web Mercator position in [0, 1]"""
+        lat = max(-TileMath.MAX_LATITUDE, min(lat, TileMath.MAX_LATITUDE))
+        y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0
+        return (lon + 180.0) / 360.0, y
+    
+    @staticmethod
+    def _unproject(x: float, y: float) -> Tuple[float, float]:
+        lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+        return lat, x * 360.0 - 180.0
+    
+    def _cluster(self, nodes: List[_ClusterNode], zoom: int, radius: float) -> List[_ClusterNode]:
+        """Merge the nodes of the zoom level above into the nodes of this one"""
+        grid = {}
+        for node in nodes:
+            grid.setdefault((int(node.x / radius), int(node.y / radius)), []).append(node)
+        
+        claimed = set()
+        result = []
+        for node in nodes:
+            if id(node) in claimed:
+                continue
+            claimed.add(id(node))
+            
+            cx, cy = int(node.x / radius), int(node.y / radius)
+            members = [node]
+            for gx in (cx - 1, cx, cx + 1):
+                for gy in (cy - 1, cy, cy + 1):
+                    for other in grid.get((gx, gy), ()):
+                        if id(other) not in claimed and \
+                                (other.x - node.x) ** 2 + (other.y - node.y) ** 2 <= radius ** 2:
+                            claimed.add(id(other))
+                            members.append(other)
+            
+            if len(members) == 1:
+                result.append(node)
+                continue
+            
+            count = sum(member.count for member in members)
+            types = Counter()
+            for member in members:
+                types.update(member.types)
+            cluster = _ClusterNode(
+                sum(member.x * member.count for member in members) / count,
+                sum(member.y * member.count for member in members) / count,
+                count, types, zoom, children=members
+            )
+            cluster.id = len(self._clusters)
+            self._clusters.append(cluster)
+            result.append(cluster)
+        
+        return result
+    
+    def _split(self, nodes: List[_ClusterNode]) -> Tuple[List[Dict], List[int]]:
+        """Separate cluster nodes (as response dicts) from single devices"""
+        clusters = []
+        points = []
+        for node in nodes:
+            if node.point is not None:
+                points.append(node.point)
+                continue
+            lat, lon = self._unproject(node.x, node.y)
+            clusters.append({
+                "id": node.id,
+                "lat": lat,
+                "lon": lon,
+                "count": node.count,
+                "types": dict(node.types),
+                "expansion_zoom": node.zoom + 1
+            })
+        return clusters, points
+    
+    def get_clusters(self, bounds: Dict[str, float], zoom: int) -> Tuple[List[Dict], List[int]]:
+        """
+        Clusters and single devices inside a bounding box at a zoom level
+        
+        Returns:
+            Tuple of (cluster dicts, row numbers of single devices in self.devices)
+        """
+        zoom = max(0, min(zoom, self.max_zoom + 1))
+        x1, y1 = self._project(bounds['latrange2'], bounds['longrange1'])
+        x2, y2 = self._project(bounds['latrange1'], bounds['longrange2'])
+        return self._split([
+            node for node in self._levels[zoom]
+            if x1 <= node.x <= x2 and y1 <= node.y <= y2
+        ])
+    
+    def expand(self, cluster_id: int) -> Optional[Tuple[List[Dict], List[int], int]]:
+        """
+        Items a cluster splits into
+        
+        Returns:
+            Tuple of (cluster dicts, single device rows, zoom of the children),
+            or None for an unknown cluster id
+        """
+        if not 0 <= cluster_id < len(self._clusters):
+            return None
+        cluster = self._clusters[cluster_id]
+        return (*self._split(cluster.children), cluster.zoom + 1)
+
+# Cluster indexes shared by the requests of this worker, keyed by device
+# layers and provider tiles and sized by their estimated memory
+cluster_cache = L1Cache(max_bytes=Config.CLUSTER_CACHE_MAX_BYTES, ttl=Config.CLUSTER_CACHE_TTL)
+
+class CellStore:
+    """
+    Offline cell tower store built from the OpenCellID CSV dump
+    
+    The file holds one column per field, sorted by the slippy tile of each
+    tower (key y * 2**zoom + x, so the tiles of one row are contiguous),
+    behind a small JSON header. It is memory-mapped read-only: every worker
+    shares the same pages through the OS page cache, and a query costs two
+    binary searches per tile row of the box.
+    
+    The header also lists the coarse tiles (Config.CELL_STORE_COVERAGE_ZOOM)
+    holding any tower. Inside them an empty tile is a real answer, so only
+    areas the dump does not cover fall back to the API.
+    """
+    
+    MAGIC = b'CELLSTR1'
+    # Column names and array typecodes, in record order
+    COLUMNS = (('key', 'Q'), ('lat', 'f'), ('lon', 'f'), ('cell', 'q'), ('radio', 'B'), ('range', 'I'),
+               ('updated', 'I'), ('signal', 'h'), ('mcc', 'H'), ('net', 'H'), ('area', 'I'))
+    RECORD = struct.Struct('<' + ''.join(code for _, code in COLUMNS))
+    RADIOS = ('GSM', 'UMTS', 'CDMA', 'LTE', 'NR')
+    VENDORS = tuple(f"{radio} Tower" for radio in RADIOS)
+    
+    def __init__(self, path: str, recheck: float = Config.CELL_STORE_RECHECK):
+        self.path = path
+        self.recheck = recheck
+        self._lock = threading.Lock()
+        self._store = None  # (zoom, columns, coverage) of the mapped file
+        self._stamp = None
+        self._checked = -math.inf
+    
+    def _open(self) -> Optional[Tuple[int, Dict[str, memoryview], Optional[Tuple[int, frozenset]]]]:
+        """Map the store file, remapping it once a new ingest has replaced it"""
+        if time.monotonic() - self._checked < self.recheck:
+            return self._store
+        
+        with self._lock:
+            if time.monotonic() - self._checked >= self.recheck:
+                self._checked = time.monotonic()
+                try:
+                    stat = os.stat(self.path)
+                    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                    if stamp != self._stamp:
+                        self._store, self._stamp = self._map(), stamp
+                        logger.info(f"Cell store mapped: {len(self._store[1]['key'])} towers from {self.path}")
+                except FileNotFoundError:
+                    self._store = self._stamp = None
+                except (OSError, ValueError) as e:
+                    logger.error(f"Cell store {self.path} unusable: {str(e)}")
+                    self._store = self._stamp = None
+        return self._store
+    
+    def _map(self) -> Tuple[int, Dict[str, memoryview], Optional[Tuple[int, frozenset]]]:
+        """Memory-map the file and view each column in place"""
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError("not a cell store file")
+        
+        size, = struct.unpack_from('<I', mapped, len(self.MAGIC))
+        start = len(self.MAGIC) + 4
+        header = json.loads(mapped[start:start + size])
+        view = memoryview(mapped)
+        data = self._aligned(start + size)
+        columns = {}
+        for name, code in self.COLUMNS:
+            offset = data + header['offsets'][name]
+            columns[name] = view[offset:offset + header['count'] * array(code).itemsize].cast(code)
+        # Files written before coverage was recorded only cover tiles holding towers
+        coverage = (header['coverage_zoom'], frozenset(header['coverage'])) if 'coverage' in header else None
+        return header['zoom'], columns, coverage
+    
+    @staticmethod
+    def _aligned(offset: int) -> int:
+        """Round an offset up to the next multiple of 8"""
+        return (offset + 7) & ~7
+    
+    @property
+    def available(self) -> bool:
+        """Whether a store file is mapped"""
+        return self._open() is not None
+    
+    def query(self, bounds: Dict[str, float]) -> Optional[DeviceBatch]:
+        """
+        Get the towers inside a bounding box
+        
+        Returns:
+            Devices in the box, or None when no store file is available
+        """
+        store = self._open()
+        if store is None:
+            return None
+        zoom, columns, _ = store
+        
+        keys, lats, lons = columns['key'], columns['lat'], columns['lon']
+        n = 2 ** zoom
+        x1, y1 = TileMath.lat_lon_to_tile(bounds['latrange2'], bounds['longrange1'], zoom)
+        x2, y2 = TileMath.lat_lon_to_tile(bounds['latrange1'], bounds['longrange2'], zoom)
+        rows = []
+        for y in range(y1, y2 + 1):
+            start = bisect.bisect_left(keys, y * n + x1)
+            rows.extend(
+                i for i in range(start, bisect.bisect_right(keys, y * n + x2, start))
+                if bounds['latrange1'] <= round(lats[i], 6) <= bounds['latrange2']
+                and bounds['longrange1'] <= round(lons[i], 6) <= bounds['longrange2']
+            )
+        return self._devices(columns, rows)
+    
+    def tile(self, zoom: int, x: int, y: int) -> Optional[DeviceBatch]:
+        """
+        Get the towers of one tile
+        
+        Returns:
+            Towers of the tile (empty when the store covers it but it has
+            none), or None when no store file is available or the tile lies
+            outside the area the dump covers
+        """
+        store = self._open()
+        if store is None:
+            return None
+        store_zoom, columns, coverage = store
+        bounds = TileMath.tile_bounds(zoom, x, y)
+        if zoom != store_zoom:
+            devices = self.query(bounds)
+        else:
+            # Same tiling as the sort key: the tile is one contiguous slice
+            keys = columns['key']
+            key = y * 2 ** zoom + x
+            start = bisect.bisect_left(keys, key)
+            devices = self._devices(columns, range(start, bisect.bisect_right(keys, key, start)))
+        
+        if devices or self._covers(coverage, bounds):
+            return devices
+        return None
+    
+    @staticmethod
+    def _covers(coverage: Optional[Tuple[int, frozenset]], bounds: Dict[str, float]) -> bool:
+        """Whether the center of a box lies in a coarse tile holding towers"""
+        if coverage is None:
+            return False
+        zoom, keys = coverage
+        x, y = TileMath.lat_lon_to_tile((bounds['latrange1'] + bounds['latrange2']) / 2,
+                                        (bounds['longrange1'] + bounds['longrange2']) / 2, zoom)
+        return y * 2 ** zoom + x in keys
+    
+    def _devices(self, columns: Dict[str, memoryview], rows) -> DeviceBatch:
+        """Build the devices of some store rows"""
+        devices = DeviceBatch()
+        for i in rows:
+            updated = columns['updated'][i]
+            devices.add(
+                lat=round(columns['lat'][i], 6),
+                lon=round(columns['lon'][i], 6),
+                cell_id=f"{columns['mcc'][i]}-{columns['net'][i]}-{columns['area'][i]}-{columns['cell'][i]}",
+                signal=columns['signal'][i] or None,
+                accuracy=columns['range'][i] or None,
+                timestamp=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(updated)) if updated else None,
+                device_type=DeviceType.CELL_TOWER.value,
+                vendor=self.VENDORS[columns['radio'][i]]
+            )
+        return devices
+    
+    @classmethod
+    def _parse(cls, row: List[str], zoom: int) -> Optional[Tuple]:
+        """
+        Turn one dump row into a record, or None if it is malformed
+        
+        Dump columns: radio, mcc, net, area, cell, unit, lon, lat, range,
+        samples, changeable, created, updated, averageSignal
+        """
+        try:
+            radio = cls.RADIOS.index(row[0].upper())
+            mcc, net, area, cell = int(row[1]), int(row[2]), int(row[3]), int(row[4])
+            lon, lat = float(row[6]), float(row[7])
+            cell_range, updated = int(row[8]), int(row[12])
+            signal = int(row[13]) if len(row) > 13 and row[13] else 0
+        except (IndexError, ValueError):
+            return None
+        
+        if not (CoordinateValidator.validate(lat, lon)[0] and 0 <= mcc < 2 ** 16 and 0 <= net < 2 ** 16
+                and 0 <= area < 2 ** 32 and 0 <= cell < 2 ** 63):
+            return None
+        x, y = TileMath.lat_lon_to_tile(lat, lon, zoom)
+        return (y * 2 ** zoom + x, lat, lon, cell, radio, min(max(cell_range, 0), 2 ** 32 - 1),
+                min(max(updated, 0), 2 ** 32 - 1), min(max(signal, -2 ** 15), 2 ** 15 - 1), mcc, net, area)
+    
+    @classmethod
+    def _spill(cls, records: List[Tuple], path: str) -> str:
+        """Write a sorted run of records to a temporary file"""
+        records.sort()
+        with open(path, 'wb') as f:
+            f.write(b''.join(cls.RECORD.pack(*record) for record in records))
+        return path
+    
+    @classmethod
+    def _read_run(cls, path: str) -> Iterator[Tuple]:
+        """Read back the records of a sorted run"""
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(cls.RECORD.size * 4096)
+                if not block:
+                    return
+                yield from cls.RECORD.iter_unpack(block)
+    
+    @classmethod
+    def ingest(cls, lines, path: str, zoom: int = Config.CELL_STORE_ZOOM,
+               chunk_rows: int = Config.CELL_STORE_CHUNK_ROWS,
+               progress: Optional[Callable[[int], None]] = None) -> Tuple[int, int]:
+        """
+        Build a store file from the lines of an OpenCellID CSV dump
+        
+        Rows are parsed in chunks of chunk_rows, each chunk is sorted and
+        spilled to a run file, and the runs are merged straight into one
+        file per column, so memory stays bounded whatever the dump size.
+        The finished file atomically replaces path; running workers remap
+        it on their next recheck.
+        
+        Args:
+            lines: Text lines of the dump (with or without its header)
+            path: Store file to write
+            progress: Optional callback receiving the number of rows sorted so far
+        
+        Returns:
+            Tuple of (towers stored, malformed rows skipped)
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        stored = skipped = 0
+        # Coarse tiles holding towers, as keys at the coverage zoom
+        coverage_zoom = min(Config.CELL_STORE_COVERAGE_ZOOM, zoom)
+        shift, n = zoom - coverage_zoom, 2 ** zoom
+        coverage = set()
+        
+        with tempfile.TemporaryDirectory(dir=directory) as work:
+            runs, chunk = [], []
+            for row in csv.reader(lines):
+                record = cls._parse(row, zoom)
+                if record is None:
+                    skipped += row[:1] != ['radio']  # The header is not an error
+                    continue
+                y, x = divmod(record[0], n)
+                coverage.add((y >> shift) * 2 ** coverage_zoom + (x >> shift))
+                chunk.append(record)
+                if len(chunk) >= chunk_rows:
+                    runs.append(cls._spill(chunk, os.path.join(work, f'run-{len(runs)}')))
+                    stored += len(chunk)
+                    chunk = []
+                    if progress:
+                        progress(stored)
+            if chunk:
+                runs.append(cls._spill(chunk, os.path.join(work, f'run-{len(runs)}')))
+                stored += len(chunk)
+                if progress:
+                    progress(stored)
+            
+            # Merge the runs into one file per column
+            column_paths = [os.path.join(work, f'column-{name}') for name, _ in cls.COLUMNS]
+            column_files = [open(column_path, 'wb') for column_path in column_paths]
+            try:
+                buffers = [array(code) for _, code in cls.COLUMNS]
+                for record in heapq.merge(*(cls._read_run(run) for run in runs)):
+                    for buffer, value in zip(buffers, record):
+                        buffer.append(value)
+                    if len(buffers[0]) >= 65536:
+                        for buffer, column_file in zip(buffers, column_files):
+                            buffer.tofile(column_file)
+                            del buffer[:]
+                for buffer, column_file in zip(buffers, column_files):
+                    buffer.tofile(column_file)
+            finally:
+                for column_file in column_files:
+                    column_file.close()
+            
+            # Header, then the 8-byte aligned columns
+            offsets, offset = {}, 0
+            for (name, _), column_path in zip(cls.COLUMNS, column_paths):
+                offsets[name] = offset
+                offset = cls._aligned(offset + os.path.getsize(column_path))
+            header = json.dumps({'zoom': zoom, 'count': stored, 'offsets': offsets,
+                                 'coverage_zoom': coverage_zoom, 'coverage': sorted(coverage)}).encode()
+            
+            partial = os.path.join(work, 'store')
+            with open(partial, 'wb') as f:
+                f.write(cls.MAGIC + struct.pack('<I', len(header)) + header)
+                for column_path in column_paths:
+                    f.write(b'\0' * (cls._aligned(f.tell()) - f.tell()))
+                    with open(column_path, 'rb') as column_file:
+                        shutil.copyfileobj(column_file, f)
+            os.replace(partial, path)
+        
+        return stored, skipped
+
+cell_store = CellStore(Config.CELL_STORE_PATH)
+
+class DeviceStore:
+    """
+    Local WiFi and Bluetooth devices imported from WiGLE CSV exports
+    
+    Devices live in an SQLite file with one row per (layer, BSSID) and an
+    index on the slippy tile of each device (key y * 2**zoom + x), so area
+    queries are range scans per tile row. Repeated sightings are merged by
+    the database as they are imported, with the same rule as
+    DeviceDeduplicator: fields of the freshest sighting, strongest signal.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS devices (
+            layer TEXT NOT NULL,
+            bssid TEXT NOT NULL,
+            tile INTEGER NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            device_type TEXT NOT NULL,
+            timestamp TEXT,
+            ssid TEXT,
+            vendor TEXT,
+            signal INTEGER,
+            accuracy INTEGER,
+            PRIMARY KEY (layer, bssid)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS devices_tile ON devices (layer, tile);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+    UPSERT = """
+        INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (layer, bssid) DO UPDATE SET
+    """ + ''.join(
+        f"{column} = CASE WHEN excluded.timestamp > coalesce(devices.timestamp, '') "
+        f"THEN excluded.{column} ELSE devices.{column} END, "
+        for column in ('tile', 'lat', 'lon', 'device_type', 'timestamp', 'ssid', 'vendor', 'accuracy')
+    ) + """
+            signal = CASE WHEN devices.signal IS NULL OR excluded.signal > devices.signal
+                          THEN excluded.signal ELSE devices.signal END
+    """
+    COLUMNS = "lat, lon, device_type, timestamp, ssid, bssid, vendor, signal, accuracy"
+    # WiGLE export Type column -> device layer
+    LAYERS = {'WIFI': 'wifi', 'BT': 'bluetooth', 'BLE': 'bluetooth'}
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()  # One read-only connection per thread
+    
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """This thread's read-only connection, or None when no store file exists"""
+        if not os.path.exists(self.path):
+            return None
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.connection = connection
+        return connection
+    
+    def _select(self, where: str, params: Tuple) -> Optional[DeviceBatch]:
+        """Run a device query, or return None when no store file exists"""
+        connection = self._connection()
+        if connection is None:
+            return None
+        try:
+            rows = connection.execute(f"SELECT {self.COLUMNS} FROM devices WHERE {where}", params).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Device store {self.path} unusable: {str(e)}")
+            return None
+        
+        devices = DeviceBatch()
+        for lat, lon, device_type, timestamp, ssid, bssid, vendor, signal, accuracy in rows:
+            devices.add(lat=lat, lon=lon, device_type=device_type, timestamp=timestamp, ssid=ssid,
+                        bssid=bssid, vendor=vendor, signal=signal, accuracy=accuracy)
+        return devices
+    
+    def query(self, layer: str, bounds: Dict[str, float],
+              zoom: int = Config.DEVICE_STORE_ZOOM) -> Optional[DeviceBatch]:
+        """
+        Get the devices of a layer inside a bounding box
+        
+        Returns:
+            Devices in the box, or None when no store file is available
+        """
+        n = 2 ** zoom
+        x1, y1 = TileMath.lat_lon_to_tile(bounds['latrange2'], bounds['longrange1'], zoom)
+        x2, y2 = TileMath.lat_lon_to_tile(bounds['latrange1'], bounds['longrange2'], zoom)
+        ranges = [(y * n + x1, y * n + x2) for y in range(y1, y2 + 1)]
+        return self._select(
+            f"layer = ? AND ({' OR '.join(['tile BETWEEN ? AND ?'] * len(ranges))})"
+            " AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?",
+            (layer, *(key for pair in ranges for key in pair),
+             bounds['latrange1'], bounds['latrange2'], bounds['longrange1'], bounds['longrange2'])
+        )
+    
+    def tile(self, layer: str, zoom: int, x: int, y: int) -> Optional[DeviceBatch]:
+        """Get the devices of a layer in one tile, or None when no store file is available"""
+        if zoom != Config.DEVICE_STORE_ZOOM:
+            return self.query(layer, TileMath.tile_bounds(zoom, x, y))
+        return self._select("layer = ? AND tile = ?", (layer, y * 2 ** zoom + x))
+    
+    def search_bssid(self, bssid: str) -> Optional[DeviceBatch]:
+        """Get a WiFi network by BSSID, or None when no store file is available"""
+        return self._select("layer = 'wifi' AND bssid = ?", (bssid.upper(),))
+    
+    @classmethod
+    def _records(cls, rows: List[List[str]], columns: Dict[str, int], zoom: int) -> List[Tuple]:
+        """Classify a chunk of export rows into upsert records, dropping malformed ones"""
+        parsed = []
+        for row in rows:
+            try:
+                layer = cls.LAYERS.get(row[columns['Type']].upper())
+                lat = float(row[columns['CurrentLatitude']])
+                lon = float(row[columns['CurrentLongitude']])
+                bssid = row[columns['MAC']].upper()
+                signal = int(row[columns['RSSI']]) if row[columns['RSSI']] else None
+                accuracy = round(float(row[columns['AccuracyMeters']])) if row[columns['AccuracyMeters']] else None
+            except (IndexError, KeyError, ValueError):
+                continue
+            if layer and bssid and CoordinateValidator.validate(lat, lon)[0]:
+                seen = row[columns['FirstSeen']]
+                parsed.append((layer, bssid, lat, lon, row[columns['SSID']] or None,
+                               seen.replace(' ', 'T') + 'Z' if seen else None, signal, accuracy,
+                               row[columns['Type']].upper()))
+        
+        # Classify each layer's names in one batch, like a page of API results
+        names = {
+            layer: [record[4] or (record[1] if layer == 'bluetooth' else None)
+                    for record in parsed if record[0] == layer]
+            for layer in ('wifi', 'bluetooth')
+        }
+        device_types = {
+            'wifi': iter(DeviceClassifier.classify_many(names['wifi'], DeviceType.ROUTER.value)),
+            'bluetooth': iter(DeviceClassifier.classify_many(names['bluetooth'], DeviceType.BLUETOOTH.value))
+        }
+        
+        records = []
+        for layer, bssid, lat, lon, ssid, timestamp, signal, accuracy, kind in parsed:
+            x, y = TileMath.lat_lon_to_tile(lat, lon, zoom)
+            records.append((
+                layer, bssid, y * 2 ** zoom + x, lat, lon, next(device_types[layer]), timestamp,
+                ssid or (bssid if layer == 'bluetooth' else None),
+                kind if layer == 'bluetooth' else None,
+                signal, accuracy
+            ))
+        return records
+    
+    @classmethod
+    def import_csv(cls, lines, path: str, zoom: int = Config.DEVICE_STORE_ZOOM,
+                   chunk_rows: int = Config.DEVICE_STORE_CHUNK_ROWS,
+                   progress: Optional[Callable[[int], None]] = None) -> Tuple[int, int]:
+        """
+        Import one WiGLE CSV export into a store file, creating it if needed
+        
+        The export is read in chunks of chunk_rows: each chunk is classified
+        in one batch and upserted in one transaction, so memory stays bounded
+        whatever the export size, and duplicates are merged on disk. Running
+        workers see the new devices as soon as a chunk is committed.
+        
+        Args:
+            lines: Text lines of the export (WigleWifi pre-header optional)
+            path: Store file to write
+            progress: Optional callback receiving the number of rows read so far
+        
+        Returns:
+            Tuple of (sightings imported, rows skipped as malformed or not WiFi/Bluetooth)
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = sqlite3.connect(path)
+        imported = read = 0
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(cls.SCHEMA)
+            
+            columns, chunk = None, []
+            
+            def flush():
+                nonlocal imported
+                records = cls._records(chunk, columns, zoom)
+                with connection:
+                    connection.executemany(cls.UPSERT, records)
+                imported += len(records)
+                chunk.clear()
+                if progress:
+                    progress(read)
+            
+            for row in csv.reader(lines):
+                if columns is None:
+                    # Skip the WigleWifi pre-header up to the column names
+                    if 'MAC' in row:
+                        columns = {name: i for i, name in enumerate(row)}
+                    continue
+                chunk.append(row)
+                read += 1
+                if len(chunk) >= chunk_rows:
+                    flush()
+            if chunk:
+                flush()
+        finally:
+            connection.close()
+        
+        return imported, read - imported
+
+device_store = DeviceStore(Config.DEVICE_STORE_PATH)
+
+class WigleAPI(APIClient):
+    """WiGLE API client"""
+    
+    def __init__(self):
+        super().__init__('https://api.wigle.net/api/v2')
+        if Config.WIGLE_API_NAME and Config.WIGLE_API_TOKEN:
+            self.session.auth = (Config.WIGLE_API_NAME, Config.WIGLE_API_TOKEN)
+    
+    def iter_pages(self, endpoint: str, params: Dict,
+                   parse: Callable[[List[Dict]], DeviceBatch],
+                   keep_partial: bool = False) -> Iterator[DeviceBatch]:
+        """
+        Follow a search through its searchAfter cursor, one page at a time
+        
+        Stops after Config.WIGLE_MAX_PAGES pages or Config.WIGLE_MAX_RESULTS
+        results. A failed page or an exhausted request deadline is raised,
+        so that a truncated tile is never cached as a complete one. With
+        keep_partial, errors on later pages instead end the search with the
+        pages already yielded; errors on the first page are always raised so
+        an empty result is never mistaken for an empty area.
+        
+        Args:
+            endpoint: Search endpoint
+            params: Search parameters
+            parse: Converts a page of results into devices
+            keep_partial: End the search quietly when a later page fails
+        
+        Yields:
+            Devices of each page as soon as it arrives
+        
+        Raises:
+            DeadlineExceeded, CircuitOpenError, ProviderError: When a page fails
+                (only the first page with keep_partial)
+        """
+        params = dict(params, resultsPerPage=Config.WIGLE_RESULTS_PER_PAGE)
+        fetched = 0
+        for page in range(Config.WIGLE_MAX_PAGES):
+            try:
+                data = self._make_request('GET', endpoint, params=params)
+            except (DeadlineExceeded, CircuitOpenError, ProviderError) as e:
+                if page == 0 or not keep_partial:
+                    raise
+                logger.warning(f"WiGLE search truncated after {fetched} results: {str(e)}")
+                return
+            
+            results = data.get('results', [])[:Config.WIGLE_MAX_RESULTS - fetched]
+            if not results:
+                return
+            fetched += len(results)
+            yield parse(results)
+            
+            cursor = data.get('searchAfter')
+            if not cursor or fetched >= Config.WIGLE_MAX_RESULTS:
+                return
+            params['searchAfter'] = cursor
+        
+        logger.info(f"WiGLE search stopped at {Config.WIGLE_MAX_PAGES} pages ({fetched} results)")
+    
+    @staticmethod
+    def _parse_networks(results: List[Dict]) -> DeviceBatch:
+        """Convert a page of network search results"""
+        device_types = DeviceClassifier.classify_many(
+            [network.get('ssid') for network in results],
+            DeviceType.ROUTER.value
+        )
+        
+        devices = DeviceBatch()
+        for network, device_type in zip(results, device_types):
+            devices.add(
+                lat=network.get('trilat'),
+                lon=network.get('trilong'),
+                ssid=network.get('ssid'),
+                bssid=network.get('netid'),
+                vendor=network.get('vendor'),
+                signal=network.get('level'),
+                timestamp=network.get('lastupdt'),
+                device_type=device_type
+            )
+            
+        return devices
+    
+    @staticmethod
+    def _parse_bluetooth(results: List[Dict]) -> DeviceBatch:
+        """Convert a page of Bluetooth search results"""
+        names = [device.get('name') or device.get('netid') for device in results]
+        device_types = DeviceClassifier.classify_many(names, DeviceType.BLUETOOTH.value)
+        
+        devices = DeviceBatch()
+        for device, name, device_type in zip(results, names, device_types):
+            devices.add(
+                lat=device.get('trilat'),
+                lon=device.get('trilong'),
+                ssid=name,
+                bssid=device.get('netid'),
+                vendor=device.get('type') or DeviceType.BLUETOOTH.value.replace('_', ' ').title(),
+                signal=device.get('level'),
+                timestamp=device.get('lastupdt'),
+                device_type=device_type
+            )
+            
+        return devices
+    
+    def search_networks(self, lat: float, lon: float, radius: float = 0.01) -> DeviceBatch:
+        """Search for WiFi networks"""
+        bounds = CoordinateValidator.calculate_bounds(lat, lon, radius)
+        return tile_fetcher.collect('wifi', bounds, self.networks_tile)
+    
+    def networks_tile(self, zoom: int, x: int, y: int) -> DeviceBatch:
+        """Get the WiFi networks of one tile from the local store, falling back to WiGLE"""
+        devices = device_store.tile('wifi', zoom, x, y)
+        return devices if devices else self._search_networks_tile(zoom, x, y)
+    
+    @provider_cache.memoize(soft_ttl=300)
+    @coalesced
+    def _search_networks_tile(self, zoom: int, x: int, y: int) -> DeviceBatch:
+        """Search for WiFi networks inside one tile"""
+        bounds = TileMath.tile_bounds(zoom, x, y)
+        return DeviceDeduplicator.merge(self.iter_pages('/network/search', bounds, self._parse_networks))
+    
+    def search_bluetooth(self, lat: float, lon: float, radius: float = 0.01) -> DeviceBatch:
+        """Search for Bluetooth devices"""
+        bounds = CoordinateValidator.calculate_bounds(lat, lon, radius)
+        return tile_fetcher.collect('bluetooth', bounds, self.bluetooth_tile)
+    
+    def bluetooth_tile(self, zoom: int, x: int, y: int) -> DeviceBatch:
+        """Get the Bluetooth devices of one tile from the local store, falling back to WiGLE"""
+        devices = device_store.tile('bluetooth', zoom, x, y)
+        return devices if devices else self._search_bluetooth_tile(zoom, x, y)
+    
+    @provider_cache.memoize(soft_ttl=300)
+    @coalesced
+    def _search_bluetooth_tile(self, zoom: int, x: int, y: int) -> DeviceBatch:
+        """Search for Bluetooth devices inside one tile"""
+        bounds = TileMath.tile_bounds(zoom, x, y)
+        return DeviceDeduplicator.merge(self.iter_pages('/bluetooth/search', bounds, self._parse_bluetooth))
+    
+    def search_by_ssid(self, ssid: str) -> DeviceBatch:
+        """Search networks by SSID"""
+        return DeviceDeduplicator.merge(self.iter_pages('/network/search', {'ssid': ssid}, self._parse_networks,
+                                                        keep_partial=True))
+    
+    def search_by_bssid(self, bssid: str) -> DeviceBatch:
+        """Search networks by BSSID/MAC address"""
+        devices = device_store.search_bssid(bssid)
+        if devices:
+            return devices
+        return DeviceDeduplicator.merge(self.iter_pages('/network/search', {'netid': bssid}, self._parse_networks,
+                                                        keep_partial=True))
+
+class OpenCellIDAPI(APIClient):
+    """OpenCellID API client"""
+    
+    def __init__(self):
+        super().__init__('https://us1.unwiredlabs.com/v2')
+    
+    def search_towers(self, lat: float, lon: float) -> DeviceBatch:
+        """Search for cell towers"""
+        # Snap the point to its tile so nearby users share one cache entry
+        x, y = TileMath.lat_lon_to_tile(lat, lon, tile_fetcher.zoom)
+        return tile_fetcher.fetch('towers', x, y, self.towers_tile)
+    
+    def towers_tile(self, zoom: int, x: int, y: int) -> DeviceBatch:
+        """Get the towers of one tile from the offline store, falling back to the API outside its coverage"""
+        devices = cell_store.tile(zoom, x, y)
+        return devices if devices is not None else self._search_towers_tile(zoom, x, y)
+    
+    @provider_cache.memoize(soft_ttl=600)
+    @coalesced
+    def _search_towers_tile(self, zoom: int, x: int, y: int) -> DeviceBatch:
+        """Search for cell towers around the center of one tile"""
+        if not Config.OPENCELLID_API_KEY:
+            return DeviceBatch()
+        
+        bounds = TileMath.tile_bounds(zoom, x, y)
+        data = self._make_request('POST', '/process.php', json={
+            "token": Config.OPENCELLID_API_KEY,
+            "lat": (bounds['latrange1'] + bounds['latrange2']) / 2,
+            "lon": (bounds['longrange1'] + bounds['longrange2']) / 2,
+            "address": 0
+        })
+        
+        if data.get('status') != 'ok':
+            # An area without known towers is an answer, anything else a failure
+            if data.get('message') == 'No matches found':
+                return DeviceBatch()
+            raise ProviderError(f"OpenCellID lookup failed: {data.get('message', 'unknown error')}")
+            
+        devices = DeviceBatch()
+        for cell in data.get('cells', []):
+            devices.add(
+                lat=cell.get('lat'),
+                lon=cell.get('lon'),
+                cell_id=str(cell['cellid']) if cell.get('cellid') is not None else None,
+                signal=cell.get('signal'),
+                accuracy=cell.get('accuracy'),
+                timestamp=cell.get('updated'),
+                device_type=DeviceType.CELL_TOWER.value,
+                vendor=f"{cell.get('radio', 'Unknown').upper()} Tower"
+            )
+            
+        return devices
+
+class ShodanAPI(APIClient):
+    """Shodan API client"""
+    
+    def __init__(self):
+        super().__init__('https://api.shodan.io')
+    
+    def search_geo(self, lat: float, lon: float, radius: float = 1) -> DeviceBatch:
+        """Search for IoT devices by geolocation (radius in km)"""
+        bounds = CoordinateValidator.calculate_bounds(lat, lon, radius / 111)
+        return tile_fetcher.collect('iot', bounds, self._search_geo_tile)
+    
+    @provider_cache.memoize(soft_ttl=600)
+    @coalesced
+    def _search_geo_tile(self, zoom: int, x: int, y: int) -> DeviceBatch:
+        """Search for IoT devices in the circle enclosing one tile"""
+        if not Config.SHODAN_API_KEY:
+            return DeviceBatch()
+        
+        bounds = TileMath.tile_bounds(zoom, x, y)
+        lat = (bounds['latrange1'] + bounds['latrange2']) / 2
+        lon = (bounds['longrange1'] + bounds['longrange2']) / 2
+        # Half of the tile diagonal, in km, so the circle covers the whole tile
+        radius = math.hypot(
+            bounds['latrange2'] - bounds['latrange1'],
+            bounds['longrange2'] - bounds['longrange1']
+        ) / 2 * 111
+        
+        data = self._make_request('GET', '/shodan/host/search', params={
+            'key': Config.SHODAN_API_KEY,
+            'query': f'geo:{lat:.5f},{lon:.5f},{radius:.2f}',
+            'limit': 10
+        })
+            
+        devices = DeviceBatch()
+        for match in data.get('matches', []):
+            info = match.get('data', '')
+            device_type = DeviceClassifier.classify(info, DeviceType.IOT.value)
+            
+            location = match.get('location', {})
+            if location.get('latitude') and location.get('longitude'):
+                devices.add(
+                    lat=location['latitude'],
+                    lon=location['longitude'],
+                    ip=match.get('ip_str'),
+                    info=info[:100],
+                    device_type=device_type,
+                    vendor=match.get('org', 'Unknown'),
+                    timestamp=datetime.utcnow().isoformat() + 'Z'
+                )
+            
+        return devices
+
+# Initialize API clients
+wigle_api = WigleAPI()
+opencellid_api = OpenCellIDAPI()
+shodan_api = ShodanAPI()
+
+# Cached per-tile lookup of each device layer, taking (zoom, x, y)
+DEVICE_LAYERS = {
+    'wifi': wigle_api.networks_tile,
+    'bluetooth': wigle_api.bluetooth_tile,
+    'towers': opencellid_api.towers_tile,
+    'iot': shodan_api._search_geo_tile
+}
+
+# Device layers behind each /api/nearby mode
+MODE_LAYERS = {
+    'wifi': ('wifi', 'towers'),
+    'bluetooth': ('bluetooth',),
+    'all': ('wifi', 'bluetooth', 'towers', 'iot')
+}
+
+def layer_area(layer: str, lat: float, lon: float, radius: float) -> Tuple[Dict[str, float], bool]:
+    """
+    Area a device layer covers around a point, as in the provider searches
+    
+    Returns:
+        Tuple of (bounding box, whether results are clipped to it). Towers
+        cover the whole tile around the point and IoT devices a 1 km box.
+    """
+    if layer == 'towers':
+        return CoordinateValidator.calculate_bounds(lat, lon, 0), False
+    if layer == 'iot':
+        return CoordinateValidator.calculate_bounds(lat, lon, 1 / 111), True
+    return CoordinateValidator.calculate_bounds(lat, lon, radius), True
+
+def layer_circle(layer: str, radius: float) -> Optional[float]:
+    """
+    Radius in metres the devices of a layer are filtered to around a point
+    
+    Returns:
+        The search radius for WiFi and Bluetooth, 1 km for IoT devices as in
+        the Shodan search, and None for towers (the whole tile is kept)
+    """
+    if layer == 'towers':
+        return None
+    if layer == 'iot':
+        return 1000.0
+    return radius * GeoDistance.METRES_PER_DEGREE
+
+def requested_nearest(params: Dict) -> Tuple[Optional[int], bool]:
+    """
+    Parse the limit and sort parameters of a nearby search
+    
+    Args:
+        params: Query string arguments or JSON body
+    
+    Returns:
+        Tuple of (limit or None, whether to sort nearest first)
+    
+    Raises:
+        ValueError: For a limit below 1 or an unknown sort order
+    """
+    limit = params.get('limit')
+    if limit is not None:
+        if isinstance(limit, bool) or not str(limit).isdigit() or int(limit) < 1:
+            raise ValueError("limit must be a positive integer")
+        limit = int(limit)
+    sort = params.get('sort')
+    if sort not in (None, 'distance'):
+        raise ValueError("sort must be 'distance'")
+    return limit, sort == 'distance'
+
+class ProviderFanOut:
+    """Run independent provider lookups concurrently"""
+    
+    def __init__(self, max_workers: int = Config.PROVIDER_WORKERS):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='provider'
+        )
+    
+    @staticmethod
+    def _timed_call(fn: Callable[[], DeviceBatch],
+                    deadline: Optional[Deadline]) -> Tuple[DeviceBatch, float, CallStats]:
+        """
+        Run a provider call under a deadline
+        
+        Returns:
+            Tuple of (devices, duration in milliseconds, statistics of the
+            cache and upstream HTTP attempts)
+        """
+        started = time.monotonic()
+        stats = CallStats()
+        token = current_call_stats.set(stats)
+        try:
+            if deadline is None:
+                devices = fn()
+            else:
+                with deadline.activate():
+                    devices = fn()
+        finally:
+            current_call_stats.reset(token)
+        return devices, (time.monotonic() - started) * 1000, stats
+    
+    def run(self, calls: Dict[str, Callable[[], DeviceBatch]],
+            deadline: Optional[Deadline] = None) -> Tuple[DeviceBatch, Dict[str, Dict]]:
+        """
+        Execute provider calls in parallel
+        
+        Args:
+            calls: Mapping of provider name to a zero-argument callable
+            deadline: Optional time budget shared by all calls
+        
+        Returns:
+            Tuple of (combined devices with duplicates across providers merged,
+            per-provider status block). A failing
+            provider contributes no devices and is reported with status 'error';
+            one that misses the deadline is dropped with status 'timed_out' and
+            one whose circuit breaker is open with status 'circuit_open'.
+            Successful providers report the age of the cached data they served
+            and the number of upstream HTTP attempts they made.
+        """
+        futures = {
+            name: self.executor.submit(self._timed_call, fn, deadline)
+            for name, fn in calls.items()
+        }
+        
+        if deadline is not None:
+            wait(futures.values(), timeout=deadline.remaining())
+        
+        devices = DeviceDeduplicator()
+        providers = {}
+        for name, future in futures.items():
+            if deadline is not None and not future.done():
+                providers[name] = self._drop_late(name, future, deadline)
+                continue
+            
+            result, providers[name] = self._outcome(name, future)
+            devices.feed(result)
+        
+        return devices.batch, providers
+    
+    def stream(self, calls: Dict[str, Callable[[], DeviceBatch]],
+               deadline: Optional[Deadline] = None):
+        """
+        Execute provider calls in parallel, yielding each one as it finishes
+        
+        Args:
+            calls: Mapping of provider name to a zero-argument callable
+            deadline: Optional time budget shared by all calls
+        
+        Yields:
+            Tuples of (provider name, devices, status block) in completion
+            order. Providers still running at the deadline are yielded last,
+            without devices and with status 'timed_out'.
+        """
+        futures = {
+            self.executor.submit(self._timed_call, fn, deadline): name
+            for name, fn in calls.items()
+        }
+        
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=deadline.remaining() if deadline else None):
+                pending.discard(future)
+                yield (futures[future], *self._outcome(futures[future], future))
+        except TimeoutError:
+            for future in futures:
+                if future in pending:
+                    yield futures[future], DeviceBatch(), self._drop_late(futures[future], future, deadline)
+    
+    @staticmethod
+    def _drop_late(name: str, future, deadline: Deadline) -> Dict:
+        """Give up on a provider that missed the deadline"""
+        # Its HTTP timeout is already clamped, so the thread frees up shortly
+        future.cancel()
+        logger.warning(f"Provider '{name}' dropped after {deadline.seconds}s deadline")
+        return {"status": "timed_out"}
+    
+    @staticmethod
+    def _outcome(name: str, future) -> Tuple[DeviceBatch, Dict]:
+        """Devices and status block of a finished provider call"""
+        try:
+            result, elapsed_ms, stats = future.result()
+        except DeadlineExceeded:
+            return DeviceBatch(), {"status": "timed_out"}
+        except CircuitOpenError:
+            return DeviceBatch(), {"status": "circuit_open"}
+        except ProviderError as e:
+            logger.warning(f"Provider '{name}' failed: {str(e)}")
+            return DeviceBatch(), {"status": "error", "error": type(e).__name__}
+        except Exception as e:
+            logger.error(f"Provider '{name}' failed: {str(e)}", exc_info=True)
+            return DeviceBatch(), {"status": "error", "error": type(e).__name__}
+        
+        if isinstance(result, list):
+            result = DeviceBatch.from_devices(result)
+        return result, {
+            "status": "ok",
+            "count": len(result),
+            "elapsed_ms": round(elapsed_ms, 1),
+            "age_s": round(stats.max_age, 1),
+            "upstream_attempts": len(stats.attempts)
+        }
+    
+    @staticmethod
+    def is_partial(providers: Dict[str, Dict]) -> bool:
+        """Check whether any provider in a status block did not succeed"""
+        return any(p["status"] != "ok" for p in providers.values())
+
+provider_fanout = ProviderFanOut()
+
+class UpstreamBudget:
+    """
+    Pay-as-you-go rate limit on upstream HTTP attempts
+    
+    Callers wait until the budget is out of debt, then the attempts a call
+    really made are charged afterwards, so tiles served from a cache cost
+    nothing. The average rate stays within `rate` attempts per second,
+    with bursts of at most one call per concurrent caller.
+    """
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        """Block until another call may start"""
+        while True:
+            with self._lock:
+                delay = self._next - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+    
+    def charge(self, attempts: int):
+        """Account for the upstream attempts of a finished call"""
+        with self._lock:
+            # Idle time is not saved up as credit
+            self._next = max(self._next, time.monotonic()) + attempts * self.interval
+
+class CacheWarmer:
+    """
+    Fill the provider caches for the tiles of some regions ahead of traffic
+    
+    Tiles go through the same per-layer lookups as requests (DEVICE_LAYERS),
+    so they land in the shared provider cache, with a bounded number of
+    workers and one UpstreamBudget per provider. Stale entries are refreshed
+    synchronously (refresh_inline) so every upstream call is charged to the
+    budget. Finished tiles are appended to a state file so an interrupted
+    run can resume where it stopped.
+    """
+    
+    # Upstream provider behind each device layer, for the rate budgets
+    PROVIDERS = {'wifi': 'wigle', 'bluetooth': 'wigle', 'towers': 'opencellid', 'iot': 'shodan'}
+    
+    def __init__(self, layers: List[str], workers: int = Config.WARM_CACHE_WORKERS,
+                 rates: Dict[str, float] = Config.WARM_CACHE_RATES,
+                 state_path: Optional[str] = None, zoom: int = Config.TILE_ZOOM):
+        self.layers = layers
+        self.workers = workers
+        self.budgets = {provider: UpstreamBudget(rate) for provider, rate in rates.items()}
+        self.state_path = state_path
+        self.zoom = zoom
+    
+    @staticmethod
+    def cover_geojson(data: Dict, zoom: int) -> set:
+        """
+        Tiles covering the geometries of a GeoJSON object
+        
+        Points cover their tile and lines the tiles they cross. Polygons
+        cover the tiles crossed by their rings plus the tiles whose center
+        lies inside them (even-odd rule, so holes are left out).
+        
+        Raises:
+            ValueError: For objects that are not GeoJSON geometries
+        """
+        kind = data.get('type') if isinstance(data, dict) else None
+        if kind == 'FeatureCollection':
+            return set().union(*(CacheWarmer.cover_geojson(f, zoom) for f in data.get('features', [])))
+        if kind == 'Feature':
+            return CacheWarmer.cover_geojson(data['geometry'], zoom) if data.get('geometry') else set()
+        if kind == 'GeometryCollection':
+            return set().union(*(CacheWarmer.cover_geojson(g, zoom) for g in data.get('geometries', [])))
+        
+        coordinates = data.get('coordinates') if isinstance(data, dict) else None
+        shapes = {
+            'Point': lambda c: [[c]],
+            'MultiPoint': lambda c: [[point] for point in c],
+            'LineString': lambda c: [c],
+            'MultiLineString': lambda c: c,
+            'Polygon': lambda c: c,
+            'MultiPolygon': lambda c: [ring for polygon in c for ring in polygon]
+        }
+        if kind not in shapes or not isinstance(coordinates, list):
+            raise ValueError(f"Unsupported GeoJSON object: {kind}")
+        
+        # GeoJSON positions are [lon, lat]
+        lines = [[(point[1], point[0]) for point in line] for line in shapes[kind](coordinates)]
+        tiles = set()
+        for line in lines:
+            tiles.update(Corridor(line, 0).tiles(zoom))
+        
+        polygons = {'Polygon': [coordinates], 'MultiPolygon': coordinates}.get(kind, [])
+        for polygon in polygons:
+            rings = [[(point[1], point[0]) for point in ring] for ring in polygon]
+            lats = [lat for lat, _ in rings[0]]
+            lons = [lon for _, lon in rings[0]]
+            box = {'latrange1': min(lats), 'latrange2': max(lats), 'longrange1': min(lons), 'longrange2': max(lons)}
+            for x, y in TileMath.tiles_for_bounds(box, zoom):
+                bounds = TileMath.tile_bounds(zoom, x, y)
+                center = ((bounds['latrange1'] + bounds['latrange2']) / 2,
+                          (bounds['longrange1'] + bounds['longrange2']) / 2)
+                if CacheWarmer._inside(center, rings):
+                    tiles.add((x, y))
+        return tiles
+    
+    @staticmethod
+    def _inside(point: Tuple[float, float], rings: List[List[Tuple[float, float]]]) -> bool:
+        """Even-odd point in polygon test over all rings"""
+        lat, lon = point
+        inside = False
+        for ring in rings:
+            for (lat1, lon1), (lat2, lon2) in zip(ring, ring[1:] + ring[:1]):
+                if (lat1 > lat) != (lat2 > lat) and lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1):
+                    inside = not inside
+        return inside
+    
+    def _finished(self) -> set:
+        """Tiles recorded by earlier runs whose cache entries cannot have expired yet"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return set()
+        since = time.time() - Config.CACHE_HARD_TTL
+        finished = set()
+        with open(self.state_path) as f:
+            for line in f:
+                fields = line.split()
+                try:
+                    if len(fields) == 5 and float(fields[4]) >= since:
+                        finished.add(tuple(fields[:4]))
+                except ValueError:
+                    continue
+        return finished
+    
+    def _warm(self, layer: str, x: int, y: int) -> int:
+        """Look up one tile through the provider cache, returning its upstream attempts"""
+        budget = self.budgets.get(self.PROVIDERS.get(layer))
+        if budget is not None:
+            budget.wait()
+        
+        stats = CallStats()
+        token = current_call_stats.set(stats)
+        inline = refresh_inline.set(True)
+        try:
+            DEVICE_LAYERS[layer](self.zoom, x, y)
+        finally:
+            refresh_inline.reset(inline)
+            current_call_stats.reset(token)
+            if budget is not None:
+                budget.charge(len(stats.attempts))
+        return len(stats.attempts)
+    
+    def run(self, tiles, resume: bool = False,
+            progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+        """
+        Warm every layer of the given tiles
+        
+        Args:
+            tiles: Tile (x, y) pairs at self.zoom
+            resume: Skip tiles finished by an earlier run less than
+                Config.CACHE_HARD_TTL ago (otherwise the state file is
+                started afresh)
+            progress: Optional callback receiving the counters after each tile
+        
+        Returns:
+            Counters: total, skipped, done, failed and upstream attempts
+        """
+        finished = self._finished() if resume else set()
+        jobs = [
+            (layer, x, y) for layer in self.layers for x, y in sorted(tiles)
+            if (layer, str(self.zoom), str(x), str(y)) not in finished
+        ]
+        counters = {"total": len(self.layers) * len(tiles), "skipped": len(self.layers) * len(tiles) - len(jobs),
+                    "done": 0, "failed": 0, "attempts": 0}
+        
+        state = None
+        if self.state_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+            state = open(self.state_path, 'a' if resume else 'w')
+        
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='warm') as executor:
+                futures = {executor.submit(self._warm, *job): job for job in jobs}
+                for future in as_completed(futures):
+                    layer, x, y = futures[future]
+                    try:
+                        counters["attempts"] += future.result()
+                        counters["done"] += 1
+                        if state is not None:
+                            state.write(f"{layer} {self.zoom} {x} {y} {time.time():.0f}\n")
+                            state.flush()
+                    except Exception as e:
+                        counters["failed"] += 1
+                        logger.warning(f"Warming {layer} tile {self.zoom}/{x}/{y} failed: {str(e)}")
+                    if progress:
+                        progress(counters)
+        finally:
+            if state is not None:
+                state.close()
+        return counters
+
+def get_cluster_index(layers: Tuple[str, ...], bounds: Dict[str, float],
+                      deadline: Optional[Deadline] = None) -> Tuple[ClusterIndex, Dict[str, Dict]]:
+    """
+    Cluster index over the whole provider tiles covering a bounding box
+    
+    Indexes are built once per set of layers and tiles and reused by this
+    worker for Config.CLUSTER_CACHE_TTL, so panning, zooming and expanding
+    clusters in the same area do not rebuild them. Indexes missing a
+    provider are not reused.
+    
+    Returns:
+        Tuple of (index, per-provider status block of the build)
+    """
+    tiles = tuple(TileMath.tiles_for_bounds(bounds, tile_fetcher.zoom))
+    key = (layers, tiles)
+    cached = cluster_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    results = {}
+    providers = {}
+    calls = {
+        layer: (lambda layer=layer: tile_fetcher.fetch_many(layer, tiles, DEVICE_LAYERS[layer]))
+        for layer in layers
+    }
+    for layer, devices, result in provider_fanout.stream(calls, deadline):
+        results[layer] = devices
+        providers[layer] = result
+    
+    index = ClusterIndex({layer: results[layer] for layer in layers})
+    providers = {layer: providers[layer] for layer in layers}
+    if not ProviderFanOut.is_partial(providers):
+        cluster_cache.set(key, (index, providers), index.nbytes)
+    return index, providers
+
+class ResponseEncoder:
+    """
+    Encode API responses containing device lists straight to JSON bytes
+    
+    With orjson installed the whole response is dumped by orjson. Otherwise
+    devices are written from the batch columns: every field is turned into
+    ready-made "key":value fragments column by column (repeated strings such
+    as device types, vendors and icons are escaped once) and joined per row.
+    """
+    
+    def __init__(self, use_orjson: bool = orjson is not None):
+        self.use_orjson = use_orjson
+    
+    def encode(self, payload: Dict, devices: Optional[DeviceBatch] = None) -> bytes:
+        """
+        Encode a response, placing devices first under 'devices'
+        
+        Args:
+            payload: Remaining JSON-serializable response fields
+            devices: Devices to include (omitted when None)
+        """
+        if self.use_orjson:
+            if devices is not None:
+                payload = {"devices": devices.to_dicts(), **payload}
+            return orjson.dumps(payload, default=str)
+        
+        rest = json.dumps(payload, default=str, separators=(',', ':')).encode()
+        if devices is None:
+            return rest
+        body = b'{"devices":' + self.encode_devices(devices)
+        return body + (b'}' if rest == b'{}' else b',' + rest[1:])
+    
+    @staticmethod
+    def encode_devices(devices: DeviceBatch) -> bytes:
+        """Encode a batch as a JSON array of device objects (None fields omitted)"""
+        quote = json.encoder.encode_basestring_ascii
+        columns = []
+        for field in DeviceBatch.FIELDS:
+            prefix = f'"{field}":'
+            values = devices.column(field)
+            if field in DeviceBatch.NUMERIC_FIELDS:
+                columns.append([None if v is None else prefix + repr(v) for v in values])
+                continue
+            
+            fragments = {}
+            column = []
+            for value in values:
+                if value is None:
+                    column.append(None)
+                    continue
+                fragment = fragments.get(value)
+                if fragment is None:
+                    encoded = quote(value) if isinstance(value, str) else json.dumps(value)
+                    fragment = fragments[value] = prefix + encoded
+                column.append(fragment)
+            columns.append(column)
+        
+        icons = {
+            device_type: '"icon":' + quote(DeviceClassifier.get_icon(device_type))
+            for device_type in set(devices.device_type)
+        }
+        columns.append([icons[device_type] for device_type in devices.device_type])
+        
+        rows = ['{' + ','.join([f for f in row if f is not None]) + '}' for row in zip(*columns)]
+        return ('[' + ','.join(rows) + ']').encode()
+
+response_encoder = ResponseEncoder()
+
+class TileEncoder:
+    """
+    Encode the device layers of one slippy-map tile
+    
+    Mapbox Vector Tiles (protobuf, spec version 2) are written by hand: one
+    layer per device layer and one point feature per device, with every
+    non-empty field as a feature property. Device types, vendors and other
+    repeated values are stored once per layer in the value table.
+    """
+    
+    PROPERTIES = tuple(field for field in DeviceBatch.FIELDS
+                       if field not in ('lat', 'lon') + DeviceBatch.COMPUTED_FIELDS)
+    
+    def __init__(self, extent: int = Config.VECTOR_TILE_EXTENT):
+        self.extent = extent
+    
+    @staticmethod
+    def _varint(value: int) -> bytes:
+        out = bytearray()
+        while value > 0x7f:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+        return bytes(out)
+    
+    @staticmethod
+    def _zigzag(value: int) -> int:
+        return (value << 1) ^ (value >> 63)
+    
+    @classmethod
+    def _field(cls, number: int, payload: bytes) -> bytes:
+        """Length-delimited protobuf field"""
+        return cls._varint(number << 3 | 2) + cls._varint(len(payload)) + payload
+    
+    @classmethod
+    def _value(cls, value) -> bytes:
+        """Encode a Value message (string, sint64 or double)"""
+        if isinstance(value, str):
+            return cls._field(1, value.encode('utf-8', 'surrogatepass'))
+        if isinstance(value, int):
+            return cls._varint(6 << 3) + cls._varint(cls._zigzag(value))
+        return cls._varint(3 << 3 | 1) + struct.pack('<d', value)
+    
+    def _project(self, lats, lons, zoom: int, x: int, y: int) -> List[Tuple[int, int]]:
+        """Web Mercator position of each coordinate in tile coordinates"""
+        n = 2 ** zoom
+        points = []
+        for lat, lon in zip(lats, lons):
+            lat = max(-TileMath.MAX_LATITUDE, min(lat, TileMath.MAX_LATITUDE))
+            tx = (lon + 180.0) / 360.0 * n - x
+            ty = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n - y
+            points.append((round(tx * self.extent), round(ty * self.extent)))
+        return points
+    
+    def encode_layer(self, name: str, devices: DeviceBatch, zoom: int, x: int, y: int) -> bytes:
+        """Encode one Layer message"""
+        columns = [(field, devices.column(field)) for field in self.PROPERTIES]
+        rows = [
+            {field: column[i] for field, column in columns if column[i] is not None}
+            for i in range(len(devices))
+        ]
+        points = self._project(devices.lat, devices.lon, zoom, x, y)
+        return self._encode_points(name, points, rows)
+    
+    def encode_clusters(self, clusters: List[Dict], zoom: int, x: int, y: int) -> bytes:
+        """
+        Encode a 'clusters' Layer message
+        
+        Each cluster has its id, count and expansion_zoom as properties, plus
+        one 'count_<device type>' property per device type it contains.
+        """
+        rows = [
+            {
+                "cluster_id": cluster["id"],
+                "count": cluster["count"],
+                "expansion_zoom": cluster["expansion_zoom"],
+                **{f"count_{device_type}": count for device_type, count in cluster["types"].items()}
+            }
+            for cluster in clusters
+        ]
+        points = self._project([c["lat"] for c in clusters], [c["lon"] for c in clusters], zoom, x, y)
+        return self._encode_points('clusters', points, rows)
     
-    @cache.memoize(timeout=600)
-    def search_towers(self, lat: float, lon: float) -> List[Device]:
-        """Search for cell towers"""
-        if not Config.OPENCELLID_API_KEY:
-            return []
-            
-        data = self._make_request('POST', '/process.php', json={
-            "token": Config.OPENCELLID_API_KEY,
-            "lat": lat,
-            "lon": lon,
-            "address": 0
-        })
+    def _encode_points(self, name: str, points: List[Tuple[int, int]], rows: List[Dict]) -> bytes:
+        """Encode a Layer message of point features with the given properties"""
+        keys = {}
+        values = {}
+        features = []
         
-        if not data or data.get('status') != 'ok':
-            return []
-            
-        devices = []
-        for cell in data.get('cells', []):
-            devices.append(Device(
-                lat=cell.get('lat'),
-                lon=cell.get('lon'),
-                cell_id=str(cell.get('cellid')),
-                signal=cell.get('signal'),
-                accuracy=cell.get('accuracy'),
-                timestamp=cell.get('updated'),
-                device_type=DeviceType.CELL_TOWER.value,
-                vendor=f"{cell.get('radio', 'Unknown').upper()} Tower"
-            ))
+        for (px, py), row in zip(points, rows):
+            tags = []
+            for field, value in row.items():
+                tags.append(keys.setdefault(field, len(keys)))
+                tags.append(values.setdefault((type(value), value), len(values)))
             
-        return devices
-
-class ShodanAPI(APIClient):
-    """Shodan API client"""
+            geometry = b''.join(self._varint(v) for v in (9, self._zigzag(px), self._zigzag(py)))
+            features.append(self._field(2, b''.join([
+                self._field(2, b''.join(self._varint(tag) for tag in tags)),
+                self._varint(3 << 3) + self._varint(1),  # type: POINT
+                self._field(4, geometry)
+            ])))
+        
+        return b''.join([
+            self._varint(15 << 3) + self._varint(2),  # version
+            self._field(1, name.encode()),
+            *features,
+            *(self._field(3, key.encode()) for key in keys),
+            *(self._field(4, self._value(value)) for _, value in values),
+            self._varint(5 << 3) + self._varint(self.extent)
+        ])
     
-    def __init__(self):
-        super().__init__('https://api.shodan.io')
+    def encode_mvt(self, layers: Dict[str, DeviceBatch], zoom: int, x: int, y: int,
+                   clusters: Optional[List[Dict]] = None) -> bytes:
+        """Encode a vector tile with one layer per non-empty device layer (and clusters)"""
+        tile = b''.join(
+            self._field(3, self.encode_layer(name, devices, zoom, x, y))
+            for name, devices in layers.items() if len(devices)
+        )
+        if clusters:
+            tile += self._field(3, self.encode_clusters(clusters, zoom, x, y))
+        return tile
     
-    @cache.memoize(timeout=600)
-    def search_geo(self, lat: float, lon: float, radius: float = 1) -> List[Device]:
-        """Search for IoT devices by geolocation"""
-        if not Config.SHODAN_API_KEY:
-            return []
-            
-        data = self._make_request('GET', '/shodan/host/search', params={
-            'key': Config.SHODAN_API_KEY,
-            'query': f'geo:{lat},{lon},{radius}',
-            'limit': 10
-        })
+    @staticmethod
+    def encode_geojson(layers: Dict[str, DeviceBatch], clusters: Optional[List[Dict]] = None) -> bytes:
+        """Encode the layers (and clusters, with layer 'clusters') as one FeatureCollection"""
+        features = [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [cluster["lon"], cluster["lat"]]},
+                "properties": {
+                    "layer": "clusters",
+                    "cluster_id": cluster["id"],
+                    "count": cluster["count"],
+                    "types": cluster["types"],
+                    "expansion_zoom": cluster["expansion_zoom"]
+                }
+            }
+            for cluster in clusters or ()
+        ]
+        for name, devices in layers.items():
+            for row in devices.to_dicts():
+                lon, lat = row.pop('lon'), row.pop('lat')
+                features.append({
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                    "properties": {"layer": name, **row}
+                })
         
-        if not data:
-            return []
-            
-        devices = []
-        for match in data.get('matches', []):
-            info = match.get('data', '')
-            device_type = DeviceClassifier.classify(info, DeviceType.IOT.value)
-            
-            location = match.get('location', {})
-            if location.get('latitude') and location.get('longitude'):
-                devices.append(Device(
-                    lat=location['latitude'],
-                    lon=location['longitude'],
-                    ip=match.get('ip_str'),
-                    info=info[:100],
-                    device_type=device_type,
-                    vendor=match.get('org', 'Unknown'),
-                    timestamp=datetime.utcnow().isoformat() + 'Z'
-                ))
-            
-        return devices
+        payload = {"type": "FeatureCollection", "features": features}
+        if orjson is not None:
+            return orjson.dumps(payload, default=str)
+        return json.dumps(payload, default=str, separators=(',', ':')).encode()
 
-# Initialize API clients
-wigle_api = WigleAPI()
-opencellid_api = OpenCellIDAPI()
-shodan_api = ShodanAPI()
+tile_encoder = TileEncoder()
+
+def json_response(payload: Dict, devices: Optional[DeviceBatch] = None, status: int = 200):
+    """
+    Build a JSON response through the response encoder
+    
+    The time spent encoding is reported in the X-Serialization-Time header
+    (milliseconds) and as a Server-Timing entry.
+    """
+    started = time.perf_counter()
+    body = response_encoder.encode(payload, devices)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    
+    response = app.response_class(body, status=status, mimetype='application/json')
+    response.headers['X-Serialization-Time'] = f"{elapsed_ms:.2f}ms"
+    response.headers['Server-Timing'] = f"serialize;dur={elapsed_ms:.2f}"
+    return response
+
+STREAM_MIMETYPES = ('application/x-ndjson', 'text/event-stream')
+
+def requested_stream_format() -> Optional[str]:
+    """Streaming mimetype preferred by the Accept header, or None for plain JSON"""
+    best = request.accept_mimetypes.best_match(('application/json',) + STREAM_MIMETYPES)
+    return best if best in STREAM_MIMETYPES else None
+
+def stream_response(calls: Dict[str, Callable[[], DeviceBatch]], deadline: Deadline,
+                    mimetype: str):
+    """
+    Stream provider results as NDJSON lines or Server-Sent Events
+    
+    Every provider produces one 'devices' frame as soon as it finishes (with
+    no devices when it failed), followed by a 'summary' frame carrying the
+    same fields as the plain JSON response apart from the devices.
+    """
+    def frame(event: str, payload: Dict, devices: Optional[DeviceBatch] = None) -> bytes:
+        body = response_encoder.encode({"type": event, **payload}, devices)
+        if mimetype == 'text/event-stream':
+            return b'event: ' + event.encode() + b'\ndata: ' + body + b'\n\n'
+        return body + b'\n'
+    
+    def generate():
+        merged = DeviceDeduplicator()
+        providers = {}
+        try:
+            for name, devices, result in provider_fanout.stream(calls, deadline):
+                # Devices already sent by an earlier provider are not repeated
+                sent = len(merged.batch)
+                merged.feed(devices)
+                devices = merged.batch.take(range(sent, len(merged.batch)))
+                providers[name] = result
+                yield frame('devices', {"provider": name, "count": len(devices), "result": result}, devices)
+        except Exception as e:
+            logger.error(f"Error streaming providers: {str(e)}", exc_info=True)
+            yield frame('error', {"error": "Internal server error", "status": "error"})
+            return
+        
+        providers = {name: providers[name] for name in calls}
+        yield frame('summary', {
+            "count": len(merged.batch),
+            "providers": providers,
+            "partial": ProviderFanOut.is_partial(providers),
+            "timestamp": datetime.utcnow().isoformat() + 'Z',
+            "status": "success"
+        })
+    
+    response = app.response_class(generate(), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Let nginx pass every frame through instead of buffering the response
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 # Decorators
 def require_api_key(f):
@@ -546,7 +4039,13 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat() + 'Z',
-        "version": "2.0"
+        "version": "2.0",
+        "cache": provider_cache.stats(),
+        "upstream": {
+            name: {**client.transport.stats(), "circuit": client.breaker.stats()}
+            for name, client in (('wigle', wigle_api), ('opencellid', opencellid_api),
+                                 ('shodan', shodan_api))
+        }
     })
 
 @app.route('/api/nearby')
@@ -560,31 +4059,100 @@ def nearby():
         lat (float): Latitude
         lon (float): Longitude
         mode (str): 'wifi', 'bluetooth', or 'all' (default: 'wifi')
-        radius (float): Search radius in degrees (default: 0.01)
+        radius (float): Search radius in degrees of latitude (default: 0.01)
+        sort (str): 'distance' to order devices nearest first
+        limit (int): Keep only the nearest devices
+    
+        zoom (int): Map zoom; when given, dense devices are grouped into clusters
+    
+    Devices are filtered to the true circle of the radius and carry their
+    distance_m from the point (with zoom, the devices left outside clusters;
+    sort and limit apply to those). Clients accepting application/x-ndjson or
+    text/event-stream receive each provider's devices as soon as they
+    arrive, see stream_response(); sort and limit are rejected there, since
+    frames are sent before the nearest devices are known.
     """
     lat = request.args.get('lat', type=float)
     lon = request.args.get('lon', type=float)
     mode = request.args.get('mode', 'wifi')
     radius = min(request.args.get('radius', 0.01, type=float), Config.MAX_SEARCH_RADIUS)
+    try:
+        limit, sort = requested_nearest(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e), "status": "invalid_input"}), 400
     
     logger.info(f"Nearby search: lat={lat}, lon={lon}, mode={mode}, radius={radius}")
     
-    devices = []
+    zoom = request.args.get('zoom', type=int)
+    if zoom is not None:
+        bounds = CoordinateValidator.calculate_bounds(lat, lon, radius)
+        try:
+            index, providers = get_cluster_index(
+                MODE_LAYERS.get(mode, MODE_LAYERS['wifi']), bounds, Deadline.from_request()
+            )
+            clusters, points = index.get_clusters(bounds, zoom)
+        except Exception as e:
+            logger.error(f"Error in clustered nearby search: {str(e)}", exc_info=True)
+            return jsonify({
+                "error": "Internal server error",
+                "status": "error"
+            }), 500
+        
+        # Single devices are cut, measured and ranked like unclustered results
+        devices = GeoDistance.nearest(DeviceBatch.concat(
+            GeoDistance.measure(index.devices.take([i for i in points if index.layers[i] == layer]),
+                                lat, lon, layer_circle(layer, radius))
+            for layer in dict.fromkeys(index.layers[i] for i in points)
+        ), limit, sort)
+        return json_response({
+            "clusters": clusters,
+            "count": len(devices) + sum(cluster["count"] for cluster in clusters),
+            "zoom": zoom,
+            "providers": providers,
+            "partial": ProviderFanOut.is_partial(providers),
+            "timestamp": datetime.utcnow().isoformat() + 'Z',
+            "status": "success"
+        }, devices)
+    
+    if mode == 'bluetooth':
+        # Bluetooth only
+        calls = {
+            'bluetooth': lambda: wigle_api.search_bluetooth(lat, lon, radius)
+        }
+    elif mode == 'all':
+        # All device types
+        calls = {
+            'wifi': lambda: wigle_api.search_networks(lat, lon, radius),
+            'bluetooth': lambda: wigle_api.search_bluetooth(lat, lon, radius),
+            'towers': lambda: opencellid_api.search_towers(lat, lon),
+            'iot': lambda: shodan_api.search_geo(lat, lon)
+        }
+    else:
+        # WiFi + Cell towers (default)
+        calls = {
+            'wifi': lambda: wigle_api.search_networks(lat, lon, radius),
+            'towers': lambda: opencellid_api.search_towers(lat, lon)
+        }
+    calls = {
+        layer: (lambda search=search, circle=layer_circle(layer, radius):
+                GeoDistance.measure(search(), lat, lon, circle))
+        for layer, search in calls.items()
+    }
+    
+    stream_format = requested_stream_format()
+    if stream_format is not None:
+        if limit is not None or sort:
+            return jsonify({
+                "error": "limit and sort are not supported on streamed responses",
+                "status": "invalid_input"
+            }), 400
+        response = stream_response(calls, Deadline.from_request(), stream_format)
+        response.vary.add('Accept')
+        return response
     
     try:
-        if mode == 'bluetooth':
-            # Bluetooth only
-            devices.extend(wigle_api.search_bluetooth(lat, lon, radius))
-        elif mode == 'all':
-            # All device types
-            devices.extend(wigle_api.search_networks(lat, lon, radius))
-            devices.extend(wigle_api.search_bluetooth(lat, lon, radius))
-            devices.extend(opencellid_api.search_towers(lat, lon))
-            devices.extend(shodan_api.search_geo(lat, lon))
-        else:
-            # WiFi + Cell towers (default)
-            devices.extend(wigle_api.search_networks(lat, lon, radius))
-            devices.extend(opencellid_api.search_towers(lat, lon))
+        devices, providers = provider_fanout.run(calls, Deadline.from_request())
+        devices = GeoDistance.nearest(devices, limit, sort)
     
     except Exception as e:
         logger.error(f"Error in nearby search: {str(e)}", exc_info=True)
@@ -593,20 +4161,262 @@ def nearby():
             "status": "error"
         }), 500
     
-    # Convert to dict and add icons
-    result_devices = []
-    for device in devices:
-        device_dict = device.to_dict()
-        device_dict['icon'] = DeviceClassifier.get_icon(device.device_type)
-        result_devices.append(device_dict)
+    response = json_response({
+        "count": len(devices),
+        "providers": providers,
+        "partial": ProviderFanOut.is_partial(providers),
+        "timestamp": datetime.utcnow().isoformat() + 'Z',
+        "status": "success"
+    }, devices)
+    response.vary.add('Accept')
+    return response
+
+@app.route('/api/nearby/batch', methods=['POST'])
+@limiter.limit("10 per minute")
+def nearby_batch():
+    """
+    Get nearby devices for many points at once
+    
+    JSON Body:
+        points (list): Up to Config.BATCH_MAX_POINTS objects with lat and lon
+        mode (str): 'wifi', 'bluetooth', or 'all' (default: 'wifi')
+        radius (float): Search radius in degrees of latitude (default: 0.01)
+        sort (str): 'distance' to order each point's devices nearest first
+        limit (int): Keep only the nearest devices of each point
     
-    return jsonify({
-        "devices": result_devices,
-        "count": len(result_devices),
+    The tiles covering all points are fetched once per layer, concurrently,
+    and each point gets the devices of its own tiles within the radius,
+    with their distance_m from the point. Batches covering more than
+    Config.BATCH_MAX_TILES tiles in a layer are rejected before any fetch.
+    """
+    body = request.get_json(silent=True)
+    points = body.get('points') if isinstance(body, dict) else None
+    if not isinstance(points, list) or not points:
+        return jsonify({"error": "Missing points", "status": "invalid_input"}), 400
+    if len(points) > Config.BATCH_MAX_POINTS:
+        return jsonify({
+            "error": f"At most {Config.BATCH_MAX_POINTS} points per request",
+            "status": "invalid_input"
+        }), 400
+    
+    coordinates = []
+    for i, point in enumerate(points):
+        lat, lon = (point.get('lat'), point.get('lon')) if isinstance(point, dict) else (None, None)
+        is_valid, error_msg = CoordinateValidator.validate(lat, lon)
+        if not is_valid:
+            return jsonify({"error": f"Point {i}: {error_msg}", "status": "invalid_input"}), 400
+        coordinates.append((lat, lon))
+    
+    mode = body.get('mode', 'wifi')
+    radius = body.get('radius', 0.01)
+    if not isinstance(radius, (int, float)) or radius <= 0:
+        return jsonify({"error": "Invalid radius", "status": "invalid_input"}), 400
+    radius = min(radius, Config.MAX_SEARCH_RADIUS)
+    try:
+        limit, sort = requested_nearest(body)
+    except ValueError as e:
+        return jsonify({"error": str(e), "status": "invalid_input"}), 400
+    layers = MODE_LAYERS.get(mode, MODE_LAYERS['wifi'])
+    
+    logger.info(f"Batch nearby search: {len(coordinates)} points, mode={mode}, radius={radius}")
+    
+    # Areas and covering tiles of every point, per layer
+    areas = {
+        layer: [layer_area(layer, lat, lon, radius) for lat, lon in coordinates]
+        for layer in layers
+    }
+    point_tiles = {
+        layer: [TileMath.tiles_for_bounds(bounds, tile_fetcher.zoom) for bounds, _ in areas[layer]]
+        for layer in layers
+    }
+    union = {
+        layer: sorted({tile for tiles in point_tiles[layer] for tile in tiles})
+        for layer in layers
+    }
+    covered = max(len(tiles) for tiles in union.values())
+    if covered > Config.BATCH_MAX_TILES:
+        return jsonify({
+            "error": f"Points cover {covered} tiles, at most {Config.BATCH_MAX_TILES} allowed",
+            "status": "invalid_input"
+        }), 400
+    
+    calls = {
+        layer: (lambda layer=layer: tile_fetcher.fetch_each(layer, union[layer], DEVICE_LAYERS[layer]))
+        for layer in layers
+    }
+    
+    try:
+        fetched = {}
+        providers = {}
+        for layer, tiles, result in provider_fanout.stream(calls, Deadline.from_request()):
+            fetched[layer] = tiles if result["status"] == "ok" else {}
+            if "count" in result:
+                result["tiles"] = result.pop("count")
+            providers[layer] = result
+        
+        results = []
+        for i, (lat, lon) in enumerate(coordinates):
+            merged = DeviceDeduplicator()
+            for layer in layers:
+                bounds, clip = areas[layer][i]
+                devices = DeviceBatch.concat(
+                    fetched[layer][tile] for tile in point_tiles[layer][i] if tile in fetched[layer]
+                )
+                devices = TileMath.clip(devices, bounds) if clip else devices
+                merged.feed(GeoDistance.measure(devices, lat, lon, layer_circle(layer, radius)))
+            devices = GeoDistance.nearest(merged.batch, limit, sort)
+            results.append({
+                "lat": lat,
+                "lon": lon,
+                "count": len(devices),
+                "devices": devices.to_dicts()
+            })
+    
+    except Exception as e:
+        logger.error(f"Error in batch nearby search: {str(e)}", exc_info=True)
+        return jsonify({
+            "error": "Internal server error",
+            "status": "error"
+        }), 500
+    
+    providers = {layer: providers[layer] for layer in layers}
+    return json_response({
+        "results": results,
+        "count": len(results),
+        "providers": providers,
+        "partial": ProviderFanOut.is_partial(providers),
         "timestamp": datetime.utcnow().isoformat() + 'Z',
         "status": "success"
     })
 
+@app.route('/api/corridor', methods=['POST'])
+@limiter.limit("10 per minute")
+def corridor_search():
+    """
+    Get devices along a route
+    
+    JSON Body:
+        route (list): Up to Config.CORRIDOR_MAX_POINTS [lat, lon] vertices
+        buffer (float): Corridor half-width in metres (default: 100)
+        mode (str): 'wifi', 'bluetooth', or 'all' (default: 'wifi')
+    
+    The route is covered by the smallest set of provider tiles within the
+    buffer, each fetched once, and devices are kept by their true distance
+    to the route.
+    """
+    body = request.get_json(silent=True)
+    route = body.get('route') if isinstance(body, dict) else None
+    if not isinstance(route, list) or not route:
+        return jsonify({"error": "Missing route", "status": "invalid_input"}), 400
+    if len(route) > Config.CORRIDOR_MAX_POINTS:
+        return jsonify({
+            "error": f"At most {Config.CORRIDOR_MAX_POINTS} route points per request",
+            "status": "invalid_input"
+        }), 400
+    
+    points = []
+    for i, point in enumerate(route):
+        lat, lon = point if isinstance(point, list) and len(point) == 2 else (None, None)
+        is_valid, error_msg = CoordinateValidator.validate(lat, lon)
+        if not is_valid:
+            return jsonify({"error": f"Route point {i}: {error_msg}", "status": "invalid_input"}), 400
+        points.append((lat, lon))
+    
+    buffer = body.get('buffer', 100)
+    if not isinstance(buffer, (int, float)) or not 0 < buffer <= Config.CORRIDOR_MAX_BUFFER:
+        return jsonify({
+            "error": f"Buffer must be between 0 and {Config.CORRIDOR_MAX_BUFFER} metres",
+            "status": "invalid_input"
+        }), 400
+    
+    mode = body.get('mode', 'wifi')
+    layers = MODE_LAYERS.get(mode, MODE_LAYERS['wifi'])
+    corridor = Corridor(points, buffer)
+    tiles = corridor.tiles(tile_fetcher.zoom, max_tiles=Config.CORRIDOR_MAX_TILES)
+    if len(tiles) > Config.CORRIDOR_MAX_TILES:
+        return jsonify({
+            "error": f"Route covers more than {Config.CORRIDOR_MAX_TILES} tiles",
+            "status": "invalid_input"
+        }), 400
+    
+    logger.info(f"Corridor search: {len(points)} points, buffer={buffer}m, mode={mode}, {len(tiles)} tiles")
+    
+    calls = {
+        layer: (lambda layer=layer: tile_fetcher.fetch_each(layer, sorted(tiles), DEVICE_LAYERS[layer]))
+        for layer in layers
+    }
+    
+    try:
+        merged = DeviceDeduplicator()
+        providers = {}
+        for layer, fetched, result in provider_fanout.stream(calls, Deadline.from_request()):
+            if "count" in result:
+                result["tiles"] = result.pop("count")
+            providers[layer] = result
+            for tile, devices in (fetched.items() if result["status"] == "ok" else ()):
+                merged.feed(corridor.filter(devices, tiles[tile]))
+    
+    except Exception as e:
+        logger.error(f"Error in corridor search: {str(e)}", exc_info=True)
+        return jsonify({
+            "error": "Internal server error",
+            "status": "error"
+        }), 500
+    
+    providers = {layer: providers[layer] for layer in layers}
+    return json_response({
+        "count": len(merged.batch),
+        "tiles": len(tiles),
+        "providers": providers,
+        "partial": ProviderFanOut.is_partial(providers),
+        "timestamp": datetime.utcnow().isoformat() + 'Z',
+        "status": "success"
+    }, merged.batch)
+
+@app.route('/api/nearby/clusters/<int:cluster_id>')
+@limiter.limit("60 per minute")
+@validate_coordinates_decorator
+def expand_cluster(cluster_id):
+    """
+    Get the clusters and devices a cluster splits into
+    
+    Takes the same lat, lon, mode and radius as the /api/nearby?zoom= query
+    that returned the cluster.
+    """
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    mode = request.args.get('mode', 'wifi')
+    radius = min(request.args.get('radius', 0.01, type=float), Config.MAX_SEARCH_RADIUS)
+    bounds = CoordinateValidator.calculate_bounds(lat, lon, radius)
+    
+    try:
+        index, _ = get_cluster_index(
+            MODE_LAYERS.get(mode, MODE_LAYERS['wifi']), bounds, Deadline.from_request()
+        )
+        expanded = index.expand(cluster_id)
+    except Exception as e:
+        logger.error(f"Error expanding cluster: {str(e)}", exc_info=True)
+        return jsonify({
+            "error": "Internal server error",
+            "status": "error"
+        }), 500
+    
+    if expanded is None:
+        return jsonify({
+            "error": f"Unknown cluster: {cluster_id}",
+            "status": "not_found"
+        }), 404
+    
+    clusters, points, zoom = expanded
+    devices = index.devices.take(points)
+    return json_response({
+        "clusters": clusters,
+        "count": len(devices) + sum(cluster["count"] for cluster in clusters),
+        "zoom": zoom,
+        "timestamp": datetime.utcnow().isoformat() + 'Z',
+        "status": "success"
+    }, devices)
+
 @app.route('/api/search')
 @limiter.limit("20 per minute")
 def search():
@@ -629,7 +4439,9 @@ def search():
     
     logger.info(f"Search: type={search_type}, query={query}")
     
-    devices = []
+    devices = DeviceBatch()
+    providers = None
+    deadline = Deadline.from_request()
     
     try:
         if search_type == 'location':
@@ -641,9 +4453,11 @@ def search():
                 
                 radius = min(request.args.get('radius', 0.01, type=float), Config.MAX_SEARCH_RADIUS)
                 
-                devices.extend(wigle_api.search_networks(lat, lon, radius))
-                devices.extend(opencellid_api.search_towers(lat, lon))
-                devices.extend(shodan_api.search_geo(lat, lon))
+                devices, providers = provider_fanout.run({
+                    'wifi': lambda: wigle_api.search_networks(lat, lon, radius),
+                    'towers': lambda: opencellid_api.search_towers(lat, lon),
+                    'iot': lambda: shodan_api.search_geo(lat, lon)
+                }, deadline)
             except ValueError:
                 return jsonify({
                     "error": "Invalid location format. Use: lat,lon",
@@ -651,7 +4465,9 @@ def search():
                 }), 400
                 
         elif search_type == 'ssid':
-            devices.extend(wigle_api.search_by_ssid(query))
+            devices, providers = provider_fanout.run({
+                'wifi': lambda: wigle_api.search_by_ssid(query)
+            }, deadline)
             
         elif search_type == 'bssid':
             # Validate MAC address format
@@ -660,10 +4476,14 @@ def search():
                     "error": "Invalid BSSID format",
                     "status": "invalid_input"
                 }), 400
-            devices.extend(wigle_api.search_by_bssid(query))
+            devices, providers = provider_fanout.run({
+                'wifi': lambda: wigle_api.search_by_bssid(query)
+            }, deadline)
             
         elif search_type == 'network':
-            devices.extend(shodan_api.search_geo(0, 0))  # Global search
+            devices, providers = provider_fanout.run({
+                'iot': lambda: shodan_api.search_geo(0, 0)  # Global search
+            }, deadline)
             
         else:
             return jsonify({
@@ -678,19 +4498,16 @@ def search():
             "status": "error"
         }), 500
     
-    # Convert to dict and add icons
-    result_devices = []
-    for device in devices:
-        device_dict = device.to_dict()
-        device_dict['icon'] = DeviceClassifier.get_icon(device.device_type)
-        result_devices.append(device_dict)
-    
-    return jsonify({
-        "devices": result_devices,
-        "count": len(result_devices),
+    response = {
+        "count": len(devices),
         "timestamp": datetime.utcnow().isoformat() + 'Z',
         "status": "success"
-    })
+    }
+    if providers is not None:
+        response["providers"] = providers
+        response["partial"] = ProviderFanOut.is_partial(providers)
+    
+    return json_response(response, devices)
 
 @app.route('/api/stats')
 @limiter.limit("10 per minute")
@@ -701,42 +4518,41 @@ def get_stats():
     lon = request.args.get('lon', type=float)
     radius = min(request.args.get('radius', 0.05, type=float), Config.MAX_SEARCH_RADIUS)
     
+    bounds = CoordinateValidator.calculate_bounds(lat, lon, radius)
+    # The tower lookup covers the whole tile around the point, as in search_towers
+    point = CoordinateValidator.calculate_bounds(lat, lon, 0)
+    
     try:
-        # Gather all devices
-        all_devices = []
-        all_devices.extend(wigle_api.search_networks(lat, lon, radius))
-        all_devices.extend(wigle_api.search_bluetooth(lat, lon, radius))
-        all_devices.extend(opencellid_api.search_towers(lat, lon))
+        # Merge per-tile summaries instead of gathering every device
+        summary = TileSummary()
+        providers = {}
+        for name, result, status in provider_fanout.stream({
+            'wifi': lambda: tile_fetcher.summarize('wifi', bounds, wigle_api.networks_tile),
+            'bluetooth': lambda: tile_fetcher.summarize('bluetooth', bounds, wigle_api.bluetooth_tile),
+            'towers': lambda: tile_fetcher.summarize('towers', point, opencellid_api.towers_tile,
+                                                     clip=False)
+        }, Deadline.from_request()):
+            providers[name] = status
+            if status["status"] == "ok":
+                summary.merge(result)
         
-        # Calculate statistics
-        device_types = {}
-        vendors = {}
-        signal_strengths = []
-        
-        for device in all_devices:
-            # Count device types
-            device_types[device.device_type] = device_types.get(device.device_type, 0) + 1
-            
-            # Count vendors
-            if device.vendor:
-                vendors[device.vendor] = vendors.get(device.vendor, 0) + 1
-            
-            # Collect signal strengths
-            if device.signal:
-                signal_strengths.append(device.signal)
-        
-        # Calculate average signal
-        avg_signal = sum(signal_strengths) / len(signal_strengths) if signal_strengths else None
+        providers = {name: providers[name] for name in ('wifi', 'bluetooth', 'towers')}
+        avg_signal = summary.average_signal()
         
         return jsonify({
-            "total_devices": len(all_devices),
-            "device_types": device_types,
-            "top_vendors": dict(sorted(vendors.items(), key=lambda x: x[1], reverse=True)[:10]),
+            "total_devices": len(summary),
+            "device_types": dict(summary.types),
+            "top_vendors": summary.top_vendors(10),
             "average_signal": round(avg_signal, 2) if avg_signal else None,
+            "signal_percentiles": {
+                f"p{p}": summary.percentile(p) for p in Config.STATS_PERCENTILES
+            },
             "search_area": {
                 "center": {"lat": lat, "lon": lon},
                 "radius_km": round(radius * 111, 2)  # Convert degrees to km
             },
+            "providers": providers,
+            "partial": ProviderFanOut.is_partial(providers),
             "timestamp": datetime.utcnow().isoformat() + 'Z',
             "status": "success"
         })
@@ -757,13 +4573,10 @@ def get_towers():
     lon = request.args.get('lon', type=float)
     
     try:
-        devices = opencellid_api.search_towers(lat, lon)
+        with Deadline.from_request().activate():
+            devices = opencellid_api.search_towers(lat, lon)
         
-        towers = []
-        for device in devices:
-            tower_data = device.to_dict()
-            tower_data['icon'] = DeviceClassifier.get_icon(device.device_type)
-            towers.append(tower_data)
+        towers = devices.to_dicts()
         
         return jsonify({
             "towers": towers,
@@ -772,6 +4585,22 @@ def get_towers():
             "status": "success"
         })
         
+    except DeadlineExceeded:
+        return jsonify({
+            "error": "Cell tower lookup exceeded the request deadline",
+            "status": "timed_out"
+        }), 504
+    except CircuitOpenError:
+        return jsonify({
+            "error": "Cell tower provider is temporarily unavailable",
+            "status": "circuit_open"
+        }), 503
+    except ProviderError as e:
+        logger.error(f"Error fetching towers: {str(e)}")
+        return jsonify({
+            "error": "Cell tower provider request failed",
+            "status": "error"
+        }), 502
     except Exception as e:
         logger.error(f"Error fetching towers: {str(e)}", exc_info=True)
         return jsonify({
@@ -779,6 +4608,104 @@ def get_towers():
             "status": "error"
         }), 500
 
+@app.route('/api/tiles/<int:z>/<int:x>/<int:y>.<fmt>')
+@limiter.limit("600 per minute")
+def device_tile(z, x, y, fmt):
+    """
+    Get the devices of one slippy-map tile
+    
+    Path Parameters:
+        z, x, y (int): Tile coordinates (zoom between Config.VECTOR_TILE_MIN_ZOOM
+            and Config.VECTOR_TILE_MAX_ZOOM)
+        fmt (str): 'mvt' for a Mapbox Vector Tile or 'geojson'
+    
+    Query Parameters:
+        layers (str): Comma-separated device layers (default: 'wifi,towers')
+        cluster (str): 'true' to group dense devices into a 'clusters' layer
+    """
+    formats = {'mvt': 'application/vnd.mapbox-vector-tile', 'geojson': 'application/geo+json'}
+    if fmt not in formats:
+        abort(404)
+    
+    if not (Config.VECTOR_TILE_MIN_ZOOM <= z <= Config.VECTOR_TILE_MAX_ZOOM):
+        return jsonify({
+            "error": f"Zoom must be between {Config.VECTOR_TILE_MIN_ZOOM} and {Config.VECTOR_TILE_MAX_ZOOM}",
+            "status": "invalid_input"
+        }), 400
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": "Tile out of range", "status": "invalid_input"}), 400
+    
+    layers = request.args.get('layers', 'wifi,towers').split(',')
+    unknown = [layer for layer in layers if layer not in DEVICE_LAYERS]
+    if unknown:
+        return jsonify({
+            "error": f"Unknown layers: {', '.join(unknown)}",
+            "status": "invalid_input"
+        }), 400
+    
+    cluster = request.args.get('cluster', 'false').lower() in ('1', 'true')
+    key = f"tile:{fmt}:{','.join(layers)}:{'clustered:' if cluster else ''}{z}/{x}/{y}"
+    try:
+        body = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Cache read failed for {key}: {str(e)}")
+        body = None
+    
+    partial = False
+    if body is None:
+        # Pull the edges in slightly: they touch the neighbouring tiles, which
+        # would otherwise be fetched too and share their edge devices with us
+        bounds = TileMath.tile_bounds(z, x, y)
+        bounds = {
+            'latrange1': bounds['latrange1'] + 1e-9, 'latrange2': bounds['latrange2'] - 1e-9,
+            'longrange1': bounds['longrange1'] + 1e-9, 'longrange2': bounds['longrange2'] - 1e-9
+        }
+        calls = {
+            layer: (lambda layer=layer: tile_fetcher.collect(layer, bounds, DEVICE_LAYERS[layer]))
+            for layer in layers
+        }
+        
+        clusters = None
+        try:
+            results = {}
+            providers = {}
+            if cluster:
+                index, providers = get_cluster_index(tuple(layers), bounds, Deadline.from_request())
+                clusters, points = index.get_clusters(bounds, z)
+                for layer in layers:
+                    results[layer] = index.devices.take([i for i in points if index.layers[i] == layer])
+            else:
+                for layer, devices, result in provider_fanout.stream(calls, Deadline.from_request()):
+                    results[layer] = devices
+                    providers[layer] = result
+        except Exception as e:
+            logger.error(f"Error building tile {z}/{x}/{y}: {str(e)}", exc_info=True)
+            return jsonify({"error": "Error building tile", "status": "error"}), 500
+        
+        results = {layer: results[layer] for layer in layers}
+        if fmt == 'mvt':
+            body = tile_encoder.encode_mvt(results, z, x, y, clusters)
+        else:
+            body = tile_encoder.encode_geojson(results, clusters)
+        
+        # Tiles missing a provider must not be cached or they keep the hole
+        partial = ProviderFanOut.is_partial(providers)
+        if not partial:
+            try:
+                cache.set(key, body, timeout=Config.VECTOR_TILE_TTL)
+            except Exception as e:
+                logger.warning(f"Cache write failed for {key}: {str(e)}")
+    
+    response = app.response_class(body, mimetype=formats[fmt])
+    if partial:
+        response.headers['Cache-Control'] = 'no-store'
+        response.headers['X-Partial'] = 'true'
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = Config.VECTOR_TILE_TTL
+    response.add_etag()
+    return response.make_conditional(request)
+
 # Error handlers
 @app.errorhandler(400)
 def bad_request(e):
@@ -861,6 +4788,215 @@ def test_apis():
     
     print("\nAPI testing complete!")
 
+@app.cli.command('warm-cache')
+@click.option('--bbox', 'boxes', multiple=True, help='Region as LAT1,LON1,LAT2,LON2 (repeatable)')
+@click.option('--geojson', type=click.Path(exists=True, dir_okay=False), help='GeoJSON file of regions')
+@click.option('--layers', default='wifi,towers', help='Comma-separated device layers to warm')
+@click.option('--workers', default=Config.WARM_CACHE_WORKERS, help='Tiles fetched at once')
+@click.option('--state', default=Config.WARM_CACHE_STATE, help='File recording finished tiles')
+@click.option('--resume', is_flag=True, help='Skip tiles finished by an interrupted run (within the cache TTL)')
+def warm_cache(boxes, geojson, layers, workers, state, resume):
+    """Fill the provider caches for the tiles of some regions"""
+    layers = [layer for layer in layers.split(',') if layer]
+    unknown = [layer for layer in layers if layer not in DEVICE_LAYERS]
+    if unknown or not layers:
+        raise click.BadParameter(f"choose from {', '.join(DEVICE_LAYERS)}", param_hint='--layers')
+    
+    tiles = set()
+    for box in boxes:
+        try:
+            lat1, lon1, lat2, lon2 = (float(value) for value in box.split(','))
+        except ValueError:
+            raise click.BadParameter(f"{box!r} is not LAT1,LON1,LAT2,LON2", param_hint='--bbox')
+        if not (CoordinateValidator.validate(lat1, lon1)[0] and CoordinateValidator.validate(lat2, lon2)[0]):
+            raise click.BadParameter(f"{box!r} has invalid coordinates", param_hint='--bbox')
+        tiles.update(TileMath.tiles_for_bounds({
+            'latrange1': min(lat1, lat2), 'latrange2': max(lat1, lat2),
+            'longrange1': min(lon1, lon2), 'longrange2': max(lon1, lon2)
+        }, Config.TILE_ZOOM))
+    if geojson:
+        with open(geojson) as f:
+            try:
+                tiles.update(CacheWarmer.cover_geojson(json.load(f), Config.TILE_ZOOM))
+            except ValueError as e:
+                raise click.BadParameter(str(e), param_hint='--geojson')
+    if not tiles:
+        raise click.UsageError("Give at least one --bbox or a --geojson file")
+    
+    print(f"Warming {len(tiles)} tiles x {len(layers)} layers ({', '.join(layers)}) with {workers} workers...")
+    started = time.perf_counter()
+    last_report = started
+    
+    def progress(counters):
+        nonlocal last_report
+        now = time.perf_counter()
+        finished = counters["done"] + counters["failed"]
+        remaining = counters["total"] - counters["skipped"] - finished
+        if now - last_report < 5 and remaining:
+            return
+        last_report = now
+        rate = finished / (now - started)
+        eta = f", ETA {remaining / rate:.0f}s" if rate and remaining else ""
+        print(f"  {finished:,}/{counters['total'] - counters['skipped']:,} tiles ({rate:.1f} tiles/s, "
+              f"{counters['attempts']:,} upstream calls, {counters['failed']} failed{eta})")
+    
+    warmer = CacheWarmer(layers, workers=workers, state_path=state)
+    counters = warmer.run(tiles, resume=resume, progress=progress)
+    
+    elapsed = time.perf_counter() - started
+    print(f"✓ Warmed {counters['done']:,} tiles in {elapsed:.1f}s ({counters['done'] / elapsed:.1f} tiles/s): "
+          f"{counters['attempts']:,} upstream calls, {counters['skipped']:,} skipped as already warm, "
+          f"{counters['failed']} failed")
+    if counters['failed']:
+        print("  Run the command again with --resume to retry the failed tiles")
+
+@app.cli.command('ingest-cells')
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', default=Config.CELL_STORE_PATH, help='Store file to write')
+@click.option('--chunk-rows', default=Config.CELL_STORE_CHUNK_ROWS, help='Rows sorted in memory per run')
+def ingest_cells(source, output, chunk_rows):
+    """Build the offline cell tower store from an OpenCellID CSV dump (.csv or .csv.gz)"""
+    print(f"Ingesting {source}...")
+    started = time.perf_counter()
+    
+    def progress(rows):
+        elapsed = time.perf_counter() - started
+        print(f"  {rows:,} rows sorted ({rows / elapsed:,.0f} rows/s)")
+    
+    opener = gzip.open if source.endswith('.gz') else open
+    with opener(source, 'rt', newline='', encoding='utf-8') as lines:
+        stored, skipped = CellStore.ingest(lines, output, chunk_rows=chunk_rows, progress=progress)
+    
+    elapsed = time.perf_counter() - started
+    print(f"✓ Stored {stored:,} towers in {output} in {elapsed:.1f}s ({skipped:,} malformed rows skipped)")
+
+@app.cli.command('import-wigle')
+@click.argument('sources', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', default=Config.DEVICE_STORE_PATH, help='Store file to create or update')
+@click.option('--chunk-rows', default=Config.DEVICE_STORE_CHUNK_ROWS, help='Rows classified and written per transaction')
+def import_wigle(sources, output, chunk_rows):
+    """Import WiGLE CSV exports (.csv or .csv.gz) into the local device store"""
+    for source in sources:
+        print(f"Importing {source}...")
+        started = time.perf_counter()
+        
+        def progress(rows):
+            elapsed = time.perf_counter() - started
+            print(f"  {rows:,} rows read ({rows / elapsed:,.0f} rows/s)")
+        
+        opener = gzip.open if source.endswith('.gz') else open
+        with opener(source, 'rt', newline='', encoding='utf-8', errors='replace') as lines:
+            imported, skipped = DeviceStore.import_csv(lines, output, chunk_rows=chunk_rows, progress=progress)
+        
+        elapsed = time.perf_counter() - started
+        print(f"✓ Imported {imported:,} sightings into {output} in {elapsed:.1f}s ({skipped:,} rows skipped)")
+
+@app.cli.command('benchmark-serialization')
+@click.option('--rounds', default=5, help='Timed rounds per implementation')
+def benchmark_serialization(rounds):
+    """Compare response encoding with per-device to_dict() and jsonify"""
+    rng = random.Random(0)
+    vendors = ["Cisco Systems", "Netgear", "TP-Link", "Ubiquiti", None]
+    types = [device_type.value for device_type in DeviceType]
+    
+    def make_batch(count):
+        batch = DeviceBatch()
+        for i in range(count):
+            batch.add(lat=51.5 + rng.random() / 10, lon=-0.1 + rng.random() / 10,
+                      device_type=rng.choice(types), timestamp="2025-02-03T10:00:00Z",
+                      ssid=f"Network-{i}", bssid=f"00:14:22:{i >> 16 & 255:02x}:{i >> 8 & 255:02x}:{i & 255:02x}",
+                      vendor=rng.choice(vendors), signal=-40 - rng.randrange(50))
+        return batch
+    
+    def timed(fn):
+        best = float('inf')
+        for _ in range(rounds):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
+    
+    def legacy(devices):
+        result_devices = []
+        for device in devices:
+            device_dict = device.to_dict()
+            device_dict['icon'] = DeviceClassifier.get_icon(device.device_type)
+            result_devices.append(device_dict)
+        return jsonify({"devices": result_devices, "count": len(result_devices)}).get_data()
+    
+    encoders = {"stdlib": ResponseEncoder(use_orjson=False)}
+    if orjson is not None:
+        encoders["orjson"] = ResponseEncoder(use_orjson=True)
+    
+    with app.test_request_context():
+        for count in (100, 1000, 10000):
+            batch = make_batch(count)
+            devices = list(batch)
+            baseline = timed(lambda: legacy(devices))
+            line = f"{count:>6} devices: to_dict+jsonify {baseline:8.2f} ms"
+            for name, encoder in encoders.items():
+                elapsed = timed(lambda: encoder.encode({"count": len(batch)}, batch))
+                line += f" | {name} {elapsed:7.2f} ms ({baseline / elapsed:4.1f}x)"
+            print(line)
+
+@app.cli.command('benchmark-classifier')
+@click.option('--count', default=10000, help='Device names per page')
+@click.option('--rounds', default=5, help='Timed rounds per implementation')
+def benchmark_classifier(count, rounds):
+    """Compare the compiled classifier with the plain substring scan"""
+    rng = random.Random(0)
+    common = ["xfinitywifi", "NETGEAR", "Linksys", "HP-Print", "MyHome", "ATT", "eduroam"]
+    patterns = [pattern for patterns in DEVICE_PATTERNS.values() for pattern in patterns]
+    names = [
+        rng.choice(common if rng.random() < 0.8 else patterns).title() + f"-{rng.randrange(10000):04d}"
+        for _ in range(count)
+    ]
+    # Distinct banners, so classify_many cannot answer repeats from its memo
+    banners = [
+        f"HTTP/1.1 200 OK\r\nX-Request-Id: {i:06d}\r\n" + "Server: nginx\r\nContent-Type: text/html\r\n" * 40
+        for i in range(200)
+    ]
+    
+    def reference(name, original_type):
+        """Plain substring scan, as classify() worked before its patterns were compiled"""
+        if not name:
+            return original_type
+        name_upper = name.upper()
+        for device_type, device_patterns in DEVICE_PATTERNS.items():
+            if any(pattern in name_upper for pattern in device_patterns):
+                return device_type.value
+        return original_type
+    
+    def timed(fn):
+        best = float('inf')
+        for _ in range(rounds):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
+    
+    results = {
+        "reference": (
+            timed(lambda: [reference(n, "router") for n in names]),
+            timed(lambda: [reference(banner, "iot") for banner in banners])
+        ),
+        "classify": (
+            timed(lambda: [DeviceClassifier.classify(n, "router") for n in names]),
+            timed(lambda: [DeviceClassifier.classify(banner, "iot") for banner in banners])
+        ),
+        "classify_many": (
+            timed(lambda: DeviceClassifier.classify_many(names, "router")),
+            timed(lambda: DeviceClassifier.classify_many(banners, "iot"))
+        )
+    }
+    
+    print(f"{count} SSIDs ({len(set(names))} distinct) / {len(banners)} distinct Shodan banners "
+          f"of {len(banners[0])} chars (best of {rounds}):")
+    baseline = results["reference"]
+    for name, (page_ms, banner_ms) in results.items():
+        print(f"  {name:<14} {page_ms:8.1f} ms ({baseline[0] / page_ms:4.1f}x)"
+              f"  {banner_ms:8.1f} ms ({baseline[1] / banner_ms:4.1f}x)")
+
 if __name__ == "__main__":
     # Development server
     debug_mode = os.environ.get('FLASK_ENV') == 'development'
@@ -4,18 +4,78 @@ Unit tests for Network Mapper Application
 
 import pytest
 import json
+import time
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+import app as app_module
 from app import (
     app, 
     DeviceClassifier, 
     CoordinateValidator,
     Device,
-    DeviceType
+    DeviceType,
+    ProviderFanOut,
+    Deadline,
+    DeadlineExceeded,
+    Config,
+    TileMath,
+    SpatialIndex,
+    SingleFlight,
+    ProviderCache,
+    CallStats,
+    L1Cache,
+    PickleSerializer,
+    ColumnarSerializer,
+    Transport,
+    CircuitBreaker,
+    CircuitOpenError,
+    ProviderError,
+    DeviceBatch,
+    ResponseEncoder,
+    TileEncoder,
+    ClusterIndex,
+    TileSummary,
+    DeviceDeduplicator,
+    Corridor,
+    CellStore,
+    DeviceStore,
+    GeoDistance,
+    CacheWarmer,
+    UpstreamBudget
 )
 
+def _redis_available():
+    """Check whether the configured Redis server is reachable"""
+    try:
+        return app_module.redis_client.ping()
+    except Exception:
+        return False
+
+def _offline_request(method, url, **kwargs):
+    """Answer every provider request with an empty result instead of going online"""
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = b'{"status": "ok"}'
+    return response
+
+@pytest.fixture(autouse=True)
+def offline_providers(monkeypatch):
+    """Keep tests off the real provider APIs, with every circuit closed"""
+    for api in (app_module.wigle_api, app_module.opencellid_api, app_module.shodan_api):
+        monkeypatch.setattr(api.session, 'request', _offline_request)
+        # Circuit state lives in Redis and would leak between tests and runs
+        api.breaker.reset()
+
 @pytest.fixture
-def client():
+def client(monkeypatch):
     """Create test client"""
     app.config['TESTING'] = True
+    # Limits are counted in the shared Redis and would leak between runs
+    monkeypatch.setitem(app.config, 'RATELIMIT_ENABLED', False)
+    monkeypatch.setattr(app_module.limiter, 'enabled', False)
     with app.test_client() as client:
         yield client
 
@@ -55,6 +115,13 @@ class TestCoordinateValidator:
         is_valid, error = CoordinateValidator.validate(0, None)
         assert is_valid is False
     
+    def test_bounds_enclose_circle(self):
+        """Test the longitude range widens with latitude to enclose the circle"""
+        bounds = CoordinateValidator.calculate_bounds(60.0, 10.0, 0.01)
+        
+        assert bounds['latrange2'] - bounds['latrange1'] == pytest.approx(0.02)
+        assert bounds['longrange2'] - bounds['longrange1'] == pytest.approx(0.04)
+    
     def test_calculate_bounds(self):
         """Test bounding box calculation"""
         bounds = CoordinateValidator.calculate_bounds(51.505, -0.09, 0.01)
@@ -67,6 +134,1312 @@ class TestCoordinateValidator:
         assert bounds['latrange2'] > bounds['latrange1']
         assert bounds['longrange2'] > bounds['longrange1']
 
+class TestTileMath:
+    """Test slippy-map tile utilities"""
+    
+    def test_tile_contains_point(self):
+        """Test that a coordinate lies inside its own tile"""
+        x, y = TileMath.lat_lon_to_tile(51.505, -0.09, 13)
+        bounds = TileMath.tile_bounds(13, x, y)
+        
+        assert bounds['latrange1'] <= 51.505 <= bounds['latrange2']
+        assert bounds['longrange1'] <= -0.09 <= bounds['longrange2']
+    
+    def test_nearby_points_share_tile(self):
+        """Test that points a metre apart snap to the same tile"""
+        assert TileMath.lat_lon_to_tile(51.50500, -0.09000, 13) == \
+            TileMath.lat_lon_to_tile(51.50501, -0.09001, 13)
+    
+    def test_tiles_cover_bounds(self):
+        """Test that covering tiles span the whole bounding box"""
+        bounds = CoordinateValidator.calculate_bounds(51.505, -0.09, 0.05)
+        tiles = TileMath.tiles_for_bounds(bounds, 13)
+        
+        tile_boxes = [TileMath.tile_bounds(13, x, y) for x, y in tiles]
+        assert min(b['latrange1'] for b in tile_boxes) <= bounds['latrange1']
+        assert max(b['latrange2'] for b in tile_boxes) >= bounds['latrange2']
+        assert min(b['longrange1'] for b in tile_boxes) <= bounds['longrange1']
+        assert max(b['longrange2'] for b in tile_boxes) >= bounds['longrange2']
+    
+    def test_search_assembles_and_clips_tiles(self, monkeypatch):
+        """Test that area searches are served from tiles and clipped to the box"""
+        requested = []
+        
+        def fake_tile(zoom, x, y):
+            requested.append((zoom, x, y))
+            tile = TileMath.tile_bounds(zoom, x, y)
+            return [Device(lat=tile['latrange1'], lon=tile['longrange1'],
+                           device_type="router", timestamp="2025-02-03T10:00:00Z")]
+        
+        monkeypatch.setattr(app_module.wigle_api, '_search_networks_tile', fake_tile)
+        monkeypatch.setattr(app_module.tile_fetcher, 'index', SpatialIndex())
+        devices = app_module.wigle_api.search_networks(51.505, -0.09, 0.01)
+        bounds = CoordinateValidator.calculate_bounds(51.505, -0.09, 0.01)
+        
+        assert sorted(requested) == sorted(
+            (Config.TILE_ZOOM, x, y) for x, y in TileMath.tiles_for_bounds(bounds, Config.TILE_ZOOM)
+        )
+        assert devices == TileMath.clip(devices, bounds)
+
+class TestGeoDistance:
+    """Test great-circle distance filtering and nearest selection"""
+    
+    def _devices(self):
+        return DeviceBatch.from_devices([
+            Device(lat=51.5, lon=-0.09, device_type="router", timestamp=None, ssid="Here"),
+            Device(lat=51.5, lon=-0.077, device_type="router", timestamp=None, ssid="East"),
+            Device(lat=51.509, lon=-0.09, device_type="router", timestamp=None, ssid="North"),
+            Device(lat=None, lon=None, device_type="router", timestamp=None, ssid="Nowhere"),
+            Device(lat=51.5005, lon=-0.09, device_type="router", timestamp=None, ssid="Close")
+        ])
+    
+    @pytest.fixture(params=[True, False], ids=["numpy", "python"])
+    def vectorized(self, request, monkeypatch):
+        if not request.param:
+            monkeypatch.setattr(app_module, 'numpy', None)
+        elif app_module.numpy is None:
+            pytest.skip("Requires numpy")
+    
+    def test_measure_filters_circle(self, vectorized):
+        """Test devices are kept within a true circle and get distance_m"""
+        measured = GeoDistance.measure(self._devices(), 51.5, -0.09, 950)
+        
+        assert measured.ssid == ["Here", "East", "Close"]
+        assert list(measured.distance_m) == [0.0, pytest.approx(900.0, abs=2), pytest.approx(55.6, abs=0.1)]
+        assert len(GeoDistance.measure(self._devices(), 51.5, -0.09)) == 5
+    
+    def test_nearest_partial_selection(self, vectorized):
+        """Test limit keeps the nearest devices, sorted only when asked"""
+        measured = GeoDistance.measure(self._devices(), 51.5, -0.09)
+        
+        assert GeoDistance.nearest(measured, limit=2).ssid == ["Here", "Close"]
+        assert GeoDistance.nearest(measured, sort=True).ssid == ["Here", "Close", "East", "North", "Nowhere"]
+        assert GeoDistance.nearest(measured, limit=3, sort=True).ssid == ["Here", "Close", "East"]
+        assert GeoDistance.nearest(measured, limit=10) is measured
+    
+    def test_distance_not_cached(self):
+        """Test cache entries leave out the per-query distance"""
+        measured = GeoDistance.measure(self._devices(), 51.5, -0.09)
+        
+        _, restored = ColumnarSerializer().loads(ColumnarSerializer().dumps((0.0, measured)))
+        
+        assert restored.column('distance_m') == [None] * 5
+        assert restored.ssid == measured.ssid
+
+class TestCorridor:
+    """Test buffered route polylines"""
+    
+    def test_distance_to_route(self):
+        """Test devices are measured against the nearest segment in metres"""
+        corridor = Corridor([(51.5, -0.1), (51.5, -0.09), (51.51, -0.09)], 100)
+        devices = DeviceBatch.from_devices([
+            Device(lat=51.5009, lon=-0.095, device_type="router", timestamp=None, ssid="Near"),
+            Device(lat=51.505, lon=-0.0895, device_type="router", timestamp=None, ssid="Corner"),
+            Device(lat=51.502, lon=-0.095, device_type="router", timestamp=None, ssid="Far")
+        ])
+        
+        distances = corridor.distances(devices)
+        
+        assert distances[0] == pytest.approx(100.1, abs=0.5)
+        assert distances[1] == pytest.approx(34.7, abs=0.5)
+        assert [d.ssid for d in corridor.filter(devices)] == ["Corner"]
+    
+    def test_tiles_follow_diagonal(self):
+        """Test a diagonal route covers fewer tiles than its bounding box"""
+        corridor = Corridor([(51.4, -0.3), (51.6, 0.1)], 50)
+        tiles = corridor.tiles(13)
+        box = TileMath.tiles_for_bounds({
+            'latrange1': 51.4, 'latrange2': 51.6, 'longrange1': -0.3, 'longrange2': 0.1
+        }, 13)
+        
+        assert set(tiles) < set(box)
+        assert len(tiles) < len(box) / 3
+        for lat, lon in [(51.4, -0.3), (51.5, -0.1), (51.6, 0.1)]:
+            assert TileMath.lat_lon_to_tile(lat, lon, 13) in tiles
+    
+    def test_tiles_stop_past_cap(self):
+        """Test an over-long route stops being walked once it passes the cap"""
+        corridor = Corridor([(-60.0, -170.0), (60.0, 170.0)], 2000)
+        
+        started = time.monotonic()
+        tiles = corridor.tiles(13, max_tiles=400)
+        
+        assert 400 < len(tiles) < 450
+        assert time.monotonic() - started < 0.5
+    
+    def test_tiles_include_buffer(self):
+        """Test tiles reached only through the buffer are covered"""
+        x, y = TileMath.lat_lon_to_tile(51.505, -0.09, 13)
+        tile = TileMath.tile_bounds(13, x, y)
+        lat = tile['latrange2'] - 0.0001
+        route = [(lat, tile['longrange1'] + 0.001), (lat, tile['longrange2'] - 0.001)]
+        
+        assert list(Corridor(route, 5).tiles(13)) == [(x, y)]
+        assert set(Corridor(route, 50).tiles(13)) == {(x, y), (x, y - 1)}
+
+class TestSpatialIndex:
+    """Test the in-process spatial index"""
+    
+    def _devices(self, count, lat=51.505, lon=-0.09):
+        return [Device(lat=lat, lon=lon, device_type="router", timestamp="2025-02-03T10:00:00Z")
+                for _ in range(count)]
+    
+    def test_fresh_cell_returned(self):
+        """Test that a freshly stored tile is served from memory"""
+        index = SpatialIndex(ttl=60)
+        index.put('wifi', 13, 1, 2, self._devices(2))
+        
+        assert len(index.get('wifi', 13, 1, 2)) == 2
+        assert index.get('bluetooth', 13, 1, 2) is None
+    
+    def test_stale_cell_dropped(self):
+        """Test that cells older than the TTL are not served"""
+        index = SpatialIndex(ttl=-1)
+        index.put('wifi', 13, 1, 2, self._devices(2))
+        
+        assert index.get('wifi', 13, 1, 2) is None
+        assert len(index) == 0
+    
+    def test_memory_cap_evicts_oldest(self):
+        """Test least recently used eviction beyond the device cap"""
+        index = SpatialIndex(ttl=60, max_devices=3)
+        index.put('wifi', 13, 1, 1, self._devices(2))
+        index.put('wifi', 13, 2, 2, self._devices(2))
+        
+        assert index.get('wifi', 13, 1, 1) is None
+        assert len(index.get('wifi', 13, 2, 2)) == 2
+        assert len(index) == 2
+    
+    def test_query_requires_full_coverage(self):
+        """Test bounding-box queries answered only when every cell is fresh"""
+        index = SpatialIndex(ttl=60)
+        bounds = CoordinateValidator.calculate_bounds(51.505, -0.09, 0.01)
+        tiles = TileMath.tiles_for_bounds(bounds, 13)
+        
+        assert index.query('wifi', bounds, 13) is None
+        
+        for x, y in tiles:
+            index.put('wifi', 13, x, y, self._devices(1) + self._devices(1, lat=0, lon=0))
+        
+        devices = index.query('wifi', bounds, 13)
+        assert len(devices) == len(tiles)
+        assert all(d.lat == 51.505 for d in devices)
+    
+    def test_collect_served_from_index(self, monkeypatch):
+        """Test that repeated area lookups skip the tile cache"""
+        calls = []
+        
+        def fake_tile(zoom, x, y):
+            calls.append((x, y))
+            return self._devices(1)
+        
+        monkeypatch.setattr(app_module.tile_fetcher, 'index', SpatialIndex())
+        bounds = CoordinateValidator.calculate_bounds(51.505, -0.09, 0.01)
+        
+        first = app_module.tile_fetcher.collect('wifi', bounds, fake_tile)
+        fetched = len(calls)
+        second = app_module.tile_fetcher.collect('wifi', bounds, fake_tile)
+        
+        assert fetched > 0
+        assert len(calls) == fetched
+        assert len(first) == len(second)
+
+class TestSingleFlight:
+    """Test single-flight request coalescing"""
+    
+    def _run_concurrently(self, targets):
+        results = []
+        threads = [threading.Thread(target=lambda t=t: results.append(t())) for t in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def test_threads_share_one_call(self):
+        """Test that concurrent identical calls in one process run once"""
+        calls = []
+        
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['result']
+        
+        flight = SingleFlight()
+        results = self._run_concurrently([lambda: flight.do('key', fetch)] * 5)
+        
+        assert len(calls) == 1
+        assert results == [['result']] * 5
+    
+    def test_leader_error_propagates(self):
+        """Test that waiters receive the leader's failure"""
+        def fetch():
+            time.sleep(0.1)
+            raise RuntimeError("upstream down")
+        
+        flight = SingleFlight()
+        errors = []
+        
+        def call():
+            try:
+                flight.do('key', fetch)
+            except RuntimeError as e:
+                errors.append(e)
+        
+        self._run_concurrently([call] * 3)
+        assert len(errors) == 3
+    
+    @pytest.mark.skipif(not _redis_available(), reason="Requires Redis connection")
+    def test_processes_share_one_call(self):
+        """Test that separate workers coalesce through Redis"""
+        calls = []
+        key = f"test:{uuid.uuid4()}"
+        
+        def fetch():
+            calls.append(1)
+            time.sleep(0.3)
+            return ['result']
+        
+        workers = [SingleFlight(app_module.redis_client) for _ in range(3)]
+        results = self._run_concurrently([lambda w=w: w.do(key, fetch) for w in workers])
+        
+        assert len(calls) == 1
+        assert results == [['result']] * 3
+
+class DictBackend:
+    """Minimal in-memory stand-in for the flask_caching backend"""
+    
+    def __init__(self):
+        self.data = {}
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+
+class TestProviderCache:
+    """Test stale-while-revalidate provider caching"""
+    
+    def test_miss_fetches_and_stores(self):
+        """Test that a miss fetches synchronously and caches the result"""
+        cache = ProviderCache(DictBackend(), serializer=PickleSerializer())
+        calls = []
+        
+        def fetch():
+            calls.append(1)
+            return ['fresh']
+        
+        assert cache.get_or_fetch('k', fetch, soft_ttl=60, hard_ttl=600) == ['fresh']
+        assert cache.get_or_fetch('k', fetch, soft_ttl=60, hard_ttl=600) == ['fresh']
+        assert len(calls) == 1
+    
+    def test_failed_fetch_not_cached(self):
+        """Test that a failing fetch is raised and retried by the next caller"""
+        backend = DictBackend()
+        cache = ProviderCache(backend, serializer=PickleSerializer())
+        
+        def failing():
+            raise ProviderError("HTTP 500")
+        
+        with pytest.raises(ProviderError):
+            cache.get_or_fetch('k', failing, soft_ttl=60, hard_ttl=600)
+        assert backend.get('k') is None
+        assert cache.get_or_fetch('k', lambda: ['fresh'], soft_ttl=60, hard_ttl=600) == ['fresh']
+    
+    def test_stale_entry_served_then_refreshed(self):
+        """Test that stale entries are served at once and refreshed in the background"""
+        backend = DictBackend()
+        backend.set('k', PickleSerializer().dumps((time.time() - 120, ['old'])))
+        cache = ProviderCache(backend, serializer=PickleSerializer())
+        calls = []
+        
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return ['new']
+        
+        started = time.monotonic()
+        results = [cache.get_or_fetch('k', fetch, soft_ttl=60, hard_ttl=600) for _ in range(3)]
+        
+        assert time.monotonic() - started < 0.1
+        assert results == [['old']] * 3
+        
+        cache.executor.shutdown(wait=True)
+        assert len(calls) == 1
+        assert PickleSerializer().loads(backend.get('k'))[1] == ['new']
+    
+    def test_age_reported(self):
+        """Test that the staleness age reaches the current provider call"""
+        backend = DictBackend()
+        backend.set('k', PickleSerializer().dumps((time.time() - 30, ['cached'])))
+        cache = ProviderCache(backend, serializer=PickleSerializer())
+        stats = CallStats()
+        
+        token = app_module.current_call_stats.set(stats)
+        try:
+            cache.get_or_fetch('k', lambda: [], soft_ttl=60, hard_ttl=600)
+        finally:
+            app_module.current_call_stats.reset(token)
+        
+        assert 29 <= stats.max_age <= 35
+    
+    def test_l1_serves_repeated_reads(self):
+        """Test that the in-process tier answers before the shared backend"""
+        backend = DictBackend()
+        backend.set('k', PickleSerializer().dumps((time.time(), ['cached'])))
+        cache = ProviderCache(backend, serializer=PickleSerializer())
+        
+        for _ in range(3):
+            assert cache.get_or_fetch('k', lambda: [], soft_ttl=60, hard_ttl=600) == ['cached']
+        
+        stats = cache.stats()
+        assert stats['l2'] == {'hits': 1, 'misses': 0}
+        assert stats['l1']['hits'] == 2
+        assert stats['l1']['entries'] == 1
+    
+    def test_l1_entry_expires_at_hard_ttl(self):
+        """Test that the in-process tier does not serve an entry past its hard TTL"""
+        cache = ProviderCache(DictBackend(), serializer=PickleSerializer())
+        cache.l1.set('k', (time.time() - 700, ['expired']), 10)
+        
+        assert cache.get_or_fetch('k', lambda: ['fresh'], soft_ttl=60, hard_ttl=600) == ['fresh']
+        assert cache.l1.get('k')[1] == ['fresh']
+    
+    def test_invalidation_from_other_worker(self):
+        """Test that invalidations only drop entries written elsewhere"""
+        cache = ProviderCache(DictBackend(), serializer=PickleSerializer())
+        cache._origin = 'me'
+        cache.l1.set('a', (time.time(), ['a']), 10)
+        cache.l1.set('b', (time.time(), ['b']), 10)
+        
+        cache._on_invalidation(b'me a')
+        cache._on_invalidation(b'other b')
+        
+        assert cache.l1.get('a') is not None
+        assert cache.l1.get('b') is None
+    
+    @pytest.mark.skipif(not _redis_available(), reason="Requires Redis connection")
+    def test_invalidation_over_pubsub(self):
+        """Test that an L2 write in one worker evicts the key from another worker's L1"""
+        backend = DictBackend()
+        writer = ProviderCache(backend, app_module.redis_client, serializer=PickleSerializer())
+        reader = ProviderCache(backend, app_module.redis_client, serializer=PickleSerializer())
+        key = f"test:{uuid.uuid4()}"
+        
+        backend.set(key, PickleSerializer().dumps((time.time(), ['old'])))
+        assert reader.get_or_fetch(key, lambda: [], soft_ttl=60, hard_ttl=600) == ['old']
+        writer._ensure_listener()
+        time.sleep(0.2)  # Let both listeners subscribe
+        
+        writer._store(key, ['new'], 600)
+        
+        for _ in range(50):
+            if reader.l1.get(key) is None:
+                break
+            time.sleep(0.05)
+        assert reader.get_or_fetch(key, lambda: [], soft_ttl=60, hard_ttl=600) == ['new']
+
+class TestDeviceBatch:
+    """Test the columnar device collection"""
+    
+    def _devices(self):
+        return [
+            Device(lat=51.5, lon=-0.09, device_type="router", timestamp="2025-02-03T10:00:00Z",
+                   ssid="HomeNet", bssid="00:14:22:01:23:45", vendor="Cisco", signal=-67),
+            Device(lat=None, lon=None, device_type="cell_tower", timestamp=None,
+                   cell_id="1234", accuracy=900, vendor="LTE Tower"),
+            Device(lat=51.6, lon=-0.2, device_type="iot", timestamp="2025-02-03T10:00:00Z",
+                   ip="10.0.0.1", info="HTTP/1.1 200 OK")
+        ]
+    
+    def test_round_trip(self):
+        """Test that devices come back unchanged, including None fields"""
+        devices = self._devices()
+        batch = DeviceBatch.from_devices(devices)
+        
+        assert len(batch) == 3
+        assert list(batch) == devices
+        assert batch[1] == devices[1]
+    
+    def test_to_dicts_matches_device(self):
+        """Test that serialization matches Device.to_dict plus icon"""
+        devices = self._devices()
+        expected = [
+            dict(d.to_dict(), icon=DeviceClassifier.get_icon(d.device_type)) for d in devices
+        ]
+        
+        assert DeviceBatch.from_devices(devices).to_dicts() == expected
+    
+    def test_within_drops_outside_and_missing(self):
+        """Test that bounding-box filtering drops rows without coordinates"""
+        batch = DeviceBatch.from_devices(self._devices())
+        bounds = {'latrange1': 51.4, 'latrange2': 51.55, 'longrange1': -0.1, 'longrange2': 0.0}
+        
+        assert [d.ssid for d in batch.within(bounds)] == ["HomeNet"]
+    
+    def test_strings_interned(self):
+        """Test that repeated vendors share one string object"""
+        batch = DeviceBatch()
+        for i in range(2):
+            batch.add(lat=0.0, lon=0.0, device_type="router", timestamp=None,
+                      vendor="".join(["Cis", "co"]))
+        
+        assert batch.vendor[0] is batch.vendor[1]
+    
+    def test_concat_and_pickle(self):
+        """Test concatenating batches and lists, and pickling the result"""
+        devices = self._devices()
+        batch = DeviceBatch.concat([DeviceBatch.from_devices(devices[:1]), devices[1:]])
+        
+        assert PickleSerializer().loads(PickleSerializer().dumps(batch)) == devices
+
+class TestDeviceDeduplicator:
+    """Test merging of repeated devices"""
+    
+    def _batch(self, *rows):
+        batch = DeviceBatch()
+        for row in rows:
+            batch.add(lat=51.5, lon=-0.09, device_type="router", **row)
+        return batch
+    
+    def test_keeps_freshest_fields_and_strongest_signal(self):
+        """Test duplicates across batches merge into the first occurrence"""
+        merged = DeviceDeduplicator.merge([
+            self._batch({"bssid": "AA:BB", "timestamp": "2025-01-01", "ssid": "Old", "signal": -40},
+                        {"ip": "10.0.0.1", "timestamp": None}),
+            self._batch({"bssid": "aa:bb", "timestamp": "2025-02-01", "ssid": "New", "signal": -70},
+                        {"bssid": "CC:DD", "timestamp": None})
+        ])
+        
+        assert len(merged) == 3
+        assert merged[0].ssid == "New"
+        assert merged[0].signal == -40
+        assert [d.bssid for d in merged] == ["aa:bb", None, "CC:DD"]
+    
+    def test_duplicates_within_batch_and_anonymous_rows(self):
+        """Test repeats inside one batch merge and rows without identity are kept"""
+        deduplicator = DeviceDeduplicator()
+        deduplicator.feed(self._batch(
+            {"cell_id": "42", "timestamp": None},
+            {"cell_id": "42", "timestamp": 5, "signal": -80},
+            {"timestamp": None},
+            {"timestamp": None}
+        ))
+        
+        assert len(deduplicator.batch) == 3
+        assert deduplicator.duplicates == 1
+        assert deduplicator.batch[0].timestamp == 5
+        assert deduplicator.batch[0].signal == -80
+
+class TestResponseEncoder:
+    """Test the JSON response encoder"""
+    
+    def _batch(self):
+        return DeviceBatch.from_devices([
+            Device(lat=51.5, lon=-0.09, device_type="car", timestamp="2025-02-03T10:00:00Z",
+                   ssid='Tesla "Model" 3 \u00e9', vendor="Tesla", signal=-67),
+            Device(lat=1.25, lon=2.0, device_type="cell_tower", timestamp=None,
+                   cell_id="1234", accuracy=900)
+        ])
+    
+    @pytest.mark.parametrize("use_orjson", [False, True])
+    def test_matches_to_dicts(self, use_orjson):
+        """Test that both encoder paths produce the classic response"""
+        if use_orjson and app_module.orjson is None:
+            pytest.skip("orjson not installed")
+        batch = self._batch()
+        
+        body = ResponseEncoder(use_orjson=use_orjson).encode({"count": 2, "status": "success"}, batch)
+        
+        assert json.loads(body) == {"devices": batch.to_dicts(), "count": 2, "status": "success"}
+        assert list(json.loads(body))[0] == "devices"
+    
+    def test_empty_payload_and_batch(self):
+        """Test the stdlib path with nothing but an empty device list"""
+        assert json.loads(ResponseEncoder(use_orjson=False).encode({}, DeviceBatch())) == {"devices": []}
+
+class TestTileSummary:
+    """Test mergeable device aggregates"""
+    
+    def _batch(self, signals, vendor="Cisco"):
+        batch = DeviceBatch()
+        for signal in signals:
+            batch.add(lat=51.5, lon=-0.09, device_type="router", timestamp=None,
+                      vendor=vendor, signal=signal)
+        return batch
+    
+    def test_merge_matches_union(self):
+        """Test merged summaries equal the summary of all devices"""
+        first, second = self._batch([-40, -50, None]), self._batch([-60, 0, -70], vendor="Netgear")
+        merged = TileSummary.from_devices(first).merge(TileSummary.from_devices(second))
+        union = TileSummary.from_devices(DeviceBatch.concat([first, second]))
+        
+        assert len(merged) == 6
+        assert merged.types == union.types == {'router': 6}
+        assert merged.top_vendors() == {'Cisco': 3, 'Netgear': 3}
+        assert merged.average_signal() == union.average_signal() == -55
+    
+    def test_percentiles(self):
+        """Test nearest-rank percentiles over the signal histogram"""
+        summary = TileSummary.from_devices(self._batch(range(-100, 0)))
+        
+        assert summary.percentile(50) == -51
+        assert summary.percentile(90) == -11
+        assert TileSummary().percentile(50) is None
+    
+    def test_vendor_sketch_bounded(self):
+        """Test the vendor sketch stays bounded and keeps heavy hitters"""
+        summary = TileSummary(sketch_size=4)
+        for i in range(50):
+            summary.merge(TileSummary.from_devices(self._batch([None], vendor=f"Vendor-{i}")))
+            summary.merge(TileSummary.from_devices(self._batch([None] * 3, vendor="Cisco")))
+        
+        assert len(summary.vendors) <= 4
+        assert next(iter(summary.top_vendors(1))) == "Cisco"
+    
+    def test_encode_round_trip(self):
+        """Test summaries survive their shared-cache encoding"""
+        summary = TileSummary.from_devices(self._batch([-40, -50, None, 0]))
+        
+        tag, restored = TileSummary.decode(summary.encode(1700000000.25))
+        
+        assert tag == 1700000000.25
+        assert restored.types == summary.types and restored.vendors == summary.vendors
+        assert restored.signals == summary.signals and restored.percentile(50) == summary.percentile(50)
+        assert restored.average_signal() == summary.average_signal()
+    
+    def test_shared_between_workers(self, monkeypatch):
+        """Test a tile summarized by one worker is reused by another through the provider cache"""
+        backend = DictBackend()
+        cache = ProviderCache(backend, serializer=PickleSerializer())
+        batch = self._batch([-40, -50])
+        built = []
+        from_devices = TileSummary.from_devices.__func__
+        monkeypatch.setattr(TileSummary, 'from_devices',
+                            classmethod(lambda cls, devices: built.append(1) or from_devices(cls, devices)))
+        
+        def fetch_tile(zoom, x, y):
+            return cache.get_or_fetch(f"tile:{zoom}/{x}/{y}", lambda: batch, soft_ttl=60, hard_ttl=600)
+        
+        x, y = TileMath.lat_lon_to_tile(51.5, -0.09, 13)
+        tile = TileMath.tile_bounds(13, x, y)
+        bounds = {'latrange1': tile['latrange1'] + 1e-6, 'latrange2': tile['latrange2'] - 1e-6,
+                  'longrange1': tile['longrange1'] + 1e-6, 'longrange2': tile['longrange2'] - 1e-6}
+        workers = [app_module.TileFetcher(SpatialIndex(), summaries=cache) for _ in range(2)]
+        summaries = [worker.summarize('wifi', bounds, fetch_tile, clip=False) for worker in workers]
+        
+        assert [len(summary) for summary in summaries] == [2, 2]
+        assert len(built) == 1
+        assert backend.get(f"tile:13/{x}/{y}:summary") is not None
+
+class TestClusterIndex:
+    """Test hierarchical point clustering"""
+    
+    def _batch(self):
+        batch = DeviceBatch()
+        # A dense block of 50 devices and one device far away from it
+        for i in range(50):
+            batch.add(lat=51.505 + i * 1e-5, lon=-0.09, device_type="router" if i % 2 else "car",
+                      timestamp=None)
+        batch.add(lat=51.6, lon=0.1, device_type="tv", timestamp=None)
+        return batch
+    
+    def test_counts_preserved_at_every_zoom(self):
+        """Test each device is in exactly one cluster or listed on its own"""
+        index = ClusterIndex({'wifi': self._batch()})
+        bounds = CoordinateValidator.calculate_bounds(51.55, 0.0, 0.1)
+        
+        for zoom in range(0, Config.CLUSTER_MAX_ZOOM + 2):
+            clusters, points = index.get_clusters(bounds, zoom)
+            assert sum(c['count'] for c in clusters) + len(points) == 51
+        
+        clusters, points = index.get_clusters(bounds, 12)
+        assert len(clusters) == 1 and len(points) == 1
+        assert clusters[0]['types'] == {'router': 25, 'car': 25}
+        assert index.get_clusters(bounds, Config.CLUSTER_MAX_ZOOM + 1) == ([], list(range(51)))
+    
+    def test_memory_estimate_bounds_cache(self):
+        """Test indexes are weighed in bytes, so the cluster cache cap is a real bound"""
+        small = ClusterIndex({'wifi': self._batch()})
+        large = ClusterIndex({'wifi': DeviceBatch.concat([self._batch()] * 10)})
+        cache = L1Cache(max_bytes=large.nbytes * 3 // 2, ttl=60)
+        
+        assert len(small) * 100 < small.nbytes < large.nbytes
+        cache.set('small', small, small.nbytes)
+        cache.set('large', large, large.nbytes)
+        cache.set('again', large, large.nbytes)
+        assert cache.get('small') is None and cache.get('large') is None
+        assert cache.size == large.nbytes
+    
+    def test_expand(self):
+        """Test a cluster expands into the items of the next zoom level"""
+        index = ClusterIndex({'wifi': self._batch()})
+        bounds = CoordinateValidator.calculate_bounds(51.55, 0.0, 0.1)
+        cluster = index.get_clusters(bounds, 10)[0][0]
+        
+        clusters, points, zoom = index.expand(cluster['id'])
+        
+        assert zoom == cluster['expansion_zoom']
+        assert sum(c['count'] for c in clusters) + len(points) == cluster['count']
+        assert index.expand(10 ** 6) is None
+    
+    def test_ids_stable_across_rebuilds(self):
+        """Test an index rebuilt from the same devices reuses cluster ids"""
+        bounds = CoordinateValidator.calculate_bounds(51.55, 0.0, 0.1)
+        first = ClusterIndex({'wifi': self._batch()}).get_clusters(bounds, 14)
+        second = ClusterIndex({'wifi': self._batch()}).get_clusters(bounds, 14)
+        
+        assert first == second
+
+def _read_protobuf(data):
+    """Decode protobuf fields into {number: [values]} (length-delimited values stay bytes)"""
+    fields = {}
+    offset = 0
+    
+    def varint():
+        nonlocal offset
+        value = shift = 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                return value
+    
+    while offset < len(data):
+        key = varint()
+        if key & 7 == 0:
+            value = varint()
+        elif key & 7 == 1:
+            value = data[offset:offset + 8]
+            offset += 8
+        else:
+            length = varint()
+            value = data[offset:offset + length]
+            offset += length
+        fields.setdefault(key >> 3, []).append(value)
+    return fields
+
+class TestTileEncoder:
+    """Test vector tile and GeoJSON encoding"""
+    
+    def _tile(self):
+        x, y = TileMath.lat_lon_to_tile(51.505, -0.09, 15)
+        bounds = TileMath.tile_bounds(15, x, y)
+        batch = DeviceBatch()
+        batch.add(lat=bounds['latrange2'], lon=bounds['longrange1'], device_type="router",
+                  timestamp="2025-02-03T10:00:00Z", ssid="HomeNet", signal=-60)
+        batch.add(lat=bounds['latrange1'], lon=bounds['longrange2'], device_type="router",
+                  timestamp="2025-02-03T10:00:00Z", accuracy=12.5)
+        return batch, x, y
+    
+    def test_mvt_layer_structure(self):
+        """Test layers, shared value table and point geometry"""
+        batch, x, y = self._tile()
+        tile = _read_protobuf(TileEncoder().encode_mvt({'wifi': batch, 'towers': DeviceBatch()}, 15, x, y))
+        
+        assert len(tile[3]) == 1  # Empty layers are skipped
+        layer = _read_protobuf(tile[3][0])
+        assert layer[1] == [b'wifi']
+        assert layer[15] == [2] and layer[5] == [4096]
+        assert b'ssid' in layer[3] and b'accuracy' in layer[3]
+        # Both devices share the 'router' and timestamp values
+        assert len(layer[4]) == 5
+        
+        first, second = (_read_protobuf(feature) for feature in layer[2])
+        assert first[3] == [1]
+        # MoveTo(1) then zigzag-encoded (0, 0) and (4096, 4096)
+        assert first[4] == [bytes([9, 0, 0])]
+        assert _read_protobuf(bytes([0x08]) + second[4][0][1:3])[1] == [8192]
+    
+    def test_mvt_clusters_layer(self):
+        """Test clusters are written to their own layer with per-type counts"""
+        batch, x, y = self._tile()
+        cluster = {"id": 3, "lat": batch.lat[0], "lon": batch.lon[0], "count": 7,
+                   "types": {"router": 5, "car": 2}, "expansion_zoom": 16}
+        tile = _read_protobuf(TileEncoder().encode_mvt({'wifi': batch}, 15, x, y, [cluster]))
+        
+        layer = _read_protobuf(tile[3][1])
+        assert layer[1] == [b'clusters']
+        assert layer[3] == [b'cluster_id', b'count', b'expansion_zoom', b'count_router', b'count_car']
+    
+    def test_geojson(self):
+        """Test GeoJSON features carry their layer and fields"""
+        batch, _, _ = self._tile()
+        collection = json.loads(TileEncoder.encode_geojson({'wifi': batch}))
+        
+        feature = collection['features'][0]
+        assert collection['type'] == 'FeatureCollection'
+        assert feature['geometry']['coordinates'] == [batch.lon[0], batch.lat[0]]
+        assert feature['properties']['layer'] == 'wifi'
+        assert feature['properties']['ssid'] == "HomeNet"
+
+class TestColumnarSerializer:
+    """Test the compact cache encoding"""
+    
+    def _devices(self, count):
+        return [
+            Device(lat=51.5 + i * 1e-5, lon=-0.09, device_type="router",
+                   timestamp="2025-02-03T10:00:00Z", ssid=f"Café_{i % 7}",
+                   bssid=f"00:14:22:01:{i // 256:02x}:{i % 256:02x}",
+                   vendor="Cisco Systems", signal=-40 - i % 50)
+            for i in range(count)
+        ]
+    
+    def test_round_trip(self):
+        """Test that devices survive encoding, including None and unicode fields"""
+        devices = self._devices(50) + [
+            Device(lat=1.0, lon=2.0, device_type="cell_tower", timestamp=None,
+                   cell_id="1234", accuracy=900, vendor="LTE Tower")
+        ]
+        serializer = ColumnarSerializer()
+        
+        fetched_at, decoded = serializer.loads(serializer.dumps((1700000000.5, devices)))
+        
+        assert fetched_at == 1700000000.5
+        assert decoded == devices
+    
+    def test_smaller_than_pickle(self):
+        """Test that the columnar form is more compact than pickle"""
+        entry = (time.time(), self._devices(1000))
+        
+        assert len(ColumnarSerializer().dumps(entry)) * 3 < len(PickleSerializer().dumps(entry))
+    
+    def test_uncompressed_round_trip(self):
+        """Test the format without compression"""
+        serializer = ColumnarSerializer(compression='none')
+        devices = self._devices(20)
+        
+        assert serializer.loads(serializer.dumps((0.0, devices)))[1] == devices
+    
+    def test_version_checked(self):
+        """Test that entries from another format version are rejected"""
+        blob = bytearray(ColumnarSerializer().dumps((0.0, self._devices(1))))
+        blob[4] = ColumnarSerializer.VERSION + 1
+        
+        with pytest.raises(ValueError):
+            ColumnarSerializer().loads(bytes(blob))
+    
+    def test_setting_not_read_by_flask_caching(self):
+        """Test the serializer setting stays out of Flask-Caching's CACHE_SERIALIZER key"""
+        assert 'CACHE_SERIALIZER' not in app.config
+        assert app.config['PROVIDER_CACHE_SERIALIZER'] in app_module.CACHE_SERIALIZERS
+
+class TestL1Cache:
+    """Test the byte-bounded in-process cache"""
+    
+    def test_evicts_by_size(self):
+        """Test least recently used eviction beyond the byte cap"""
+        l1 = L1Cache(max_bytes=100, ttl=60)
+        l1.set('a', 'A', 60)
+        l1.set('b', 'B', 30)
+        l1.get('a')
+        l1.set('c', 'C', 30)
+        
+        assert l1.get('b') is None
+        assert l1.get('a') == 'A'
+        assert l1.get('c') == 'C'
+        assert l1.size == 90
+    
+    def test_oversized_entry_skipped(self):
+        """Test that entries larger than the whole cache are not stored"""
+        l1 = L1Cache(max_bytes=10, ttl=60)
+        l1.set('a', 'A', 11)
+        
+        assert l1.get('a') is None
+        assert l1.size == 0
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Replays scripted (status, delay) responses, then answers 200"""
+    
+    script = []
+    
+    def _respond(self):
+        status, delay = self.script.pop(0) if self.script else (200, 0)
+        time.sleep(delay)
+        body = json.dumps({"status": status}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    do_GET = do_POST = _respond
+    
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    """Local HTTP server standing in for a provider API"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    StubHandler.script = []
+
+class TestTransport:
+    """Test the provider HTTP transport"""
+    
+    def test_idempotent_call_retried(self, stub_server):
+        """Test that GET requests are retried on retryable statuses"""
+        StubHandler.script = [(503, 0), (200, 0)]
+        transport = Transport(backoff=0.01)
+        
+        response = transport.request('GET', f"{stub_server}/x", timeout=2)
+        
+        assert response.json() == {"status": 200}
+        assert [a.status for a in transport.attempts] == [503, 200]
+        assert [a.attempt for a in transport.attempts] == [0, 1]
+    
+    def test_non_idempotent_call_not_retried(self, stub_server):
+        """Test that POST requests fail after a single attempt"""
+        StubHandler.script = [(503, 0), (200, 0)]
+        transport = Transport(backoff=0.01)
+        
+        with pytest.raises(requests.exceptions.HTTPError):
+            transport.request('POST', f"{stub_server}/x", timeout=2)
+        assert len(transport.attempts) == 1
+    
+    def test_hedged_request_wins(self, stub_server):
+        """Test that a hedge answers when the first attempt is slow"""
+        StubHandler.script = [(200, 1.0)]
+        transport = Transport(hedge_after=0.05)
+        
+        started = time.monotonic()
+        transport.request('GET', f"{stub_server}/x", timeout=2)
+        
+        assert time.monotonic() - started < 0.8
+        assert any(a.hedged for a in transport.attempts)
+    
+    def test_attempts_reported_to_call_stats(self, stub_server):
+        """Test that attempt timings reach the provider call being served"""
+        stats = CallStats()
+        token = app_module.current_call_stats.set(stats)
+        try:
+            Transport().request('GET', f"{stub_server}/x", timeout=2)
+        finally:
+            app_module.current_call_stats.reset(token)
+        
+        assert len(stats.attempts) == 1
+        assert stats.attempts[0].elapsed_ms >= 0
+
+@pytest.mark.skipif(not _redis_available(), reason="Requires Redis connection")
+class TestCircuitBreaker:
+    """Test the Redis-backed provider circuit breakers"""
+    
+    def _breaker(self):
+        return CircuitBreaker(f"test-{uuid.uuid4().hex}", app_module.redis_client)
+    
+    def test_opens_on_error_rate(self):
+        """Test that failures above the error rate open the circuit"""
+        breaker = self._breaker()
+        for _ in range(Config.CIRCUIT_MIN_CALLS):
+            assert breaker.allow()
+            breaker.record(True, 0.1)
+        
+        assert breaker.state() == CircuitBreaker.OPEN
+        assert not breaker.allow()
+        assert CircuitBreaker(breaker.name, app_module.redis_client).state() == CircuitBreaker.OPEN
+    
+    def test_opens_on_slow_calls(self):
+        """Test that slow but successful calls open the circuit"""
+        breaker = self._breaker()
+        for _ in range(Config.CIRCUIT_MIN_CALLS):
+            breaker.allow()
+            breaker.record(False, Config.CIRCUIT_SLOW_CALL + 1)
+        
+        assert breaker.state() == CircuitBreaker.OPEN
+    
+    def test_half_open_probe_closes_circuit(self):
+        """Test that a single probe is let through and closes the circuit"""
+        breaker = self._breaker()
+        breaker._trip("test")
+        app_module.redis_client.delete(f"{breaker.prefix}:open")
+        other = CircuitBreaker(breaker.name, app_module.redis_client)
+        
+        assert breaker.state() == CircuitBreaker.HALF_OPEN
+        assert breaker.allow()
+        assert not other.allow()
+        
+        breaker.record(False, 0.1)
+        assert breaker.state() == CircuitBreaker.CLOSED
+    
+    def test_probe_cut_by_deadline_keeps_circuit_half_open(self, stub_server, monkeypatch):
+        """Test that a probe the request deadline cut short does not close the circuit"""
+        StubHandler.script = [(200, 2)]
+        api = app_module.APIClient(stub_server)
+        monkeypatch.setattr(api, 'breaker', self._breaker())
+        api.breaker._trip("test")
+        app_module.redis_client.delete(f"{api.breaker.prefix}:open")
+        
+        with Deadline(0.3).activate():
+            with pytest.raises(DeadlineExceeded):
+                api._make_request('GET', '/x')
+        
+        assert api.breaker.state() == CircuitBreaker.HALF_OPEN
+        assert CircuitBreaker(api.breaker.name, app_module.redis_client).allow()
+    
+    def test_open_circuit_fails_fast(self, stub_server, monkeypatch):
+        """Test that no HTTP attempt is made while the circuit is open"""
+        api = app_module.APIClient(stub_server)
+        monkeypatch.setattr(api, 'breaker', self._breaker())
+        api.breaker._trip("test")
+        
+        with pytest.raises(CircuitOpenError):
+            api._make_request('GET', '/x')
+        assert len(api.transport.attempts) == 0
+    
+    def test_failed_request_raises(self, stub_server, monkeypatch):
+        """Test that an HTTP error is raised instead of looking like an empty answer"""
+        StubHandler.script = [(500, 0)] * (Config.HTTP_MAX_RETRIES + 1)
+        api = app_module.APIClient(stub_server)
+        monkeypatch.setattr(api, 'breaker', self._breaker())
+        monkeypatch.setattr(api.transport, 'backoff', 0.01)
+        
+        with pytest.raises(ProviderError):
+            api._make_request('GET', '/x')
+        
+        def failing():
+            raise ProviderError("HTTP 500")
+        
+        _, providers = ProviderFanOut(max_workers=1).run({'wifi': failing})
+        assert providers['wifi']['status'] == 'error'
+        assert ProviderFanOut.is_partial(providers)
+    
+    def test_fanout_reports_open_circuit(self):
+        """Test that an open circuit is reported in the providers block"""
+        def open_circuit():
+            raise CircuitOpenError("open")
+        
+        _, providers = ProviderFanOut(max_workers=1).run({'wifi': open_circuit})
+        assert providers['wifi']['status'] == 'circuit_open'
+
+class TestWiglePagination:
+    """Test searchAfter pagination of WiGLE searches"""
+    
+    def _fake_pages(self, pages, calls, fail_after=None):
+        def fake_request(method, endpoint, params=None, **kwargs):
+            calls.append(dict(params))
+            page = int(params.get('searchAfter', 0))
+            if fail_after is not None and page >= fail_after:
+                raise DeadlineExceeded("No time budget left")
+            return {
+                "results": [{"ssid": f"Net-{page}-{i}", "netid": f"{page}:{i}", "trilat": 51.5,
+                             "trilong": -0.09} for i in range(3)],
+                "searchAfter": str(page + 1) if page + 1 < pages else None
+            }
+        return fake_request
+    
+    def test_follows_cursor(self, monkeypatch):
+        """Test every page is requested and parsed in order"""
+        calls = []
+        monkeypatch.setattr(app_module.wigle_api, '_make_request', self._fake_pages(3, calls))
+        
+        devices = app_module.wigle_api.search_by_ssid("Net")
+        
+        assert len(devices) == 9
+        assert devices.bssid[-1] == "2:2"
+        assert [c.get('searchAfter') for c in calls] == [None, '1', '2']
+        assert calls[0]['resultsPerPage'] == Config.WIGLE_RESULTS_PER_PAGE
+    
+    def test_stops_at_result_limit(self, monkeypatch):
+        """Test the result cap truncates the last page and stops paging"""
+        calls = []
+        monkeypatch.setattr(app_module.wigle_api, '_make_request', self._fake_pages(10, calls))
+        monkeypatch.setattr(Config, 'WIGLE_MAX_RESULTS', 7)
+        
+        assert len(app_module.wigle_api.search_by_bssid("00:11")) == 7
+        assert len(calls) == 3
+    
+    def test_deadline_keeps_earlier_pages(self, monkeypatch):
+        """Test a deadline on a later page ends the search with the pages so far"""
+        calls = []
+        monkeypatch.setattr(app_module.wigle_api, '_make_request', self._fake_pages(5, calls, fail_after=2))
+        
+        pages = list(app_module.wigle_api.iter_pages('/network/search', {'ssid': 'Net'},
+                                                     app_module.wigle_api._parse_networks,
+                                                     keep_partial=True))
+        assert [len(page) for page in pages] == [3, 3]
+        
+        monkeypatch.setattr(app_module.wigle_api, '_make_request', self._fake_pages(5, calls, fail_after=0))
+        with pytest.raises(DeadlineExceeded):
+            app_module.wigle_api.search_by_ssid("Net")
+    
+    def test_truncated_tile_not_cached(self, monkeypatch):
+        """Test a tile search cut short by the deadline fails and leaves no cache entry"""
+        calls = []
+        monkeypatch.setattr(app_module.wigle_api, '_make_request', self._fake_pages(3, calls, fail_after=1))
+        tile = (13, 4090 + uuid.uuid4().int % 1000, 2720)
+        key = f"provider:WigleAPI._search_networks_tile:{tile!r}"
+        
+        with pytest.raises(DeadlineExceeded):
+            app_module.wigle_api._search_networks_tile(*tile)
+        
+        assert len(calls) == 2
+        assert app_module.provider_cache.l1.get(key) is None
+        assert app_module.provider_cache.backend.get(key) is None
+
+class TestCellStore:
+    """Test the offline OpenCellID store"""
+    
+    DUMP = [
+        "radio,mcc,net,area,cell,unit,lon,lat,range,samples,changeable,created,updated,averageSignal",
+        "LTE,234,10,1234,5678901,0,-0.0901,51.5051,800,12,1,1459692000,1700000000,-85",
+        "GSM,234,15,40,1001,0,-0.0899,51.5049,1500,3,1,1459692000,1600000000,0",
+        "UMTS,234,20,7,222,0,2.3522,48.8566,1000,5,1,1459692000,1650000000,",
+        "LTE,234,10,not-a-number,1,0,-0.09,51.5,800,1,1,0,0,0",
+        "NR,234,30,9,333,0,-0.0950,51.5060,300,2,1,1459692000,1690000000,-70",
+        "LTE,234,10,1,1,0,-0.09,95.0,800,1,1,0,0,0"
+    ]
+    
+    def _store(self, tmp_path, chunk_rows=2):
+        path = str(tmp_path / "cells.bin")
+        assert CellStore.ingest(self.DUMP, path, chunk_rows=chunk_rows) == (4, 2)
+        return CellStore(path)
+    
+    def test_ingest_sorts_by_tile(self, tmp_path):
+        """Test sorted runs are merged into tile-ordered columns"""
+        store = self._store(tmp_path)
+        zoom, columns, _ = store._open()
+        
+        assert list(columns['key']) == sorted(columns['key'])
+        assert len(columns['cell']) == 4
+    
+    def test_query_box(self, tmp_path):
+        """Test box queries return the towers inside it as devices"""
+        store = self._store(tmp_path)
+        
+        towers = store.query(CoordinateValidator.calculate_bounds(51.505, -0.09, 0.001))
+        
+        assert sorted(towers.cell_id) == ["234-10-1234-5678901", "234-15-40-1001"]
+        lte = list(towers)[towers.cell_id.index("234-10-1234-5678901")]
+        assert (lte.lat, lte.lon, lte.signal, lte.accuracy) == (51.5051, -0.0901, -85, 800)
+        assert lte.vendor == "LTE Tower" and lte.device_type == DeviceType.CELL_TOWER.value
+        assert lte.timestamp == "2023-11-14T22:13:20Z"
+        assert list(towers)[towers.cell_id.index("234-15-40-1001")].signal is None
+    
+    def test_coverage(self, tmp_path):
+        """Test empty tiles are told apart from tiles the dump does not cover"""
+        store = self._store(tmp_path)
+        
+        x, y = TileMath.lat_lon_to_tile(51.52, -0.05, 13)
+        assert len(store.tile(13, x, y)) == 0
+        assert store.tile(13, *TileMath.lat_lon_to_tile(-33.86, 151.2, 13)) is None
+        assert len(store.tile(13, *TileMath.lat_lon_to_tile(51.505, -0.09, 13))) == 3
+    
+    def test_missing_store(self, tmp_path):
+        """Test queries report a missing store file"""
+        assert CellStore(str(tmp_path / "missing.bin")).tile(13, 4093, 2723) is None
+    
+    def test_search_towers_uses_store_first(self, tmp_path, monkeypatch):
+        """Test tower lookups are answered from the store without the API"""
+        monkeypatch.setattr(app_module, 'cell_store', self._store(tmp_path))
+        monkeypatch.setattr(app_module.tile_fetcher, 'index', SpatialIndex())
+        api_calls = []
+        monkeypatch.setattr(app_module.opencellid_api, '_search_towers_tile',
+                            lambda *args: api_calls.append(args) or DeviceBatch())
+        
+        towers = app_module.opencellid_api.search_towers(51.505, -0.09)
+        assert len(towers) >= 2 and api_calls == []
+        
+        # A tile without towers inside the dump's coverage is a real empty answer
+        assert len(app_module.opencellid_api.search_towers(51.52, -0.05)) == 0
+        assert api_calls == []
+        
+        app_module.opencellid_api.search_towers(-33.86, 151.2)
+        assert len(api_calls) == 1
+
+class TestDeviceStore:
+    """Test the local store of imported WiGLE exports"""
+    
+    EXPORT = [
+        "WigleWifi-1.4,appRelease=2.70,model=Pixel 7,release=14,device=panther,display=,board=,brand=google",
+        "MAC,SSID,AuthMode,FirstSeen,Channel,RSSI,CurrentLatitude,CurrentLongitude,AltitudeMeters,AccuracyMeters,Type",
+        "aa:bb:cc:00:00:01,HomeNet,[WPA2-PSK-CCMP][ESS],2024-05-01 10:00:00,6,-70,51.5050,-0.0900,20,5,WIFI",
+        "aa:bb:cc:00:00:01,HomeNet,[WPA2-PSK-CCMP][ESS],2024-05-01 10:05:00,6,-80,51.5052,-0.0902,20,8,WIFI",
+        "AA:BB:CC:00:00:01,HomeNet,[WPA2-PSK-CCMP][ESS],2024-05-01 09:55:00,6,-60,51.5060,-0.0910,20,4,WIFI",
+        "11:22:33:44:55:66,AirPods Pro,Misc [LE],2024-05-01 10:01:00,0,-75,51.5051,-0.0901,20,6,BLE",
+        "310260_1234_5678,T-Mobile,LTE;310260,2024-05-01 10:01:00,66,-95,51.5051,-0.0901,20,6,LTE",
+        "aa:bb:cc:00:00:02,Broken,[ESS],2024-05-01 10:02:00,1,-70,not-a-lat,-0.09,20,5,WIFI"
+    ]
+    
+    def _store(self, tmp_path, chunk_rows=2):
+        path = str(tmp_path / "devices.sqlite3")
+        assert DeviceStore.import_csv(self.EXPORT, path, chunk_rows=chunk_rows) == (4, 2)
+        return DeviceStore(path)
+    
+    def test_import_merges_sightings(self, tmp_path):
+        """Test repeated sightings merge into the freshest one with the strongest signal"""
+        store = self._store(tmp_path)
+        
+        networks = store.search_bssid("aa:bb:cc:00:00:01")
+        
+        assert len(networks) == 1
+        network = networks[0]
+        assert (network.lat, network.lon, network.timestamp) == (51.5052, -0.0902, "2024-05-01T10:05:00Z")
+        assert (network.signal, network.accuracy, network.ssid) == (-60, 8, "HomeNet")
+    
+    def test_tile_layers_and_classification(self, tmp_path):
+        """Test tiles are split by layer and devices classified on import"""
+        store = self._store(tmp_path)
+        x, y = TileMath.lat_lon_to_tile(51.505, -0.09, Config.TILE_ZOOM)
+        
+        bluetooth = store.tile('bluetooth', Config.TILE_ZOOM, x, y)
+        
+        assert [d.device_type for d in bluetooth] == [DeviceType.HEADPHONE.value]
+        assert bluetooth.vendor == ["BLE"]
+        assert len(store.tile('wifi', Config.TILE_ZOOM, x, y)) == 1
+        assert len(store.query('wifi', CoordinateValidator.calculate_bounds(51.505, -0.09, 0.0001))) == 0
+    
+    def test_reimport_is_idempotent(self, tmp_path):
+        """Test importing an export twice keeps one row per device"""
+        store = self._store(tmp_path)
+        DeviceStore.import_csv(self.EXPORT, store.path)
+        
+        x, y = TileMath.lat_lon_to_tile(51.505, -0.09, Config.TILE_ZOOM)
+        assert len(store.tile('wifi', Config.TILE_ZOOM, x, y)) == 1
+    
+    def test_searches_use_store_first(self, tmp_path, monkeypatch):
+        """Test WiGLE searches are answered locally and fall back to the API"""
+        monkeypatch.setattr(app_module, 'device_store', self._store(tmp_path))
+        monkeypatch.setattr(app_module.tile_fetcher, 'index', SpatialIndex())
+        api_calls = []
+        monkeypatch.setattr(app_module.wigle_api, '_search_networks_tile',
+                            lambda *args: api_calls.append(args) or DeviceBatch())
+        monkeypatch.setattr(app_module.wigle_api, 'iter_pages',
+                            lambda *args, **kwargs: api_calls.append(args) or iter(()))
+        
+        assert len(app_module.wigle_api.search_networks(51.505, -0.09, 0.001)) == 1
+        assert len(app_module.wigle_api.search_by_bssid("AA:BB:CC:00:00:01")) == 1
+        assert api_calls == []
+        
+        app_module.wigle_api.search_by_bssid("00:00:00:00:00:00")
+        assert len(api_calls) == 1
+
+class TestCacheWarmer:
+    """Test pre-warming the provider caches"""
+    
+    def test_cover_geojson(self):
+        """Test polygons cover their inside and boundary tiles, holes excluded"""
+        square = [[-0.2, 51.45], [0.0, 51.45], [0.0, 51.55], [-0.2, 51.55], [-0.2, 51.45]]
+        box = {'latrange1': 51.45, 'latrange2': 51.55, 'longrange1': -0.2, 'longrange2': 0.0}
+        
+        polygon = CacheWarmer.cover_geojson({"type": "Polygon", "coordinates": [square]}, 13)
+        triangle = CacheWarmer.cover_geojson({"type": "Feature", "geometry": {
+            "type": "Polygon", "coordinates": [[[-0.2, 51.45], [0.0, 51.45], [-0.2, 51.55], [-0.2, 51.45]]]
+        }}, 13)
+        hole = [[-0.15, 51.47], [-0.05, 51.47], [-0.05, 51.53], [-0.15, 51.53], [-0.15, 51.47]]
+        holed = CacheWarmer.cover_geojson({"type": "Polygon", "coordinates": [square, hole]}, 13)
+        
+        assert polygon == set(TileMath.tiles_for_bounds(box, 13))
+        assert triangle < polygon and len(triangle) < len(polygon) * 0.7
+        assert TileMath.lat_lon_to_tile(51.5, -0.1, 13) in polygon - holed
+        assert CacheWarmer.cover_geojson({"type": "FeatureCollection", "features": [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [-0.09, 51.505]}}
+        ]}, 13) == {TileMath.lat_lon_to_tile(51.505, -0.09, 13)}
+        with pytest.raises(ValueError):
+            CacheWarmer.cover_geojson({"type": "Circle"}, 13)
+    
+    def test_resume_retries_failed_tiles(self, tmp_path, monkeypatch):
+        """Test finished tiles are recorded and skipped when resuming"""
+        calls = []
+        failing = {(1, 1)}
+        
+        def fake_tile(zoom, x, y):
+            calls.append((x, y))
+            if (x, y) in failing:
+                raise RuntimeError("upstream down")
+            return DeviceBatch()
+        
+        monkeypatch.setitem(app_module.DEVICE_LAYERS, 'wifi', fake_tile)
+        state = str(tmp_path / "warm.state")
+        tiles = {(0, 0), (0, 1), (1, 1)}
+        
+        first = CacheWarmer(['wifi'], workers=2, state_path=state).run(tiles)
+        failing.clear()
+        second = CacheWarmer(['wifi'], workers=2, state_path=state).run(tiles, resume=True)
+        
+        assert (first["done"], first["failed"]) == (2, 1)
+        assert (second["done"], second["skipped"]) == (1, 2)
+        assert sorted(calls) == [(0, 0), (0, 1), (1, 1), (1, 1)]
+        assert CacheWarmer(['wifi'], state_path=state).run(tiles)["done"] == 3
+        
+        # Tiles warmed longer ago than the cache keeps them are warmed again
+        monkeypatch.setattr(Config, 'CACHE_HARD_TTL', -1)
+        assert CacheWarmer(['wifi'], state_path=state).run(tiles, resume=True)["skipped"] == 0
+    
+    def test_stale_entries_refreshed_within_budget(self, monkeypatch):
+        """Test stale tiles are refetched by the warmer, not in the background"""
+        backend = DictBackend()
+        backend.set('k', PickleSerializer().dumps((time.time() - 120, ['old'])))
+        cache = ProviderCache(backend, serializer=PickleSerializer())
+        monkeypatch.setattr(cache, '_schedule_refresh', lambda *args: pytest.fail("background refresh"))
+        
+        def fetch():
+            app_module.current_call_stats.get().observe_attempt(app_module.TransportAttempt(
+                method='GET', url='http://provider/tile', attempt=0, hedged=False, elapsed_ms=1.0
+            ))
+            return ['new']
+        
+        monkeypatch.setitem(app_module.DEVICE_LAYERS, 'wifi',
+                            lambda zoom, x, y: cache.get_or_fetch('k', fetch, soft_ttl=60, hard_ttl=600))
+        counters = CacheWarmer(['wifi'], rates={}).run({(0, 0)})
+        
+        assert counters["attempts"] == 1
+        assert PickleSerializer().loads(backend.get('k'))[1] == ['new']
+    
+    def test_budget_charges_upstream_attempts(self):
+        """Test only upstream attempts consume the rate budget"""
+        budget = UpstreamBudget(rate=50)
+        
+        budget.charge(0)
+        started = time.monotonic()
+        budget.wait()
+        assert time.monotonic() - started < 0.01
+        
+        budget.charge(3)
+        budget.wait()
+        assert time.monotonic() - started >= 0.05
+    
+    def test_cli(self, tmp_path, monkeypatch):
+        """Test the warm-cache command warms the tiles of a box"""
+        calls = []
+        monkeypatch.setitem(app_module.DEVICE_LAYERS, 'towers', lambda zoom, x, y: calls.append((x, y)))
+        
+        result = app.test_cli_runner().invoke(args=[
+            'warm-cache', '--bbox', '51.50,-0.10,51.51,-0.09', '--layers', 'towers',
+            '--state', str(tmp_path / "warm.state")
+        ])
+        
+        assert result.exit_code == 0, result.output
+        assert len(calls) == len(TileMath.tiles_for_bounds(
+            {'latrange1': 51.50, 'latrange2': 51.51, 'longrange1': -0.10, 'longrange2': -0.09}, Config.TILE_ZOOM))
+        assert "Warmed" in result.output
+        
+        # A new run warms everything again unless asked to resume
+        result = app.test_cli_runner().invoke(args=[
+            'warm-cache', '--bbox', '51.50,-0.10,51.51,-0.09', '--layers', 'towers',
+            '--state', str(tmp_path / "warm.state")
+        ])
+        assert "calls, 0 skipped" in result.output
+        assert app.test_cli_runner().invoke(args=['warm-cache', '--layers', 'nope']).exit_code != 0
+
+def _classify_reference(name, original_type="unknown"):
+    """Uncompiled substring scan that DeviceClassifier.classify() must agree with"""
+    if not name:
+        return original_type
+    
+    name_upper = name.upper()
+    for device_type, patterns in app_module.DEVICE_PATTERNS.items():
+        if any(pattern in name_upper for pattern in patterns):
+            return device_type.value
+    
+    return original_type
+
 class TestDeviceClassifier:
     """Test device classification"""
     
@@ -118,6 +1491,24 @@ class TestDeviceClassifier:
         assert DeviceClassifier.classify("TESLA") == DeviceType.CAR.value
         assert DeviceClassifier.classify("TeSLa") == DeviceType.CAR.value
     
+    def test_compiled_matches_reference(self):
+        """Test that the compiled matcher keeps the substring scan's precedence"""
+        patterns = [p for ps in app_module.DEVICE_PATTERNS.values() for p in ps]
+        names = patterns + [a + " " + b for a in patterns[::3] for b in patterns[::5]] + [
+            "xfinitywifi", "NETGEAR-5G", "Sony WH-1000XM4", "camry", "", None
+        ]
+        
+        for name in names:
+            assert DeviceClassifier.classify(name, "router") == _classify_reference(name, "router")
+    
+    def test_classify_many(self):
+        """Test batch classification keeps order and fallback"""
+        names = ["Tesla Model 3", "xfinitywifi", None, "Tesla Model 3", "Ring Camera"]
+        
+        assert DeviceClassifier.classify_many(names, "router") == [
+            DeviceType.CAR.value, "router", "router", DeviceType.CAR.value, DeviceType.CAMERA.value
+        ]
+    
     def test_get_icon(self):
         """Test icon retrieval"""
         assert DeviceClassifier.get_icon(DeviceType.CAR.value) == "🚗"
@@ -176,6 +1567,113 @@ class TestDevice:
         assert 'vendor' not in device_dict
         assert 'signal' not in device_dict
 
+class TestProviderFanOut:
+    """Test concurrent provider execution"""
+    
+    def _device(self):
+        return Device(lat=0.0, lon=0.0, device_type="router", timestamp="2025-02-03T10:00:00Z")
+    
+    def test_calls_run_concurrently(self):
+        """Test that wall-clock time follows the slowest provider"""
+        def slow():
+            time.sleep(0.2)
+            return [self._device()]
+        
+        started = time.monotonic()
+        devices, providers = ProviderFanOut(max_workers=4).run({'a': slow, 'b': slow, 'c': slow})
+        
+        assert time.monotonic() - started < 0.5
+        assert len(devices) == 3
+        assert all(p['status'] == 'ok' for p in providers.values())
+    
+    def test_partial_results_on_failure(self):
+        """Test that a failing provider does not discard the others"""
+        def broken():
+            raise RuntimeError("upstream down")
+        
+        devices, providers = ProviderFanOut(max_workers=2).run({
+            'ok': lambda: [self._device()],
+            'broken': broken
+        })
+        
+        assert len(devices) == 1
+        assert providers['ok']['count'] == 1
+        assert providers['broken']['status'] == 'error'
+        assert ProviderFanOut.is_partial(providers) is True
+    
+    def test_tile_upstream_attempts_reported(self):
+        """Test that upstream attempts made behind the tile fetcher are counted"""
+        def fetch_tile(zoom, x, y):
+            app_module.current_call_stats.get().observe_attempt(app_module.TransportAttempt(
+                method='GET', url='http://provider/tile', attempt=0, hedged=False, elapsed_ms=1.0
+            ))
+            return DeviceBatch()
+        
+        fetcher = app_module.TileFetcher(SpatialIndex(ttl=60), max_workers=2)
+        _, providers = ProviderFanOut(max_workers=1).run({
+            'wifi': lambda: fetcher.fetch_many('wifi', [(1, 2), (1, 3)], fetch_tile)
+        })
+        
+        assert providers['wifi']['upstream_attempts'] == 2
+    
+    def test_stream_yields_in_completion_order(self):
+        """Test that fast providers are yielded before slow and late ones"""
+        def slow():
+            time.sleep(0.2)
+            return [self._device()]
+        
+        def late():
+            time.sleep(1)
+            return []
+        
+        results = list(ProviderFanOut(max_workers=3).stream(
+            {'slow': slow, 'late': late, 'fast': lambda: [self._device()]}, Deadline(0.5)
+        ))
+        
+        assert [name for name, _, _ in results] == ['fast', 'slow', 'late']
+        assert isinstance(results[0][1], DeviceBatch)
+        assert results[1][2]['count'] == 1
+        assert results[2][2]['status'] == 'timed_out'
+
+class TestDeadline:
+    """Test whole-request deadline budgets"""
+    
+    def test_late_provider_marked_timed_out(self):
+        """Test that a provider missing the deadline is dropped"""
+        def fast():
+            return [Device(lat=0.0, lon=0.0, device_type="router", timestamp="2025-02-03T10:00:00Z")]
+        
+        def slow():
+            time.sleep(1)
+            return []
+        
+        started = time.monotonic()
+        devices, providers = ProviderFanOut(max_workers=2).run(
+            {'fast': fast, 'slow': slow}, Deadline(0.2)
+        )
+        
+        assert time.monotonic() - started < 0.8
+        assert len(devices) == 1
+        assert providers['fast']['status'] == 'ok'
+        assert providers['slow']['status'] == 'timed_out'
+    
+    def test_expired_deadline_skips_upstream_call(self):
+        """Test that no HTTP request is made once the budget is spent"""
+        deadline = Deadline(0.1)
+        deadline.expires_at = time.monotonic() - 1
+        
+        with deadline.activate():
+            with pytest.raises(DeadlineExceeded):
+                app_module.wigle_api._make_request('GET', '/network/search')
+    
+    def test_deadline_parameter_capped(self):
+        """Test that the ?deadline= parameter is capped by the server"""
+        with app.test_request_context('/api/nearby?deadline=999'):
+            assert Deadline.from_request().seconds == Config.MAX_REQUEST_DEADLINE
+        
+        with app.test_request_context('/api/nearby'):
+            assert Deadline.from_request().seconds == Config.REQUEST_DEADLINE
+
 class TestAPIEndpoints:
     """Test API endpoints"""
     
@@ -239,6 +1737,295 @@ class TestAPIEndpoints:
         response = client.get('/api/nearby?lat=51.505&lon=-0.09&mode=all')
         assert response.status_code == 200
     
+    def test_nearby_partial_results(self, client, monkeypatch):
+        """Test nearby reports per-provider status when one source fails"""
+        def broken(*args, **kwargs):
+            raise RuntimeError("upstream down")
+        monkeypatch.setattr(app_module.wigle_api, 'search_networks', broken)
+        monkeypatch.setattr(app_module.wigle_api, 'search_bluetooth', lambda *args: DeviceBatch())
+        
+        response = client.get('/api/nearby?lat=51.505&lon=-0.09&mode=all')
+        assert response.status_code == 200
+        
+        data = json.loads(response.data)
+        assert data['status'] == 'success'
+        assert data['partial'] is True
+        assert data['providers']['wifi']['status'] == 'error'
+        assert set(data['providers']) == {'wifi', 'bluetooth', 'towers', 'iot'}
+        assert 'age_s' in data['providers']['bluetooth']
+    
+    def test_nearby_ndjson_stream(self, client, monkeypatch):
+        """Test nearby streams one line per provider and a final summary"""
+        monkeypatch.setattr(app_module.wigle_api, 'search_networks', lambda *args: DeviceBatch.from_devices([
+            Device(lat=51.505, lon=-0.09, device_type="router", timestamp=None, ssid="HomeNet")
+        ]))
+        monkeypatch.setattr(app_module.opencellid_api, 'search_towers', lambda *args: DeviceBatch())
+        
+        response = client.get('/api/nearby?lat=51.505&lon=-0.09',
+                              headers={'Accept': 'application/x-ndjson'})
+        
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        assert 'Accept' in response.headers['Vary']
+        frames = [json.loads(line) for line in response.data.splitlines()]
+        assert sorted(f['provider'] for f in frames[:-1]) == ['towers', 'wifi']
+        wifi = next(f for f in frames if f.get('provider') == 'wifi')
+        assert wifi['devices'][0]['ssid'] == "HomeNet"
+        assert frames[-1]['type'] == 'summary'
+        assert frames[-1]['count'] == 1
+        assert list(frames[-1]['providers']) == ['wifi', 'towers']
+    
+    def test_nearby_stream_rejects_limit_and_sort(self, client, monkeypatch):
+        """Test streamed responses refuse limit and sort instead of ignoring them"""
+        monkeypatch.setattr(app_module.wigle_api, 'search_networks', lambda *args: DeviceBatch())
+        monkeypatch.setattr(app_module.opencellid_api, 'search_towers', lambda *args: DeviceBatch())
+        
+        for query, accept in (('limit=2', 'application/x-ndjson'), ('sort=distance', 'application/x-ndjson'),
+                              ('limit=2&sort=distance', 'text/event-stream')):
+            response = client.get(f'/api/nearby?lat=51.505&lon=-0.09&{query}', headers={'Accept': accept})
+            assert response.status_code == 400
+            assert json.loads(response.data)['status'] == 'invalid_input'
+        
+        assert client.get('/api/nearby?lat=51.505&lon=-0.09&limit=2&sort=distance').status_code == 200
+    
+    def test_nearby_merges_duplicates_across_providers(self, client, monkeypatch):
+        """Test a device reported by two providers is returned once"""
+        device = Device(lat=51.505, lon=-0.09, device_type="router", timestamp=None, bssid="AA:BB")
+        monkeypatch.setattr(app_module.wigle_api, 'search_networks',
+                            lambda *args: DeviceBatch.from_devices([device]))
+        monkeypatch.setattr(app_module.wigle_api, 'search_bluetooth',
+                            lambda *args: DeviceBatch.from_devices([device]))
+        monkeypatch.setattr(app_module.opencellid_api, 'search_towers', lambda *args: DeviceBatch())
+        monkeypatch.setattr(app_module.shodan_api, 'search_geo', lambda *args: DeviceBatch())
+        
+        data = json.loads(client.get('/api/nearby?lat=51.505&lon=-0.09&mode=all').data)
+        
+        assert data['count'] == 1
+        assert data['providers']['wifi']['count'] == data['providers']['bluetooth']['count'] == 1
+        
+        stream = client.get('/api/nearby?lat=51.505&lon=-0.09&mode=all',
+                            headers={'Accept': 'application/x-ndjson'})
+        frames = [json.loads(line) for line in stream.data.splitlines()]
+        assert sum(len(f.get('devices', [])) for f in frames) == 1
+        assert frames[-1]['count'] == 1
+    
+    def test_nearby_event_stream(self, client, monkeypatch):
+        """Test nearby emits Server-Sent Events when asked for text/event-stream"""
+        monkeypatch.setattr(app_module.wigle_api, 'search_networks', lambda *args: DeviceBatch())
+        monkeypatch.setattr(app_module.opencellid_api, 'search_towers', lambda *args: DeviceBatch())
+        
+        response = client.get('/api/nearby?lat=51.505&lon=-0.09',
+                              headers={'Accept': 'text/event-stream'})
+        
+        assert response.mimetype == 'text/event-stream'
+        events = response.data.decode().strip().split('\n\n')
+        assert [e.splitlines()[0] for e in events] == ['event: devices'] * 2 + ['event: summary']
+        assert json.loads(events[-1].splitlines()[1][len('data: '):])['status'] == 'success'
+    
+    def test_device_tile_cached(self, client, monkeypatch):
+        """Test tiles are built from the layer lookups once, then served from Redis"""
+        calls = []
+        
+        def fake_tile(zoom, x, y):
+            calls.append((zoom, x, y))
+            tile = TileMath.tile_bounds(zoom, x, y)
+            return DeviceBatch.from_devices([Device(lat=(tile['latrange1'] + tile['latrange2']) / 2,
+                                                    lon=(tile['longrange1'] + tile['longrange2']) / 2,
+                                                    device_type="router", timestamp=None)])
+        
+        monkeypatch.setitem(app_module.DEVICE_LAYERS, 'wifi', fake_tile)
+        monkeypatch.setattr(app_module.tile_fetcher, 'index', SpatialIndex())
+        x, y = TileMath.lat_lon_to_tile(51.505, -0.09, Config.TILE_ZOOM)
+        app_module.cache.delete(f"tile:geojson:wifi:{Config.TILE_ZOOM}/{x}/{y}")
+        url = f'/api/tiles/{Config.TILE_ZOOM}/{x}/{y}.geojson?layers=wifi'
+        
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/geo+json'
+        assert 'max-age' in response.headers['Cache-Control']
+        assert len(json.loads(response.data)['features']) == 1
+        
+        cached = client.get(url)
+        assert cached.data == response.data
+        assert len(calls) == 1
+        
+        assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    
+    def test_nearby_clusters_and_expand(self, client, monkeypatch):
+        """Test nearby groups devices by zoom and clusters expand on demand"""
+        def fake_tile(zoom, x, y):
+            tile = TileMath.tile_bounds(zoom, x, y)
+            lat = (tile['latrange1'] + tile['latrange2']) / 2
+            lon = (tile['longrange1'] + tile['longrange2']) / 2
+            return DeviceBatch.from_devices([
+                Device(lat=lat + i * 1e-5, lon=lon, device_type="router", timestamp=None)
+                for i in range(20)
+            ])
+        
+        for layer in ('wifi', 'towers'):
+            monkeypatch.setitem(app_module.DEVICE_LAYERS, layer, fake_tile)
+        monkeypatch.setattr(app_module.tile_fetcher, 'index', SpatialIndex())
+        monkeypatch.setattr(app_module, 'cluster_cache', L1Cache())
+        
+        response = client.get('/api/nearby?lat=51.505&lon=-0.09&radius=0.05&zoom=11')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['clusters']
+        assert data['count'] == sum(c['count'] for c in data['clusters']) + len(data['devices'])
+        
+        cluster = data['clusters'][0]
+        expanded = client.get(f"/api/nearby/clusters/{cluster['id']}?lat=51.505&lon=-0.09&radius=0.05")
+        assert expanded.status_code == 200
+        expanded = json.loads(expanded.data)
+        assert expanded['zoom'] == cluster['expansion_zoom']
+        assert expanded['count'] == cluster['count']
+        
+        missing = client.get('/api/nearby/clusters/999999?lat=51.505&lon=-0.09&radius=0.05')
+        assert missing.status_code == 404
+    
+    def test_nearby_cluster_singles_ranked(self, client, monkeypatch):
+        """Test devices left outside clusters are cut to the circle, measured and limited"""
+        def fake_tile(zoom, x, y):
+            if (x, y) != TileMath.lat_lon_to_tile(51.505, -0.09, zoom):
+                return DeviceBatch()
+            # The corner of the search box lies outside its circle
+            return DeviceBatch.from_devices([
+                Device(lat=51.505 + i * 0.002, lon=-0.09, device_type="router", timestamp=None, ssid=f"Net-{i}")
+                for i in range(10)
+            ] + [Device(lat=51.5091, lon=-0.0835, device_type="router", timestamp=None, ssid="Corner")])
+        
+        monkeypatch.setitem(app_module.DEVICE_LAYERS, 'bluetooth', fake_tile)
+        monkeypatch.setattr(app_module.tile_fetcher, 'index', SpatialIndex())
+        monkeypatch.setattr(app_module, 'cluster_cache', L1Cache())
+        
+        response = client.get('/api/nearby?lat=51.5051&lon=-0.09&mode=bluetooth&radius=0.005'
+                              '&zoom=19&sort=distance&limit=2')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        
+        assert data['clusters'] == []
+        assert [d['ssid'] for d in data['devices']] == ["Net-0", "Net-1"]
+        assert data['devices'][0]['distance_m'] < data['devices'][1]['distance_m']
+        
+        response = client.get('/api/nearby?lat=51.5051&lon=-0.09&mode=bluetooth&radius=0.005&zoom=19')
+        data = json.loads(response.data)
+        assert sorted(d['ssid'] for d in data['devices']) == ["Net-0", "Net-1", "Net-2"]
+        assert data['count'] == 3
+    
+    def test_nearby_batch_shares_tiles(self, client, monkeypatch):
+        """Test batch lookups fetch each tile once and answer per point"""
+        calls = []
+        
+        def fake_tile(zoom, x, y):
+            calls.append((x, y))
+            tile = TileMath.tile_bounds(zoom, x, y)
+            return DeviceBatch.from_devices([
+                Device(lat=(tile['latrange1'] + tile['latrange2']) / 2,
+                       lon=(tile['longrange1'] + tile['longrange2']) / 2,
+                       device_type="router", timestamp=None, bssid=f"{x}:{y}")
+            ])
+        
+        monkeypatch.setitem(app_module.DEVICE_LAYERS, 'bluetooth', fake_tile)
+        monkeypatch.setattr(app_module.tile_fetcher, 'index', SpatialIndex())
+        x, y = TileMath.lat_lon_to_tile(51.505, -0.09, Config.TILE_ZOOM)
+        tile = TileMath.tile_bounds(Config.TILE_ZOOM, x, y)
+        center = ((tile['latrange1'] + tile['latrange2']) / 2, (tile['longrange1'] + tile['longrange2']) / 2)
+        
+        response = client.post('/api/nearby/batch', json={
+            "mode": "bluetooth",
+            "radius": 0.001,
+            "points": [{"lat": center[0], "lon": center[1]},
+                       {"lat": center[0] + 0.0005, "lon": center[1]},
+                       {"lat": center[0] + 0.005, "lon": center[1]}]
+        })
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert [r['count'] for r in data['results']] == [1, 1, 0]
+        assert data['results'][0]['devices'][0]['bssid'] == f"{x}:{y}"
+        assert len(calls) == len(set(calls)) == data['providers']['bluetooth']['tiles']
+    
+    def test_nearby_batch_validation(self, client):
+        """Test batch bodies are validated"""
+        assert client.post('/api/nearby/batch', json={}).status_code == 400
+        assert client.post('/api/nearby/batch', json={"points": [{"lat": 91, "lon": 0}]}).status_code == 400
+        too_many = [{"lat": 0, "lon": 0}] * (Config.BATCH_MAX_POINTS + 1)
+        assert client.post('/api/nearby/batch', json={"points": too_many}).status_code == 400
+        spread = [{"lat": 50 + i * 0.2, "lon": 0} for i in range(Config.BATCH_MAX_POINTS)]
+        response = client.post('/api/nearby/batch', json={"points": spread, "radius": 0.1})
+        assert response.status_code == 400
+        assert "tiles" in json.loads(response.data)['error']
+    
+    def test_corridor_fetches_route_tiles(self, client, monkeypatch):
+        """Test corridor searches fetch each tile once and filter by distance"""
+        calls = []
+        
+        def fake_tile(zoom, x, y):
+            calls.append((x, y))
+            tile = TileMath.tile_bounds(zoom, x, y)
+            return DeviceBatch.from_devices([
+                Device(lat=tile['latrange1'] + i * (tile['latrange2'] - tile['latrange1']) / 10,
+                       lon=(tile['longrange1'] + tile['longrange2']) / 2,
+                       device_type="headphones", timestamp=None, bssid=f"{x}:{y}:{i}")
+                for i in range(10)
+            ])
+        
+        monkeypatch.setitem(app_module.DEVICE_LAYERS, 'bluetooth', fake_tile)
+        monkeypatch.setattr(app_module.tile_fetcher, 'index', SpatialIndex())
+        route = [[51.5, -0.12], [51.5, -0.06]]
+        
+        response = client.post('/api/corridor', json={"route": route, "buffer": 300, "mode": "bluetooth"})
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert len(calls) == len(set(calls)) == data['tiles'] == data['providers']['bluetooth']['tiles']
+        assert data['count'] == len(data['devices']) > 0
+        assert all(abs(d['lat'] - 51.5) <= 300 / 111195 for d in data['devices'])
+    
+    def test_nearby_sorted_and_limited(self, client, monkeypatch):
+        """Test nearby devices are cut to the circle, sorted and limited"""
+        monkeypatch.setattr(app_module.wigle_api, 'search_networks', lambda *args: DeviceBatch.from_devices([
+            Device(lat=51.505 + offset, lon=-0.09, device_type="router", timestamp=None, ssid=f"Net{offset}")
+            for offset in (0.004, 0.001, 0.009, 0.002)
+        ]))
+        monkeypatch.setattr(app_module.opencellid_api, 'search_towers', lambda *args: DeviceBatch())
+        
+        response = client.get('/api/nearby?lat=51.505&lon=-0.09&radius=0.005&sort=distance&limit=2')
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert [d['ssid'] for d in data['devices']] == ["Net0.001", "Net0.002"]
+        assert data['devices'][0]['distance_m'] == pytest.approx(111.2, abs=0.1)
+        assert client.get('/api/nearby?lat=51.505&lon=-0.09&limit=0').status_code == 400
+        assert client.get('/api/nearby?lat=51.505&lon=-0.09&sort=name').status_code == 400
+    
+    def test_corridor_validation(self, client):
+        """Test corridor bodies are validated"""
+        assert client.post('/api/corridor', json={}).status_code == 400
+        assert client.post('/api/corridor', json={"route": [[91, 0], [0, 0]]}).status_code == 400
+        assert client.post('/api/corridor', json={"route": [[0, 0], [0, 1]], "buffer": 0}).status_code == 400
+        too_long = {"route": [[0, 0], [10, 10]], "buffer": 100}
+        assert client.post('/api/corridor', json=too_long).status_code == 400
+    
+    def test_device_tile_validation(self, client):
+        """Test tile zoom, coordinates and layers are validated"""
+        assert client.get('/api/tiles/3/1/1.mvt').status_code == 400
+        assert client.get('/api/tiles/13/9000/1.mvt').status_code == 400
+        assert client.get('/api/tiles/13/1/1.mvt?layers=wifi,nope').status_code == 400
+        assert client.get('/api/tiles/13/1/1.png').status_code == 404
+    
+    def test_search_reports_serialization_time(self, client, monkeypatch):
+        """Test that device responses carry the serialization time header"""
+        monkeypatch.setattr(app_module.wigle_api, 'search_by_ssid', lambda ssid: DeviceBatch.from_devices([
+            Device(lat=51.5, lon=-0.09, device_type="router", timestamp=None, ssid=ssid)
+        ]))
+        
+        response = client.get('/api/search?type=ssid&query=HomeNet')
+        
+        assert response.status_code == 200
+        assert response.headers['X-Serialization-Time'].endswith('ms')
+        assert json.loads(response.data)['devices'][0]['icon'] == "📡"
+    
     def test_search_missing_parameters(self, client):
         """Test search endpoint without required parameters"""
         response = client.get('/api/search')
@@ -302,6 +2089,35 @@ class TestAPIEndpoints:
         assert 'search_area' in data
         assert data['status'] == 'success'
     
+    def test_stats_merge_tile_summaries(self, client, monkeypatch):
+        """Test stats merged from tiles match the devices inside the area"""
+        def fake_tile(zoom, x, y):
+            tile = TileMath.tile_bounds(zoom, x, y)
+            return DeviceBatch.from_devices([
+                Device(lat=tile['latrange1'] + (tile['latrange2'] - tile['latrange1']) * i / 10,
+                       lon=tile['longrange1'] + (tile['longrange2'] - tile['longrange1']) * i / 10,
+                       device_type="router", timestamp=None, vendor="Cisco", signal=-40 - i)
+                for i in range(10)
+            ])
+        
+        for name in ('_search_networks_tile', '_search_bluetooth_tile'):
+            monkeypatch.setattr(app_module.wigle_api, name, fake_tile)
+        monkeypatch.setattr(app_module.opencellid_api, '_search_towers_tile', lambda *args: DeviceBatch())
+        monkeypatch.setattr(app_module.tile_fetcher, 'index', SpatialIndex())
+        
+        response = client.get('/api/stats?lat=51.505&lon=-0.09&radius=0.05')
+        data = json.loads(response.data)
+        
+        bounds = CoordinateValidator.calculate_bounds(51.505, -0.09, 0.05)
+        tiles = TileMath.tiles_for_bounds(bounds, Config.TILE_ZOOM)
+        inside = TileMath.clip(DeviceBatch.concat(fake_tile(Config.TILE_ZOOM, x, y) for x, y in tiles), bounds)
+        signals = sorted(inside.column('signal'))
+        
+        assert data['total_devices'] == 2 * len(inside)
+        assert data['top_vendors'] == {'Cisco': 2 * len(inside)}
+        assert data['signal_percentiles']['p50'] == signals[(len(signals) - 1) // 2]
+        assert data['partial'] is False
+    
     def test_towers_endpoint(self, client):
         """Test cell towers endpoint"""
         response = client.get('/api/geo/towers?lat=51.505&lon=-0.09')